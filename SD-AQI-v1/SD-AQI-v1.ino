@@ -10,6 +10,18 @@
 // Set to 0 to keep human-readable debug prints as well.
 #define JSON_ONLY 1
 
+// When BINARY_RECORDS is 1 each measurement is sent as a 40-byte binary
+// record instead of the ~330-byte JSON object (layout: sensor_record.py,
+// schema 1), so the 9600-baud XBee link spends far less airtime per
+// reading. Gateways without the binary decoder only understand JSON, so the
+// default stays 0.
+#define BINARY_RECORDS 0
+
+#define RECORD_MAGIC0 0xA5
+#define RECORD_MAGIC1 0x5A
+#define RECORD_SCHEMA 1
+#define RECORD_SIZE 40
+
 #if ENABLE_XBEE
 #include <SoftwareSerial.h>
 #endif
@@ -270,6 +282,86 @@ void printAirQualityReadings(float lpg, float co, float smoke, float co_mq7, flo
 #endif
 }
 
+// IEEE 754 binary16 bits of f, rounded to nearest with ties to even (the
+// rounding of Python's struct 'e'). Out-of-range values saturate to +-65504
+// (like sensor_record.encode); NaN stays NaN and is read as a missing value
+// by the gateway.
+uint16_t floatToHalf(float f) {
+  uint32_t x;
+  memcpy(&x, &f, sizeof(x));
+  uint16_t sign = (x >> 16) & 0x8000;
+  uint16_t rawExp = (x >> 23) & 0xFF;
+  int16_t exp = (int16_t)rawExp - 127 + 15;
+  uint32_t mant = x & 0x7FFFFFUL;
+  if (rawExp == 0xFF) {
+    return mant ? 0x7E00 : (sign | 0x7BFF);
+  }
+  if (exp >= 31) {
+    return sign | 0x7BFF;
+  }
+  uint8_t shift = 13;
+  if (exp <= 0) {
+    // subnormal half (or zero)
+    if (exp < -10) {
+      return sign;
+    }
+    mant |= 0x800000UL;
+    shift = 14 - exp;
+    exp = 0;
+  }
+  uint16_t h = sign | ((uint16_t)exp << 10) | (uint16_t)(mant >> shift);
+  uint32_t rest = mant & ((1UL << shift) - 1);
+  uint32_t half = 1UL << (shift - 1);
+  if (rest > half || (rest == half && (h & 1))) {
+    h++;  // a carry into the exponent is still the correctly rounded value
+  }
+  if ((h & 0x7FFF) > 0x7BFF) {
+    h = sign | 0x7BFF;
+  }
+  return h;
+}
+
+// CRC-16/CCITT-FALSE (poly 0x1021, init 0xFFFF), binascii.crc_hqx(data, 0xFFFF) on the gateway
+uint16_t crc16Ccitt(const uint8_t *data, uint8_t len) {
+  uint16_t crc = 0xFFFF;
+  for (uint8_t i = 0; i < len; i++) {
+    crc ^= (uint16_t)data[i] << 8;
+    for (uint8_t b = 0; b < 8; b++) {
+      crc = (crc & 0x8000) ? (crc << 1) ^ 0x1021 : crc << 1;
+    }
+  }
+  return crc;
+}
+
+uint8_t recordSeq = 0;
+
+// Send one schema 1 record: magic, schema id, sequence number, the 15
+// readings as float16, SD-AQI as float32, CRC. All little-endian.
+void sendBinaryRecord(const float *readings, float sdAqi) {
+  uint8_t rec[RECORD_SIZE];
+  uint8_t pos = 0;
+  rec[pos++] = RECORD_MAGIC0;
+  rec[pos++] = RECORD_MAGIC1;
+  rec[pos++] = RECORD_SCHEMA;
+  rec[pos++] = recordSeq++;
+  for (uint8_t i = 0; i < 15; i++) {
+    uint16_t h = floatToHalf(readings[i]);
+    rec[pos++] = h & 0xFF;
+    rec[pos++] = h >> 8;
+  }
+  // AVR floats are little-endian binary32 already
+  memcpy(rec + pos, &sdAqi, sizeof(sdAqi));
+  pos += sizeof(sdAqi);
+  uint16_t crc = crc16Ccitt(rec + 2, pos - 2);
+  rec[pos++] = crc & 0xFF;
+  rec[pos++] = crc >> 8;
+
+  Serial.write(rec, pos);
+#if ENABLE_XBEE
+  XBee.write(rec, pos);
+#endif
+}
+
 void setup() {
   Serial.begin(9600);
   // XBee.begin(9600); // Commented out XBee communication
@@ -548,6 +640,11 @@ void loop() {
   #endif
   #endif
 
+#if BINARY_RECORDS
+    const float readings[15] = {lpg, co, smoke, co_mq7, ch4, co_mq9, co2, nh3, nox, alcohol, benzene, h2, air,
+                                temperature, humidity};
+    sendBinaryRecord(readings, SD_AQI);
+#else
     // Build a JSON object with all values and send over Serial and XBee
     String json = "{";
     json += "\"LPG\":" + String(lpg, 3) + ",";
@@ -572,6 +669,7 @@ void loop() {
     Serial.println(json);
 #if ENABLE_XBEE
     XBee.println(json);
+#endif
 #endif
 
   } else {
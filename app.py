@@ -1,25 +1,46 @@
 import time
 import threading
+import queue
 import os
 from datetime import datetime, timezone, timedelta
 from uuid import uuid4
 import traceback
+import math
+import re
+import hashlib
+from functools import wraps
 
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, Response, request, jsonify, render_template, stream_with_context
 import json
+import csv
+import io
+import sqlite3
 from flask_sqlalchemy import SQLAlchemy
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
+from sqlalchemy import Integer, String, cast, event, func, select, text, tuple_, type_coerce
+from sqlalchemy.engine import Engine
 from sqlalchemy.exc import OperationalError
+from werkzeug.http import is_resource_modified
+
+try:
+    import orjson  # optional: faster encoder for large read responses
+except ImportError:
+    orjson = None
 
 import xbreemw
+import rollups
+import latest_state
+import sdaqi
+import ingest_queue
+import payloads
 
 app = Flask(__name__)
 
 # Database configuration
 # Use the `instance` folder DB to avoid updating the wrong file during migrations/tests
 # Ensure an absolute path so Flask/SQLAlchemy do not resolve relative paths inconsistently
-DB_FILE = os.path.abspath(os.path.join(os.path.dirname(__file__), 'instance', 'iot_data.db'))
+DB_FILE = os.path.abspath(os.environ.get('DB_FILE') or os.path.join(os.path.dirname(__file__), 'instance', 'iot_data.db'))
 try:
     # Ensure the instance directory exists so SQLite can create/open the DB file
     os.makedirs(os.path.dirname(DB_FILE), exist_ok=True)
@@ -31,21 +52,175 @@ app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
 db = SQLAlchemy(app)
 
+# SQLite tuning for several gunicorn workers sharing one file. WAL lets the
+# dashboard reads run alongside the ingest writer instead of failing with
+# "database is locked"; synchronous=NORMAL is durable across app crashes in WAL
+# mode and only risks the last commits on power loss.
+SQLITE_JOURNAL_MODE = os.environ.get('SQLITE_JOURNAL_MODE', 'WAL')
+SQLITE_SYNCHRONOUS = os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL')
+SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', '5000'))
+SQLITE_CACHE_SIZE_KB = int(os.environ.get('SQLITE_CACHE_SIZE_KB', '16384'))
+SQLITE_MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024)))
+# Checkpoint policy: the committing writer runs a PASSIVE checkpoint every
+# SQLITE_WAL_AUTOCHECKPOINT pages and a background thread runs one every
+# SQLITE_CHECKPOINT_INTERVAL seconds. PASSIVE never waits for readers, so
+# readers never block the writer; journal_size_limit trims the WAL afterwards.
+SQLITE_WAL_AUTOCHECKPOINT = int(os.environ.get('SQLITE_WAL_AUTOCHECKPOINT', '1000'))
+SQLITE_JOURNAL_SIZE_LIMIT = int(os.environ.get('SQLITE_JOURNAL_SIZE_LIMIT', str(64 * 1024 * 1024)))
+SQLITE_CHECKPOINT_INTERVAL = float(os.environ.get('SQLITE_CHECKPOINT_INTERVAL', '30'))
+# The queue-mode writer process (ingest_writer.py sets INGEST_WRITER=1) deletes
+# queue segments once they are applied, so while the hand-offs are fsynced
+# (INGEST_QUEUE_FSYNC, the default) its commits must be as durable as they are:
+# NORMAL is not, in WAL mode.
+INGEST_WRITER_PROCESS = os.environ.get('INGEST_WRITER') == '1'
+if INGEST_WRITER_PROCESS and os.environ.get('INGEST_QUEUE_FSYNC', '1') == '1':
+    SQLITE_SYNCHRONOUS = 'FULL'
+
+
+@event.listens_for(Engine, "connect")
+def _configure_sqlite_connection(dbapi_connection, connection_record):
+    """Apply the SQLITE_* pragmas to every new pooled SQLite connection."""
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cur = dbapi_connection.cursor()
+    try:
+        # busy_timeout first so the journal_mode switch itself waits on a busy DB
+        cur.execute(f"PRAGMA busy_timeout = {SQLITE_BUSY_TIMEOUT_MS}")
+        cur.execute(f"PRAGMA journal_mode = {SQLITE_JOURNAL_MODE}")
+        cur.execute(f"PRAGMA synchronous = {SQLITE_SYNCHRONOUS}")
+        cur.execute(f"PRAGMA cache_size = -{SQLITE_CACHE_SIZE_KB}")
+        cur.execute(f"PRAGMA mmap_size = {SQLITE_MMAP_SIZE}")
+        cur.execute(f"PRAGMA wal_autocheckpoint = {SQLITE_WAL_AUTOCHECKPOINT}")
+        cur.execute(f"PRAGMA journal_size_limit = {SQLITE_JOURNAL_SIZE_LIMIT}")
+    finally:
+        cur.close()
+
 # Initialize rate limiter
 limiter = Limiter(key_func=get_remote_address)
 limiter.init_app(app)
 
-# Database model for general sensor data
+# Seconds between keep-alive comments on /api/stream. Each keep-alive also
+# runs a cheap primary-key catch-up query so rows written by other worker
+# processes (which this process' broadcaster never sees) still reach clients.
+STREAM_HEARTBEAT_SECONDS = float(os.environ.get('STREAM_HEARTBEAT_SECONDS', '15'))
+# Stream catch-up reads the reading table in keyset pages of this many rows; a
+# client further behind than STREAM_CATCH_UP_MAX_ROWS ids is sent a 'reset'
+STREAM_CATCH_UP_PAGE = int(os.environ.get('STREAM_CATCH_UP_PAGE', '500'))
+STREAM_CATCH_UP_MAX_ROWS = int(os.environ.get('STREAM_CATCH_UP_MAX_ROWS', '10000'))
+
+
+class ReadingBroadcaster:
+    """In-process fan-out of newly stored readings to /api/stream subscribers.
+
+    Each subscriber gets its own bounded queue. Publishing never blocks the
+    ingest path: if a subscriber falls behind and its queue is full the event
+    is dropped for that subscriber only, and the stream's gap detection
+    re-reads the missing rows from the database.
+    """
+
+    def __init__(self, maxsize=256):
+        self._maxsize = maxsize
+        self._lock = threading.Lock()
+        self._subscribers = set()
+
+    def subscribe(self):
+        q = queue.Queue(maxsize=self._maxsize)
+        with self._lock:
+            self._subscribers.add(q)
+        return q
+
+    def unsubscribe(self, q):
+        with self._lock:
+            self._subscribers.discard(q)
+
+    def publish(self, event, row_id, payload):
+        """Queue ``payload`` for every subscriber.
+
+        ``payload`` may be None for rows the views filter out; subscribers
+        still use ``row_id`` to keep their cursor contiguous.
+        """
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for q in subscribers:
+            try:
+                q.put_nowait((event, row_id, payload))
+            except queue.Full:
+                pass
+
+    def notify(self, event):
+        """Tell subscribers that ``event`` rows were stored without payloads.
+
+        Used by bulk inserts: subscribers respond with a catch-up query.
+        """
+        self.publish(event, None, None)
+
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._subscribers)
+
+
+broadcaster = ReadingBroadcaster()
+
+# Timestamps are stored as text in the format SQLAlchemy renders DateTime
+# parameters in, so stored values and bounds compare correctly as strings
+DB_TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+
+
+# One row per received frame; has_pm / has_mq say which sensor families it
+# carried (the other family's columns stay NULL). Written by the ingest paths.
+class Reading(db.Model):
+    __tablename__ = 'reading'
+    __table_args__ = (
+        # (timestamp, rowid) order of each family behind the sensor_data /
+        # mq_sensor_data views
+        db.Index('ix_reading_pm_timestamp', 'timestamp', sqlite_where=db.text('has_pm = 1')),
+        db.Index('ix_reading_mq_timestamp', 'timestamp', sqlite_where=db.text('has_mq = 1')),
+        # the same per station, for ?device_id= reads
+        db.Index('ix_reading_pm_device_timestamp', 'device_id', 'timestamp', sqlite_where=db.text('has_pm = 1')),
+        db.Index('ix_reading_mq_device_timestamp', 'device_id', 'timestamp', sqlite_where=db.text('has_mq = 1')),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    # stamped in Python rather than by CURRENT_TIMESTAMP, so every row is stored
+    # in DB_TIMESTAMP_FORMAT like the bound parameters it is compared with
+    timestamp = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc).replace(tzinfo=None), index=True)
+    uuid = db.Column(db.String(36), nullable=True, index=True)
+    device_id = db.Column(db.String(64), nullable=True)  # reporting station; NULL for older frames
+    has_pm = db.Column(db.Boolean, nullable=False, default=False)
+    has_mq = db.Column(db.Boolean, nullable=False, default=False)
+    dust = db.Column(db.Float, nullable=True)
+    pm2_5 = db.Column(db.Float, nullable=True)
+    pm10 = db.Column(db.Float, nullable=True)
+    lpg = db.Column(db.Float, nullable=True)
+    co = db.Column(db.Float, nullable=True)
+    smoke = db.Column(db.Float, nullable=True)
+    co_mq7 = db.Column(db.Float, nullable=True)
+    ch4 = db.Column(db.Float, nullable=True)
+    co_mq9 = db.Column(db.Float, nullable=True)
+    co2 = db.Column(db.Float, nullable=True)
+    nh3 = db.Column(db.Float, nullable=True)
+    nox = db.Column(db.Float, nullable=True)
+    alcohol = db.Column(db.Float, nullable=True)
+    benzene = db.Column(db.Float, nullable=True)
+    h2 = db.Column(db.Float, nullable=True)
+    air = db.Column(db.Float, nullable=True)
+    temperature = db.Column(db.Float, nullable=True)
+    humidity = db.Column(db.Float, nullable=True)
+    sd_aqi = db.Column(db.Float, nullable=True)
+    sd_aqi_level = db.Column(db.String(64), nullable=True)
+
+
+# PM readings: read-only view over reading (has_pm = 1)
 class SensorData(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     dust = db.Column(db.Float, nullable=True)
     pm2_5 = db.Column(db.Float, nullable=True)
     pm10 = db.Column(db.Float, nullable=True)
-    timestamp = db.Column(db.DateTime, default=db.func.current_timestamp())
+    timestamp = db.Column(db.DateTime)
     uuid = db.Column(db.String(36), nullable=True)
-    raw_payload = db.Column(db.Text, nullable=True)
+    device_id = db.Column(db.String(64), nullable=True)
 
-# Database model for MQ sensor data
+# MQ readings: read-only view over reading (has_mq = 1)
 class MQSensorData(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     lpg = db.Column(db.Float, nullable=True)
@@ -63,72 +238,108 @@ class MQSensorData(db.Model):
     air = db.Column(db.Float, nullable=True)
     temperature = db.Column(db.Float, nullable=True)
     humidity = db.Column(db.Float, nullable=True)
-    timestamp = db.Column(db.DateTime, default=db.func.current_timestamp())
+    timestamp = db.Column(db.DateTime)
     uuid = db.Column(db.String(36), nullable=True)
     sd_aqi = db.Column(db.Float, nullable=True)
     sd_aqi_level = db.Column(db.String(64), nullable=True)
-    raw_payload = db.Column(db.Text, nullable=True)
+    device_id = db.Column(db.String(64), nullable=True)
 
 
-# Run DB migration script (best-effort) before creating tables so the
-# on-disk SQLite schema matches the SQLAlchemy models. Only run the
-# migration in the reloader child (WERKZEUG_RUN_MAIN='true') or when
-# not running in debug mode to avoid doing it twice and creating
-# repeated backups during watchdog restarts.
-try:
-    do_migrate = (not app.debug) or os.environ.get("WERKZEUG_RUN_MAIN") == "true"
-    if do_migrate:
-        import subprocess, sys
-        migrate_script = os.path.join(os.path.dirname(__file__), 'scripts', 'migrate_db.py')
-        marker = os.path.join(os.path.dirname(__file__), '.migration_done')
-
-        # If we've already run migration in this workspace, do a quick verification
-        # that the expected columns exist. If they don't, run migration again.
-        def _needs_migration(marker_path, db_path):
-            # If no marker, definitely need migration
-            if not os.path.exists(marker_path):
-                return True
-            # marker exists — verify DB actually has the expected columns
-            try:
-                import sqlite3
-                conn = sqlite3.connect(db_path)
-                cur = conn.cursor()
-                def has_col(tbl, col):
-                    cur.execute(f"PRAGMA table_info('{tbl}')")
-                    return any(r[1] == col for r in cur.fetchall())
-                ok = (
-                    has_col('sensor_data', 'uuid') and has_col('sensor_data', 'raw_payload')
-                    and has_col('mq_sensor_data', 'uuid') and has_col('mq_sensor_data', 'sd_aqi')
-                    and has_col('mq_sensor_data', 'sd_aqi_level') and has_col('mq_sensor_data', 'raw_payload')
-                )
-                try:
-                    cur.close()
-                    conn.close()
-                except Exception:
-                    pass
-                return not ok
-            except Exception:
-                # If we can't verify, be conservative and run migration
-                return True
+class RawPayload(db.Model):
+    """Original JSON of a reading, compressed with payloads.DICTIONARIES[dict_id]."""
+    __tablename__ = 'raw_payload'
 
-        db_path = DB_FILE
-        if _needs_migration(marker, db_path):
-            if os.path.exists(migrate_script):
-                subprocess.check_call([sys.executable, migrate_script, '--db', db_path, '--yes'])
-                try:
-                    # create or update the marker file to avoid repeating the migration
-                    with open(marker, 'w') as f:
-                        f.write('migrated\n')
-                except Exception:
-                    pass
-        else:
-            print('Migration marker present; skipping migration')
-    else:
-        # In the reloader parent process, skip migration to avoid duplicate backups/logs
-        print('Skipping DB migration in reloader parent process')
+    reading_id = db.Column(db.Integer, primary_key=True, autoincrement=False)  # reading.id
+    dict_id = db.Column(db.Integer, nullable=False)
+    payload = db.Column(db.LargeBinary, nullable=False)
+
+
+class ReadingRollup(db.Model):
+    """Per-field minute/hour/day aggregates of both reading tables (see rollups.py)."""
+    __tablename__ = 'reading_rollup'
+    __table_args__ = (
+        db.Index('ux_reading_rollup_key', 'source', 'resolution', 'field', 'bucket', unique=True),
+        # used by the retention worker to expire whole resolutions
+        db.Index('ix_reading_rollup_resolution_bucket', 'resolution', 'bucket'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    source = db.Column(db.String(8), nullable=False)       # 'mq' or 'pm'
+    resolution = db.Column(db.String(8), nullable=False)   # key of rollups.RESOLUTIONS
+    field = db.Column(db.String(32), nullable=False)
+    bucket = db.Column(db.Integer, nullable=False)          # bucket start, epoch seconds
+    count = db.Column(db.Integer, nullable=False)
+    total = db.Column(db.Float, nullable=False)
+    minimum = db.Column(db.Float, nullable=True)
+    maximum = db.Column(db.Float, nullable=True)
+    latest = db.Column(db.Float, nullable=True)
+    latest_ts = db.Column(db.Float, nullable=True)
+
+
+class IngestOffset(db.Model):
+    """How far the ingest writer has applied each queue segment (INGEST_MODE=queue)."""
+    __tablename__ = 'ingest_offset'
+
+    segment = db.Column(db.String(64), primary_key=True)
+    position = db.Column(db.Integer, nullable=False)
+
+
+# Schema migrations live in scripts/migrate_db.py and are versioned with
+# PRAGMA user_version. On import we only compare that number with
+# SCHEMA_VERSION (one PRAGMA read); migrate() runs in-process, under a file
+# lock so a single gunicorn worker does it while the others wait, and only
+# when the database is behind.
+MIGRATE_SCRIPT = os.path.join(os.path.dirname(__file__), 'scripts', 'migrate_db.py')
+MIGRATE_LOCK_FILE = os.path.join(os.path.dirname(DB_FILE), 'migrate.lock')
+
+
+def _load_migrate_module():
+    import importlib.util
+    spec = importlib.util.spec_from_file_location('migrate_db', MIGRATE_SCRIPT)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def _schema_version(db_path):
+    if not os.path.exists(db_path):
+        return 0
+    conn = sqlite3.connect(db_path, timeout=SQLITE_BUSY_TIMEOUT_MS / 1000.0)
+    try:
+        return conn.execute("PRAGMA user_version").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def _ensure_schema(db_path=DB_FILE, force=False):
+    """Run the migration if the DB is older than SCHEMA_VERSION; returns True if it ran."""
+    migrate_db = _load_migrate_module()
+    if not force and _schema_version(db_path) >= migrate_db.SCHEMA_VERSION:
+        return False
+    lock = None
+    try:
+        import fcntl
+        lock = open(MIGRATE_LOCK_FILE, 'a')
+        fcntl.flock(lock, fcntl.LOCK_EX)
+    except ImportError:
+        pass
+    try:
+        # another worker may have migrated while we waited for the lock
+        if not force and _schema_version(db_path) >= migrate_db.SCHEMA_VERSION:
+            return False
+        migrate_db.migrate(db_path, auto_yes=True)
+        return True
+    finally:
+        if lock is not None:
+            lock.close()
+
+
+_schema_migrated = False
+try:
+    _schema_migrated = _ensure_schema()
 except Exception:
-    # Non-fatal: log and continue; create_all() will still try to create missing tables
-    print('Migration script failed or not run:')
+    # Non-fatal: log and continue; the read endpoints retry the migration on OperationalError
+    print('Migration failed:')
     print(traceback.format_exc())
 
 # Create the database tables
@@ -149,79 +360,11 @@ with app.app_context():
         pass
         print(traceback.format_exc())
 
-    # Ensure the uuid, sd_aqi and sd_aqi_level columns exist in existing SQLite tables; if not, add them.
-    # Use a raw sqlite connection for robustness and commit immediately.
-    try:
-        engine = db.engine
-        # table_names() is deprecated in newer SQLAlchemy; use inspector when available
-        from sqlalchemy import inspect
-        inspector = inspect(engine)
-        tables = inspector.get_table_names()
-
-        # open a raw connection for PRAGMA/ALTER statements
-        conn = engine.raw_connection()
-        cur = conn.cursor()
-
-        def table_columns(table_name):
-            cur.execute(f"PRAGMA table_info('{table_name}')")
-            return [row[1] for row in cur.fetchall()]
-
-        if 'sensor_data' in tables:
-            cols = table_columns('sensor_data')
-            if 'uuid' not in cols:
-                try:
-                    cur.execute("ALTER TABLE sensor_data ADD COLUMN uuid TEXT")
-                    conn.commit()
-                except Exception:
-                    conn.rollback()
-            if 'raw_payload' not in cols:
-                try:
-                    cur.execute("ALTER TABLE sensor_data ADD COLUMN raw_payload TEXT")
-                    conn.commit()
-                except Exception:
-                    conn.rollback()
-
-        if 'mq_sensor_data' in tables:
-            cols = table_columns('mq_sensor_data')
-            if 'uuid' not in cols:
-                try:
-                    cur.execute("ALTER TABLE mq_sensor_data ADD COLUMN uuid TEXT")
-                    conn.commit()
-                except Exception:
-                    conn.rollback()
-                # refresh cols
-                cols = table_columns('mq_sensor_data')
-            if 'sd_aqi' not in cols:
-                try:
-                    cur.execute("ALTER TABLE mq_sensor_data ADD COLUMN sd_aqi REAL")
-                    conn.commit()
-                except Exception:
-                    conn.rollback()
-            if 'sd_aqi_level' not in cols:
-                try:
-                    cur.execute("ALTER TABLE mq_sensor_data ADD COLUMN sd_aqi_level TEXT")
-                    conn.commit()
-                except Exception:
-                    conn.rollback()
-            if 'raw_payload' not in cols:
-                try:
-                    cur.execute("ALTER TABLE mq_sensor_data ADD COLUMN raw_payload TEXT")
-                    conn.commit()
-                except Exception:
-                    conn.rollback()
-
-        try:
-            cur.close()
-            conn.close()
-        except Exception:
-            pass
-    except Exception as e:
-        # Non-fatal: if this fails (e.g., non-sqlite engine), log and continue; new DBs will include the columns.
-        print('Warning ensuring schema columns:')
-        print(traceback.format_exc())
     # Determine which columns actually exist in the tables so we can avoid referencing missing columns
     SENSOR_COLUMNS = set()
     MQ_COLUMNS = set()
+    ROLLUP_COLUMNS = set()
+    RAW_PAYLOAD_COLUMNS = set()
     try:
         engine = db.engine
         conn = engine.raw_connection()
@@ -234,6 +377,8 @@ with app.app_context():
                 return set()
         SENSOR_COLUMNS = cols('sensor_data')
         MQ_COLUMNS = cols('mq_sensor_data')
+        ROLLUP_COLUMNS = cols('reading_rollup')
+        RAW_PAYLOAD_COLUMNS = cols('raw_payload')
         try:
             cur.close()
             conn.close()
@@ -242,58 +387,707 @@ with app.app_context():
     except Exception:
         SENSOR_COLUMNS = set()
         MQ_COLUMNS = set()
+        ROLLUP_COLUMNS = set()
+        RAW_PAYLOAD_COLUMNS = set()
+
+
+def _parse_to_utc(val):
+    """Parse various timestamp formats into an aware UTC datetime (or None)."""
+    # numeric epoch (seconds or milliseconds)
+    if isinstance(val, (int, float)):
+        v = float(val)
+        # heuristic: values > 1e12 are milliseconds
+        if v > 1e12:
+            return datetime.fromtimestamp(v / 1000.0, tz=timezone.utc)
+        else:
+            return datetime.fromtimestamp(v, tz=timezone.utc)
 
-    # Backfill uuid for existing rows where it's NULL so frontend can rely on stable ids
+    s = str(val)
+    # strip whitespace
+    s = s.strip()
+    # If it ends with Z (UTC) remove it and parse, then set tzinfo=UTC
     try:
-        engine = db.engine
-        from sqlalchemy import inspect
-        inspector = inspect(engine)
-        tables = inspector.get_table_names()
+        if s.endswith('Z'):
+            no_z = s[:-1]
+            dt = datetime.fromisoformat(no_z)
+            if dt.tzinfo is None:
+                return dt.replace(tzinfo=timezone.utc)
+            return dt.astimezone(timezone.utc)
+        else:
+            dt = datetime.fromisoformat(s)
+            if dt.tzinfo is None:
+                return dt.replace(tzinfo=timezone.utc)
+            return dt.astimezone(timezone.utc)
+    except Exception:
+        # best-effort: try parsing common formats
+        try:
+            # fallback to parsing with space-separated date/time
+            dt = datetime.strptime(s, '%Y-%m-%d %H:%M:%S')
+            return dt.replace(tzinfo=timezone.utc)
+        except Exception:
+            return None
+
+
+def _pm_record_to_dict(r):
+    """Serialize a SensorData row the way the PM views expect it."""
+    return {
+        "id": r.id,
+        "timestamp": r.timestamp.isoformat() if r.timestamp else None,
+        "uuid": getattr(r, 'uuid', None) if getattr(r, 'uuid', None) is not None else None,
+        "device_id": r.device_id,
+        "dust": r.dust if r.dust is not None else 0,
+        "pm2_5": r.pm2_5 if r.pm2_5 is not None else 0,
+        "pm10": r.pm10 if r.pm10 is not None else 0
+    }
+
+
+def _mq_record_to_dict(r):
+    """Serialize an MQSensorData row the way the MQ views expect it."""
+    return {
+        "id": r.id,
+        "uuid": r.uuid if r.uuid is not None else None,
+        "device_id": r.device_id,
+        "sd_aqi": getattr(r, 'sd_aqi', None),
+        "sd_aqi_level": getattr(r, 'sd_aqi_level', None),
+        "timestamp": r.timestamp.isoformat() if r.timestamp else None,
+        "temperature": r.temperature,
+        "humidity": r.humidity,
+        "LPG": r.lpg,
+        "CO": r.co,
+        "Smoke": r.smoke,
+        "CO_MQ7": r.co_mq7,
+        "CH4": r.ch4,
+        "CO_MQ9": r.co_mq9,
+        "CO2": r.co2,
+        "NH3": r.nh3,
+        "NOx": r.nox,
+        "Alcohol": r.alcohol,
+        "Benzene": r.benzene,
+        "H2": r.h2,
+        "Air": r.air
+    }
+
+
+# API field name -> column, in response order; ``?fields=`` selects from these
+PM_API_FIELDS = {
+    "id": SensorData.id,
+    "timestamp": SensorData.timestamp,
+    "uuid": SensorData.uuid,
+    "device_id": SensorData.device_id,
+    "dust": SensorData.dust,
+    "pm2_5": SensorData.pm2_5,
+    "pm10": SensorData.pm10,
+}
+# PM values are reported as 0 rather than null (see _pm_record_to_dict)
+PM_ZERO_FILLED = ('dust', 'pm2_5', 'pm10')
+
+MQ_API_FIELDS = {
+    "id": MQSensorData.id,
+    "uuid": MQSensorData.uuid,
+    "device_id": MQSensorData.device_id,
+    "sd_aqi": MQSensorData.sd_aqi,
+    "sd_aqi_level": MQSensorData.sd_aqi_level,
+    "timestamp": MQSensorData.timestamp,
+    "temperature": MQSensorData.temperature,
+    "humidity": MQSensorData.humidity,
+    "LPG": MQSensorData.lpg,
+    "CO": MQSensorData.co,
+    "Smoke": MQSensorData.smoke,
+    "CO_MQ7": MQSensorData.co_mq7,
+    "CH4": MQSensorData.ch4,
+    "CO_MQ9": MQSensorData.co_mq9,
+    "CO2": MQSensorData.co2,
+    "NH3": MQSensorData.nh3,
+    "NOx": MQSensorData.nox,
+    "Alcohol": MQSensorData.alcohol,
+    "Benzene": MQSensorData.benzene,
+    "H2": MQSensorData.h2,
+    "Air": MQSensorData.air,
+}
+
+
+def _parse_projection(api_fields):
+    """Field names selected by ``?fields=a,b`` (all fields if absent).
+
+    ``id`` and ``timestamp`` are always included: clients order, merge and
+    page by them. Raises ValueError for unknown names.
+    """
+    raw = request.args.get('fields')
+    if not raw:
+        return list(api_fields)
+    wanted = {f.strip() for f in raw.split(',') if f.strip()}
+    unknown = wanted - set(api_fields)
+    if unknown:
+        raise ValueError("Unknown field(s): " + ", ".join(sorted(unknown)))
+    wanted |= {'id', 'timestamp'}
+    return [f for f in api_fields if f in wanted]
+
+
+def _projection_columns(api_fields, names, columnar=False):
+    """Labelled columns for ``names``; columnar reads take timestamps as stored text."""
+    return [(type_coerce(api_fields[n], String) if columnar and n == 'timestamp' else api_fields[n]).label(n)
+            for n in names]
+
+
+def _wants_columnar():
+    """True for ``?format=columnar``; raises ValueError for unknown formats."""
+    fmt = request.args.get('format', 'rows')
+    if fmt not in ('rows', 'columnar'):
+        raise ValueError("Invalid 'format' (expected rows or columnar)")
+    return fmt == 'columnar'
+
+
+def _db_text_to_iso(text_ts):
+    """``datetime.isoformat()`` of a stored timestamp: 'T' separated, no zero fraction."""
+    text_ts = text_ts.replace(' ', 'T', 1)
+    return text_ts[:-7] if text_ts.endswith('.000000') else text_ts
+
+
+def _rows_to_columns(names, rows, zero_filled=()):
+    """Transpose result tuples into ``{name: [values, ...]}``.
+
+    Expects timestamps as stored text (see _projection_columns) and renders
+    them like ``datetime.isoformat()`` without building datetime objects.
+    """
+    if not rows:
+        return {name: [] for name in names}
+    columns = {name: list(values) for name, values in zip(names, zip(*rows))}
+    if 'timestamp' in columns:
+        columns['timestamp'] = [_db_text_to_iso(t) if t else None for t in columns['timestamp']]
+    for name in zero_filled:
+        if name in columns:
+            columns[name] = [0 if v is None else v for v in columns[name]]
+    return columns
+
+
+def _json_response(payload, status=200):
+    """jsonify() for large read responses, using orjson when it is installed."""
+    if orjson is None:
+        return jsonify(payload), status
+    return Response(orjson.dumps(payload), status=status, mimetype='application/json')
+
+
+def _projected_row_to_dict(row, names, zero_filled=()):
+    """Serialize a row selected with ``<column>.label(<api name>)`` columns."""
+    out = {}
+    for name in names:
+        value = getattr(row, name)
+        if name == 'timestamp':
+            value = value.isoformat() if value else None
+        elif value is None and name in zero_filled:
+            value = 0
+        out[name] = value
+    return out
+
+
+MQ_REQUIRED_FIELDS = (
+    'lpg', 'co', 'smoke', 'co_mq7', 'ch4', 'co_mq9', 'co2', 'nh3', 'nox',
+    'alcohol', 'benzene', 'h2', 'air', 'temperature', 'humidity'
+)
+
+
+def _mq_record_is_complete(r):
+    """Mirror of the /api/mq-data filter: every gas/environment field present."""
+    return all(getattr(r, f, None) is not None for f in MQ_REQUIRED_FIELDS)
+
+
+def _publish_new_reading(r):
+    """Push a freshly committed reading to live-stream subscribers (best-effort).
+
+    Both events are published for every reading, with no row for a family
+    the frame did not carry, so each topic sees consecutive ids.
+    """
+    if broadcaster.subscriber_count() == 0:
+        return
+    try:
+        broadcaster.publish('pm', r.id, _pm_record_to_dict(r) if r.has_pm else None)
+        broadcaster.publish('mq', r.id,
+                            _mq_record_to_dict(r) if r.has_mq and _mq_record_is_complete(r) else None)
+    except Exception:
+        app.logger.warning("Failed to publish reading to stream subscribers", exc_info=True)
+
+
+# Newest PM/MQ reading shared by all workers (see latest_state.py); served by
+# /api/evaluation-data without a database query.
+LATEST_STATE_FILE = os.environ.get(
+    'LATEST_STATE_FILE', os.path.join(os.path.dirname(DB_FILE), 'latest_state.json'))
+latest = latest_state.LatestState(LATEST_STATE_FILE)
+if _schema_migrated:
+    # a migration may move or renumber rows (e.g. into the reading table)
+    latest.bump(('pm', 'mq'), reset_counts=True)
+LATEST_FIELDS = {
+    'pm': ('pm2_5', 'pm10'),
+    'mq': ('temperature', 'humidity', 'lpg', 'co', 'sd_aqi', 'sd_aqi_level'),
+}
+
+
+def _update_latest_state(rows):
+    """Offer the newest of freshly committed reading rows to the latest-state snapshot.
+
+    The newest row is picked overall and per station, and the row counts are
+    moved for both.
+    """
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    offered, devices, added = {}, {}, {}
+    for section, family in _split_families(rows).items():
+        newest = {}  # device id (None: all stations) -> (timestamp, row)
+        for kwargs in family:
+            # readings without a timestamp got the column default (current UTC time)
+            ts = kwargs.get('timestamp') or now
+            device_id = kwargs.get('device_id')
+            for key in ((None, device_id) if device_id else (None,)):
+                if key not in newest or ts >= newest[key][0]:
+                    newest[key] = (ts, kwargs)
+            if device_id:
+                key = latest_state.count_key(section, device_id)
+                added[key] = added.get(key, 0) + 1
+        added[section] = len(family)
+        for device_id, (ts, kwargs) in newest.items():
+            row = {f: kwargs.get(f) for f in LATEST_FIELDS[section]}
+            row['timestamp'] = ts
+            if device_id is None:
+                offered[section] = row
+            else:
+                devices.setdefault(device_id, {})[section] = row
+    try:
+        latest.offer(offered, added=added, devices=devices)
+    except Exception:
+        app.logger.warning("Failed to update the latest-state snapshot", exc_info=True)
+
+
+def _seed_latest_state(device_id=None):
+    """(Re)build the snapshot, or one station's entry in it, from the newest stored rows."""
+    offered = {}
+    for section, model in (('pm', SensorData), ('mq', MQSensorData)):
+        columns = [getattr(model, f) for f in LATEST_FIELDS[section]]
+        row = db.session.query(model.timestamp, *columns).filter(
+            *_device_filters(model, device_id)).order_by(model.timestamp.desc()).first()
+        if row is not None:
+            offered[section] = dict(row._mapping)
+    if device_id:
+        latest.offer({}, bump=False, devices={device_id: offered})
+    else:
+        latest.offer(offered, bump=False)
+
+
+def _request_device_id():
+    """The station selected with ``?device_id=`` (None: all stations)."""
+    return request.args.get('device_id') or None
+
 
-        if 'sensor_data' in tables:
-            conn = engine.raw_connection()
-            cur = conn.cursor()
+def _device_filters(model, device_id):
+    """Filters restricting ``model`` to one station's rows (none for all stations)."""
+    return (model.device_id == device_id,) if device_id else ()
+
+
+def _data_version(sections):
+    """(etag, last_modified) of the current request at the data version of ``sections``.
+
+    Both are None until the snapshot exists (i.e. before the first write).
+    """
+    _, state = latest.read()
+    epoch = state.get('epoch')
+    if not epoch:
+        return None, None
+    versions = state.get('versions') or {}
+    token = '%s|%s|%s' % (epoch, ','.join('%s=%s' % (s, versions.get(s, 0)) for s in sections),
+                          request.full_path)
+    modified = max((state.get('modified') or {}).get(s, 0) for s in sections)
+    last_modified = datetime.fromtimestamp(modified, timezone.utc) if modified else None
+    return hashlib.sha1(token.encode('utf-8')).hexdigest(), last_modified
+
+
+def _conditional_get(*sections):
+    """Answer GETs with 304 while no reading in ``sections`` was written or deleted.
+
+    The version is read before the view runs, so a write racing with the
+    query at worst makes the client fetch the same rows once more.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            etag, last_modified = _data_version(sections)
+            if etag is not None and not is_resource_modified(
+                    request.environ, etag=etag, last_modified=last_modified):
+                response = Response(status=304)
+            else:
+                response = app.make_response(view(*args, **kwargs))
+                if etag is None or response.status_code != 200:
+                    return response
+            response.set_etag(etag)
+            response.last_modified = last_modified
+            response.headers['Cache-Control'] = 'no-cache'
+            return response
+        return wrapper
+    return decorator
+
+
+# Upper bound on readings accepted by one /api/data/batch request
+MAX_BATCH_SIZE = int(os.environ.get('MAX_BATCH_SIZE', '1000'))
+
+# Ingest mode. 'direct': each POST writes to SQLite itself. 'queue': the web
+# workers only validate and append readings to a per-process queue segment
+# (see ingest_queue.py) and a single writer process (ingest_writer.py, started
+# by gunicorn.conf.py) applies them in group commits.
+INGEST_MODE = os.environ.get('INGEST_MODE', 'direct')
+INGEST_QUEUE_DIR = os.environ.get('INGEST_QUEUE_DIR', os.path.join(os.path.dirname(DB_FILE), 'ingest'))
+# fsync every hand-off before answering, so a queued reading survives a power
+# cut; with 0 it only survives a crash of the web worker until it is committed
+INGEST_QUEUE_FSYNC = os.environ.get('INGEST_QUEUE_FSYNC', '1') == '1'
+INGEST_SEGMENT_BYTES = int(os.environ.get('INGEST_SEGMENT_BYTES', str(8 * 1024 * 1024)))
+INGEST_WRITER_BATCH = int(os.environ.get('INGEST_WRITER_BATCH', '2000'))
+INGEST_WRITER_IDLE_SECONDS = float(os.environ.get('INGEST_WRITER_IDLE_SECONDS', '0.05'))
+# flock held by the one running writer; a second writer exits instead of
+# racing it over the same segments
+INGEST_WRITER_LOCK_FILE = os.path.join(os.path.dirname(DB_FILE), 'ingest_writer.lock')
+# Queued readings the writer cannot insert are appended here (NDJSON) so the
+# rest of the queue keeps moving
+INGEST_DEAD_LETTER_FILE = os.environ.get(
+    'INGEST_DEAD_LETTER_FILE', os.path.join(INGEST_QUEUE_DIR, 'dead_letter.ndjson'))
+# Rows committed by the writer process never reach this process's broadcaster,
+# so in queue mode /api/stream checks for them this often. A check only reads
+# the latest-state data version; the database is queried when it moved.
+STREAM_POLL_SECONDS = float(os.environ.get(
+    'STREAM_POLL_SECONDS', '1' if INGEST_MODE == 'queue' else str(STREAM_HEARTBEAT_SECONDS)))
+
+_ingest_writer_queue = ingest_queue.SegmentWriter(
+    INGEST_QUEUE_DIR, segment_bytes=INGEST_SEGMENT_BYTES, fsync=INGEST_QUEUE_FSYNC)
+
+
+def _enqueue_readings(rows, received_at, raw_items=None):
+    """Hand reading rows, and optionally their original frames, to the ingest writer."""
+    records = []
+    raw_items = raw_items if _raw_payloads_available() else None
+    for index, row in enumerate(rows):
+        row = dict(row)
+        # keep the receive time, not the time the writer gets to it
+        row['timestamp'] = (row['timestamp'] or received_at).isoformat()
+        record = {'row': row}
+        if raw_items:
+            record['raw'] = raw_items[index]
+        records.append(record)
+    return _ingest_writer_queue.put_many(records)
+
+
+def _queued_record_to_row(record):
+    if 'row' in record:
+        # records queued by an older version may lack newer columns
+        row = dict.fromkeys(READING_ROW_KEYS)
+        row.update(record['row'])
+    else:
+        # queued before the reading table: a (sensor, mq) pair of kwargs
+        pm, mq = record.get('pm') or {}, record.get('mq') or {}
+        row = dict.fromkeys(READING_ROW_KEYS)
+        row.update(pm, **mq)
+        row['has_pm'] = any(pm.get(f) for f in READING_FAMILIES['pm'])
+        row['has_mq'] = any(mq.get(f) is not None for f in READING_FAMILIES['mq'])
+    if row.get('timestamp'):
+        row['timestamp'] = datetime.fromisoformat(row['timestamp'])
+    return row
+
+
+def _dead_letter_entry(stem, record, error):
+    # first line only: StatementError appends the whole SQL statement
+    message = ('%s: %s' % (type(error).__name__, error)).splitlines()[0]
+    return {"segment": stem, "failed_at": datetime.now(timezone.utc).isoformat(),
+            "error": message, "record": record}
+
+
+def _apply_queued_rows(rows, raw_items, sources, dead):
+    """Insert queued rows and fold them into the rollups; returns the rows stored.
+
+    The whole batch goes in one executemany. If that fails, each row is
+    retried under its own savepoint so a single bad record cannot hold back
+    the queue; the rows that still fail are added to ``dead``.
+    """
+    try:
+        with db.session.begin_nested():
+            _insert_readings(rows, raw_items)
+            _update_rollups(rows)
+        return rows
+    except Exception as e:
+        app.logger.warning("Queued batch of %d readings failed (%s); retrying one at a time",
+                           len(rows), str(e).splitlines()[0])
+    stored = []
+    for row, raw, (stem, record) in zip(rows, raw_items, sources):
+        try:
+            with db.session.begin_nested():
+                _insert_readings([row], [raw])
+                _update_rollups([row])
+        except Exception as e:
+            dead.append(_dead_letter_entry(stem, record, e))
+        else:
+            stored.append(row)
+    return stored
+
+
+def _drain_ingest_queue_once():
+    """Apply one group commit worth of queued readings; returns how many were read."""
+    segments = ingest_queue.list_segments(INGEST_QUEUE_DIR)
+    if not segments:
+        return 0
+    offsets = dict(db.session.query(IngestOffset.segment, IngestOffset.position).all())
+    rows, raw_items, sources = [], [], []
+    dead = []
+    progress = {}
+    finished = []
+    budget = INGEST_WRITER_BATCH
+    read = 0
+    for stem, (path, sealed) in segments.items():
+        start = offsets.get(stem, 0)
+        try:
+            records, end, at_end = ingest_queue.read_records(path, start, budget)
+        except FileNotFoundError:
+            continue
+        for record in records:
+            try:
+                row = _queued_record_to_row(record)
+            except Exception as e:
+                dead.append(_dead_letter_entry(stem, record, e))
+                continue
+            rows.append(row)
+            raw_items.append(record.get('raw'))
+            sources.append((stem, record))
+        if end != start:
+            progress[stem] = end
+        if sealed and at_end:
+            finished.append((stem, path))
+        read += len(records)
+        budget -= len(records)
+        if budget <= 0:
+            break
+
+    # The offsets are written first: pysqlite only opens the SQLite
+    # transaction before DML, so this flush makes the savepoints of
+    # _apply_queued_rows nest inside it instead of committing on release.
+    for stem, position in progress.items():
+        db.session.merge(IngestOffset(segment=stem, position=position))
+    db.session.flush()
+    if rows:
+        rows = _apply_queued_rows(rows, raw_items, sources, dead)
+    if dead:
+        # written before the commit: a crash in between dead-letters them twice
+        # rather than not at all
+        ingest_queue.dead_letter(INGEST_DEAD_LETTER_FILE, dead)
+        print(f"Ingest writer: {len(dead)} queued reading(s) moved to {INGEST_DEAD_LETTER_FILE}")
+    db.session.commit()
+    if rows:
+        _update_latest_state(rows)
+
+    # Segments are only removed once their last record is committed above
+    for stem, path in finished:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        IngestOffset.query.filter_by(segment=stem).delete()
+    if finished:
+        db.session.commit()
+    return read
+
+
+def run_ingest_writer():
+    """Main loop of the single writer process used with INGEST_MODE=queue."""
+    if not _acquire_process_lock(INGEST_WRITER_LOCK_FILE):
+        raise SystemExit(f"Another ingest writer holds {INGEST_WRITER_LOCK_FILE}; exiting")
+    print(f"Ingest writer draining {INGEST_QUEUE_DIR} (pid {os.getpid()}, synchronous={SQLITE_SYNCHRONOUS})")
+    last_orphan_check = 0.0
+    with app.app_context():
+        while True:
             try:
-                cur.execute("SELECT id FROM sensor_data WHERE uuid IS NULL OR uuid = ''")
-                rows = cur.fetchall()
-                for (rid,) in rows:
-                    cur.execute("UPDATE sensor_data SET uuid = ? WHERE id = ?", (str(uuid4()), rid))
-                conn.commit()
+                if time.time() - last_orphan_check > 5:
+                    # segments of workers that died without closing them
+                    ingest_queue.seal_orphans(INGEST_QUEUE_DIR)
+                    # offsets of segments removed outside a drain (only this thread writes them)
+                    known = list(ingest_queue.list_segments(INGEST_QUEUE_DIR))
+                    IngestOffset.query.filter(IngestOffset.segment.notin_(known)).delete(synchronize_session=False)
+                    db.session.commit()
+                    last_orphan_check = time.time()
+                if _drain_ingest_queue_once():
+                    continue
             except Exception:
-                try:
-                    conn.rollback()
-                except Exception:
-                    pass
+                db.session.rollback()
+                print('Ingest writer error:')
+                print(traceback.format_exc())
+                time.sleep(1)
             finally:
-                try:
-                    cur.close()
-                    conn.close()
-                except Exception:
-                    pass
+                db.session.remove()
+            time.sleep(INGEST_WRITER_IDLE_SECONDS)
+
 
-        if 'mq_sensor_data' in tables:
-            conn = engine.raw_connection()
-            cur = conn.cursor()
+def _ingest_queue_status():
+    segments = ingest_queue.list_segments(INGEST_QUEUE_DIR)
+    offsets = dict(db.session.query(IngestOffset.segment, IngestOffset.position).all()) if segments else {}
+    pending = 0
+    for stem, (path, _) in segments.items():
+        try:
+            pending += os.path.getsize(path) - offsets.get(stem, 0)
+        except OSError:
+            pass
+    try:
+        dead_letter_bytes = os.path.getsize(INGEST_DEAD_LETTER_FILE)
+    except OSError:
+        dead_letter_bytes = 0
+    return {"mode": INGEST_MODE, "segments": len(segments), "pending_bytes": pending,
+            "dead_letter_bytes": dead_letter_bytes}
+
+
+def _parse_reading_timestamp(data):
+    """Return the reading's timestamp as naive UTC, or None if absent/invalid."""
+    # If the payload includes a 'timestamp' field (ISO string) or epoch ms, try to parse it
+    parsed_ts = None
+    if isinstance(data, dict):
+        ts_val = data.get('timestamp')
+        if ts_val is None:
+            ts_val = data.get('timestamp_ms') or data.get('ts')
+        if ts_val:
             try:
-                cur.execute("SELECT id FROM mq_sensor_data WHERE uuid IS NULL OR uuid = ''")
-                rows = cur.fetchall()
-                for (rid,) in rows:
-                    cur.execute("UPDATE mq_sensor_data SET uuid = ? WHERE id = ?", (str(uuid4()), rid))
-                conn.commit()
+                parsed_dt = _parse_to_utc(ts_val)
+                if parsed_dt is not None:
+                    now = datetime.now(timezone.utc)
+                    # Clamp timestamps that are far in the future ( > now + 5 minutes )
+                    if parsed_dt > now + timedelta(minutes=5):
+                        app.logger.warning("Incoming timestamp far in future: %s. Clamping to now.", ts_val)
+                        parsed_dt = now
+                    # store as naive UTC (consistent with existing DB rows)
+                    parsed_ts = parsed_dt.astimezone(timezone.utc).replace(tzinfo=None)
+                else:
+                    parsed_ts = None
             except Exception:
-                try:
-                    conn.rollback()
-                except Exception:
-                    pass
-            finally:
-                try:
-                    cur.close()
-                    conn.close()
-                except Exception:
-                    pass
+                parsed_ts = None
+    return parsed_ts
+
+
+# Columns that make a frame a PM / MQ reading (see _split_families)
+READING_FAMILIES = {
+    'pm': ('dust', 'pm2_5', 'pm10'),
+    'mq': MQ_REQUIRED_FIELDS + ('sd_aqi', 'sd_aqi_level'),
+}
+READING_ROW_KEYS = (('timestamp', 'uuid', 'device_id', 'has_pm', 'has_mq')
+                    + READING_FAMILIES['pm'] + READING_FAMILIES['mq'])
+
+
+def _reading_number(column, value):
+    """Coerce a sensor value to float the way its Float column would.
+
+    Done while the request is still open, so a bad value is answered with an
+    error instead of failing later in a (possibly queued) insert. NaN and
+    infinite values mean the sensor had no reading and become None.
+    """
+    if value is None:
+        return None
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        raise ValueError("Invalid value for %s: %r" % (column, value))
+    return value if math.isfinite(value) else None
+
+
+def _reading_to_row(data):
+    """Map one incoming frame to the column values of its ``reading`` row.
+
+    Shared by the single-reading and batch ingestion endpoints so both store
+    exactly the same columns. Every key of READING_ROW_KEYS is set (so rows
+    can go through one executemany); values the frame did not carry are None.
+    The raw payload is stored separately, see ``_insert_readings``. Raises
+    ValueError for a value that is not a number.
+    """
+    def pick_keys(*keys):
+        for k in keys:
+            if k in data and data[k] is not None:
+                return data[k]
+        return None
+
+    # the station: set by xbreemw from the XBee source address, or sent by the device
+    device_id = pick_keys('device_id', 'deviceId', 'device')
+    row = {
+        'timestamp': _parse_reading_timestamp(data),
+        'uuid': str(uuid4()),
+        'device_id': (str(device_id).strip() or None) if device_id is not None else None,
+        'dust': pick_keys('dust_density'),
+        'pm2_5': pick_keys('pm2_5'),
+        'pm10': pick_keys('pm10'),
+    }
+    field_map = {
+        'lpg':'LPG','co':'CO','smoke':'Smoke','co_mq7':'CO_MQ7','ch4':'CH4','co_mq9':'CO_MQ9',
+        'co2':'CO2','nh3':'NH3','nox':'NOx','alcohol':'Alcohol','benzene':'Benzene','h2':'H2','air':'Air',
+        'temperature':'Temperature','humidity':'Humidity'
+    }
+    for col, key in field_map.items():
+        row[col] = pick_keys(key, key.lower())
+    for col in READING_FAMILIES['pm'] + MQ_REQUIRED_FIELDS:
+        row[col] = _reading_number(col, row[col])
+
+    # sd_aqi fields: computed here from the gas readings so every row uses the
+    # same weights; the device's own value is only kept when no gas was sent
+    sd_aqi_value = sdaqi.sd_aqi(row)
+    if sd_aqi_value is not None:
+        sd_aqi_level = sdaqi.sd_aqi_level(sd_aqi_value)
+    else:
+        sd_aqi_value = _reading_number('sd_aqi', pick_keys('sd_aqi', 'SD_AQI', 'sdAqi'))
+        sd_aqi_level = pick_keys('sd_aqi_level', 'SD_AQI_level', 'sdAqiLevel')
+    row['sd_aqi'] = sd_aqi_value
+    row['sd_aqi_level'] = str(sd_aqi_level) if sd_aqi_level is not None else None
+
+    for family, fields in READING_FAMILIES.items():
+        row['has_' + family] = any(row[f] is not None for f in fields)
+    return row
+
+
+def _split_families(rows):
+    """``{'pm': [...], 'mq': [...]}``: the reading rows that carry each family."""
+    return {family: [r for r in rows if r.get('has_' + family)] for family in READING_FAMILIES}
+
+
+# Maintain reading_rollup at ingest time; set ROLLUPS_ENABLED=0 to turn it off
+# (then run scripts/backfill_rollups.py before turning it back on).
+ROLLUPS_ENABLED = os.environ.get('ROLLUPS_ENABLED', '1') == '1'
+
+
+def _rollups_available():
+    return ROLLUPS_ENABLED and bool(ROLLUP_COLUMNS)
+
+
+# Keep each reading's original JSON (compressed, in raw_payload); set
+# RAW_PAYLOADS=0 to store only the typed columns.
+RAW_PAYLOADS_ENABLED = os.environ.get('RAW_PAYLOADS', '1') == '1'
+
+
+def _raw_payloads_available():
+    return RAW_PAYLOADS_ENABLED and bool(RAW_PAYLOAD_COLUMNS)
+
+
+def _insert_readings(rows, raw_items=None):
+    """Insert reading rows in one executemany, plus their raw payloads when enabled.
+
+    ``raw_items`` are the original frames, in the order of ``rows`` (None
+    where there is none to keep).
+    """
+    if not raw_items or not any(raw_items) or not _raw_payloads_available():
+        db.session.execute(Reading.__table__.insert(), rows)
+        return
+    ids = db.session.execute(
+        Reading.__table__.insert().returning(Reading.id, sort_by_parameter_order=True), rows
+    ).scalars().all()
+    db.session.execute(RawPayload.__table__.insert(), [
+        dict(zip(('dict_id', 'payload'), payloads.compress(item)), reading_id=row_id)
+        for row_id, item in zip(ids, raw_items) if item
+    ])
+
+
+def _update_rollups(rows):
+    """Fold new reading rows into reading_rollup inside the caller's transaction."""
+    if not _rollups_available():
+        return
+    acc = {}
+    # readings without a timestamp get the column default (current UTC time)
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    for source, family in _split_families(rows).items():
+        for kwargs in family:
+            rollups.accumulate(acc, source, kwargs.get('timestamp') or now, kwargs)
+    if acc:
+        db.session.execute(text(rollups.UPSERT_SQL), rollups.upsert_params(acc))
 
-    except Exception as e:
-        print('Warning backfilling uuids: %r' % (e,))
 
 @app.route("/api/data", methods=["POST"])
 @limiter.limit("10 per second")  # Limit to 10 requests per second
@@ -304,152 +1098,258 @@ def receive_data():
         if not data:
             return jsonify({"status": "error", "message": "No JSON data received"}), 400
 
-        # If the payload includes a 'timestamp' field (ISO string) or epoch ms, try to parse it
-        parsed_ts = None
-        if isinstance(data, dict):
-            ts_val = data.get('timestamp')
-            if ts_val is None:
-                ts_val = data.get('timestamp_ms') or data.get('ts')
-            if ts_val:
-                try:
-                    # helper to parse various timestamp formats into an aware UTC datetime
-                    def _parse_to_utc(val):
-                        # numeric epoch (seconds or milliseconds)
-                        if isinstance(val, (int, float)):
-                            v = float(val)
-                            # heuristic: values > 1e12 are milliseconds
-                            if v > 1e12:
-                                return datetime.fromtimestamp(v / 1000.0, tz=timezone.utc)
-                            else:
-                                return datetime.fromtimestamp(v, tz=timezone.utc)
-
-                        s = str(val)
-                        # strip whitespace
-                        s = s.strip()
-                        # If it ends with Z (UTC) remove it and parse, then set tzinfo=UTC
-                        try:
-                            if s.endswith('Z'):
-                                no_z = s[:-1]
-                                dt = datetime.fromisoformat(no_z)
-                                if dt.tzinfo is None:
-                                    return dt.replace(tzinfo=timezone.utc)
-                                return dt.astimezone(timezone.utc)
-                            else:
-                                dt = datetime.fromisoformat(s)
-                                if dt.tzinfo is None:
-                                    return dt.replace(tzinfo=timezone.utc)
-                                return dt.astimezone(timezone.utc)
-                        except Exception:
-                            # best-effort: try parsing common formats
-                            try:
-                                # fallback to parsing with space-separated date/time
-                                dt = datetime.strptime(s, '%Y-%m-%d %H:%M:%S')
-                                return dt.replace(tzinfo=timezone.utc)
-                            except Exception:
-                                return None
-
-                    parsed_dt = _parse_to_utc(ts_val)
-                    if parsed_dt is not None:
-                        now = datetime.now(timezone.utc)
-                        # Clamp timestamps that are far in the future ( > now + 5 minutes )
-                        if parsed_dt > now + timedelta(minutes=5):
-                            app.logger.warning("Incoming timestamp far in future: %s. Clamping to now.", ts_val)
-                            parsed_dt = now
-                        # store as naive UTC (consistent with existing DB rows)
-                        parsed_ts = parsed_dt.astimezone(timezone.utc).replace(tzinfo=None)
-                    else:
-                        parsed_ts = None
-                except Exception:
-                    parsed_ts = None
+        try:
+            row = _reading_to_row(data)
+        except ValueError as e:
+            return jsonify({"status": "error", "message": str(e)}), 400
+        if INGEST_MODE == 'queue':
+            _enqueue_readings([row], datetime.now(timezone.utc).replace(tzinfo=None), [data])
+            return jsonify({"status": "success", "message": "Data queued"}), 200
+
+        new_reading = Reading(**row)
+        db.session.add(new_reading)
+        if _raw_payloads_available():
+            db.session.flush()  # assigns new_reading.id
+            dict_id, payload = payloads.compress(data)
+            db.session.add(RawPayload(reading_id=new_reading.id, dict_id=dict_id, payload=payload))
+        _update_rollups([row])
 
-        # Store general sensor data (only include columns that exist)
-        sensor_kwargs = {}
-        if 'dust' in SENSOR_COLUMNS or True:
-            sensor_kwargs['dust'] = data.get('dust_density', 0.0)
-        if 'pm2_5' in SENSOR_COLUMNS or True:
-            sensor_kwargs['pm2_5'] = data.get('pm2_5', 0.0)
-        if 'pm10' in SENSOR_COLUMNS or True:
-            sensor_kwargs['pm10'] = data.get('pm10', 0.0)
-        if 'timestamp' in SENSOR_COLUMNS:
-            sensor_kwargs['timestamp'] = parsed_ts if parsed_ts is not None else None
-        if 'uuid' in SENSOR_COLUMNS:
-            sensor_kwargs['uuid'] = str(uuid4())
-        if 'raw_payload' in SENSOR_COLUMNS:
-            try:
-                sensor_kwargs['raw_payload'] = json.dumps(data, ensure_ascii=False)
-            except Exception:
-                sensor_kwargs['raw_payload'] = str(data)
-        new_sensor_data = SensorData(**sensor_kwargs)
-        db.session.add(new_sensor_data)
-
-        # Store MQ sensor data (only include columns that exist in DB)
-        mq_kwargs = {}
-        def pick_keys(*keys):
-            for k in keys:
-                if k in data and data[k] is not None:
-                    return data[k]
-            return None
+        db.session.commit()
+        _update_latest_state([row])
+        _publish_new_reading(new_reading)
 
-        field_map = {
-            'lpg':'LPG','co':'CO','smoke':'Smoke','co_mq7':'CO_MQ7','ch4':'CH4','co_mq9':'CO_MQ9',
-            'co2':'CO2','nh3':'NH3','nox':'NOx','alcohol':'Alcohol','benzene':'Benzene','h2':'H2','air':'Air',
-            'temperature':'Temperature','humidity':'Humidity'
-        }
-        for col, key in field_map.items():
-            if col in MQ_COLUMNS:
-                mq_kwargs[col] = pick_keys(key, key.lower())
-
-        if 'timestamp' in MQ_COLUMNS:
-            mq_kwargs['timestamp'] = parsed_ts if parsed_ts is not None else None
-        if 'uuid' in MQ_COLUMNS:
-            mq_kwargs['uuid'] = str(uuid4())
-        # sd_aqi fields
-        if 'sd_aqi' in MQ_COLUMNS:
-            mq_kwargs['sd_aqi'] = pick_keys('sd_aqi', 'SD_AQI', 'sdAqi')
-        if 'sd_aqi_level' in MQ_COLUMNS:
-            mq_kwargs['sd_aqi_level'] = pick_keys('sd_aqi_level', 'SD_AQI_level', 'sdAqiLevel')
-        if 'raw_payload' in MQ_COLUMNS:
-            try:
-                mq_kwargs['raw_payload'] = json.dumps(data, ensure_ascii=False)
-            except Exception:
-                mq_kwargs['raw_payload'] = str(data)
+        return jsonify({"status": "success", "message": "Data saved"}), 200
+    except Exception as e:
+        print("Error:", str(e))
+        return jsonify({"status": "error", "message": str(e)}), 500
 
-        new_mq_data = MQSensorData(**mq_kwargs)
-        db.session.add(new_mq_data)
 
-        db.session.commit()
+def _load_batch_body():
+    """Decode a batch request body: a JSON array (or a single object) or NDJSON.
 
-        return jsonify({"status": "success", "message": "Data saved"}), 200
+    Returns a list whose items are either decoded readings or exceptions for
+    NDJSON lines that failed to parse, so callers can report per-item status.
+    """
+    body = request.get_data(as_text=True) or ''
+    if not body.strip():
+        return []
+
+    def _ndjson():
+        items = []
+        for line in body.splitlines():
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                items.append(json.loads(line))
+            except Exception as e:
+                items.append(e)
+        return items
+
+    mimetype = (request.mimetype or '').lower()
+    if mimetype in ('application/x-ndjson', 'application/ndjson', 'application/jsonl'):
+        return _ndjson()
+    try:
+        decoded = json.loads(body)
+    except ValueError:
+        # Not a single JSON document: treat it as NDJSON
+        return _ndjson()
+    if isinstance(decoded, dict):
+        return [decoded]
+    if not isinstance(decoded, list):
+        raise ValueError("Batch body must be a JSON array, object or NDJSON")
+    return decoded
+
+
+@app.route("/api/data/batch", methods=["POST"])
+@limiter.limit("10 per second")
+def receive_data_batch():
+    """Store many readings in one transaction (group commit).
+
+    Accepts a JSON array of readings or NDJSON (one reading per line). Each
+    reading is mapped exactly like POST /api/data, then inserted with one
+    executemany (or handed to the ingest writer in queue mode).
+    The response lists a status per input item.
+    """
+    try:
+        try:
+            items = _load_batch_body()
+        except Exception as e:
+            return jsonify({"status": "error", "message": "Invalid batch body: %s" % e}), 400
+        if not items:
+            return jsonify({"status": "error", "message": "No readings received"}), 400
+        if len(items) > MAX_BATCH_SIZE:
+            return jsonify({"status": "error",
+                            "message": "Batch too large (%d > %d)" % (len(items), MAX_BATCH_SIZE)}), 413
+
+        results = []
+        rows = []
+        raw_items = []
+        # Core executemany does not fire Python-side column defaults for keys
+        # that are present, so fill the receive time the way the DB would.
+        received_at = datetime.now(timezone.utc).replace(tzinfo=None, microsecond=0)
+        for index, item in enumerate(items):
+            if isinstance(item, Exception):
+                results.append({"index": index, "status": "error", "message": "Invalid JSON: %s" % item})
+                continue
+            if not isinstance(item, dict) or not item:
+                results.append({"index": index, "status": "error", "message": "Reading must be a non-empty JSON object"})
+                continue
+            try:
+                row = _reading_to_row(item)
+            except Exception as e:
+                results.append({"index": index, "status": "error", "message": str(e)})
+                continue
+            if row['timestamp'] is None:
+                row['timestamp'] = received_at
+            rows.append(row)
+            raw_items.append(item)
+            results.append({"index": index, "status": "success"})
+
+        stored = len(rows)
+        if stored and INGEST_MODE == 'queue':
+            _enqueue_readings(rows, received_at, raw_items)
+        elif stored:
+            try:
+                _insert_readings(rows, raw_items)
+                _update_rollups(rows)
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                print("Error:", str(e))
+                return jsonify({"status": "error", "message": str(e)}), 500
+            _update_latest_state(rows)
+            # Rows were inserted in bulk without ids; let stream subscribers
+            # pick them up with a catch-up query.
+            broadcaster.notify('pm')
+            broadcaster.notify('mq')
+
+        return jsonify({
+            "status": "success" if stored == len(items) else ("partial" if stored else "error"),
+            "stored": stored,
+            "failed": len(items) - stored,
+            "results": results
+        }), 200 if stored else 400
     except Exception as e:
         print("Error:", str(e))
         return jsonify({"status": "error", "message": str(e)}), 500
 
+
+# Page size of the paginated read APIs
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = int(os.environ.get('MAX_PAGE_SIZE', '1000'))
+
+# DB_TIMESTAMP_FORMAT text, also accepted without (or with a shorter) fraction
+_DB_TIMESTAMP_RE = re.compile(r'^\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}(\.\d{1,6})?$')
+
+
+def _parse_keyset_cursor(prefix=''):
+    """Read ``?<prefix>before_ts=&<prefix>before_id=`` into (ts_text, id) or None.
+
+    Cursors handed out by _keyset_page carry the timestamp as stored and are
+    used verbatim (ones without a full fraction are padded); other values
+    are parsed and normalised to the storage format. Raises ValueError for an unparseable timestamp.
+    """
+    ts_raw = request.args.get(prefix + 'before_ts')
+    if not ts_raw:
+        return None
+    before_id = request.args.get(prefix + 'before_id', type=int)
+    if _DB_TIMESTAMP_RE.match(ts_raw):
+        # stored values always carry six fraction digits; pad so text comparison matches
+        base, _, fraction = ts_raw.partition('.')
+        ts_raw = f"{base}.{fraction.ljust(6, '0')}"
+    else:
+        parsed = _parse_to_utc(ts_raw)
+        if parsed is None:
+            raise ValueError(f"Invalid '{prefix}before_ts' timestamp")
+        ts_raw = parsed.replace(tzinfo=None).strftime(DB_TIMESTAMP_FORMAT)
+    return ts_raw, before_id
+
+
+def _keyset_page(model, cursor, limit, *filters, columns=None, offset=0):
+    """One page of ``model`` rows, newest first, strictly older than ``cursor``.
+
+    Rows are ordered by (timestamp, id) so rows sharing a timestamp are never
+    skipped or repeated. The timestamp index includes the rowid, so SQLite
+    seeks straight to the cursor: the cost no longer grows with page depth.
+    Returns (rows, next_cursor); next_cursor is None on the last page.
+    With ``columns`` (which must include the id) rows are result rows of
+    those columns instead of model instances. ``offset`` only serves the
+    deprecated ``?page=`` of /api/data and costs a scan of the skipped rows.
+    """
+    # compare as stored text (no datetime bind processing) so echoed cursors match exactly
+    ts_text = type_coerce(model.timestamp, String)
+    stmt = select(*(columns or [model]), ts_text.label('keyset_ts')).where(*filters)
+    if cursor is not None:
+        ts, before_id = cursor
+        if before_id is None:
+            stmt = stmt.where(ts_text < ts)
+        else:
+            stmt = stmt.where(tuple_(ts_text, model.id) < (ts, before_id))
+    stmt = stmt.order_by(model.timestamp.desc(), model.id.desc()).limit(limit + 1)
+    if offset:
+        stmt = stmt.offset(offset)
+    # plain column selects skip the ORM result machinery
+    results = (db.session.connection() if columns else db.session).execute(stmt).all()
+    next_cursor = None
+    if len(results) > limit:
+        results = results[:limit]
+        last = results[-1]
+        if last.keyset_ts is not None:
+            next_cursor = {"before_ts": last.keyset_ts, "before_id": last[0].id if columns is None else last.id}
+    return (results if columns else [r[0] for r in results]), next_cursor
+
+
+def _approx_count(section, model, *filters, device_id=None):
+    """Row count kept in the latest-state snapshot (per station with ``device_id``); seeded with COUNT(*) once."""
+    key = latest_state.count_key(section, device_id)
+    _, state = latest.read()
+    count = (state.get('counts') or {}).get(key)
+    if count is None:
+        count = db.session.query(func.count(model.id)).filter(*filters, *_device_filters(model, device_id)).scalar()
+        latest.set_count(key, count)
+    return max(count, 0)
+
+
 @app.route("/api/data", methods=["GET"])
+@_conditional_get('pm', 'mq')
 def get_data():
-    def _run_query_once():
-        # Pagination parameters
-        page = request.args.get("page", 1, type=int)  # Default to page 1
-        per_page = request.args.get("per_page", 50, type=int)  # Default to 50 records per page
+    """Return PM and MQ rows, newest first, one keyset page of each.
 
-        # Fetch paginated data for general sensor data
-        pagination = SensorData.query.order_by(SensorData.timestamp.desc()).paginate(page=page, per_page=per_page, error_out=False)
-        general_records = pagination.items  # Get the items for the current page
+    ``?before_ts=&before_id=`` selects the PM page and
+    ``?mq_before_ts=&mq_before_id=`` the MQ page; pass back ``next_cursor``
+    and ``mq_next_cursor`` from the previous response to get the next one.
+    ``?device_id=`` limits both to one station. Totals come from a counter
+    and are approximate.
 
-        # Fetch paginated data for MQ sensor data
-        mq_pagination = MQSensorData.query.order_by(MQSensorData.timestamp.desc()).paginate(page=page, per_page=per_page, error_out=False)
-        mq_records = mq_pagination.items
+    The old ``?page=N`` is still answered (same rows, skipped with OFFSET,
+    so deep pages are slow) with a ``Deprecation`` header; cursors win when
+    both are given.
+    """
+    device_id = _request_device_id()
+    per_page = max(1, min(request.args.get("per_page", DEFAULT_PAGE_SIZE, type=int), MAX_PAGE_SIZE))
+    try:
+        pm_cursor = _parse_keyset_cursor()
+        mq_cursor = _parse_keyset_cursor('mq_')
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    legacy_page = request.args.get("page", type=int)
+    if legacy_page is not None and (pm_cursor or mq_cursor):
+        legacy_page = None
+    page = max(1, legacy_page) if legacy_page is not None else (None if pm_cursor else 1)
+    offset = (page - 1) * per_page if legacy_page is not None else 0
 
-        # Format data for JSON response, skipping records where all values are 0
-        general_data = [{
-            "timestamp": r.timestamp.isoformat() if r.timestamp else None,
-            "uuid": getattr(r, 'uuid', None) if getattr(r, 'uuid', None) is not None else None,
-            "dust": r.dust if r.dust is not None else 0,
-            "pm2_5": r.pm2_5 if r.pm2_5 is not None else 0,
-            "pm10": r.pm10 if r.pm10 is not None else 0
-        } for r in general_records if not (r.dust == 0 and r.pm2_5 == 0 and r.pm10 == 0)]
+    def _run_query_once():
+        general_records, next_cursor = _keyset_page(SensorData, pm_cursor, per_page,
+                                                    *_device_filters(SensorData, device_id), offset=offset)
+        mq_records, mq_next_cursor = _keyset_page(MQSensorData, mq_cursor, per_page,
+                                                  *_device_filters(MQSensorData, device_id), offset=offset)
+
+        general_data = [_pm_record_to_dict(r) for r in general_records]
 
         mq_data = [{
             "uuid": getattr(r, 'uuid', None) if getattr(r, 'uuid', None) is not None else None,
+            "device_id": r.device_id,
             "sd_aqi": getattr(r, 'sd_aqi', None),
             "sd_aqi_level": getattr(r, 'sd_aqi_level', None),
             "timestamp": r.timestamp.isoformat() if r.timestamp else None,
@@ -470,26 +1370,31 @@ def get_data():
             "humidity": r.humidity if r.humidity is not None else 0
         } for r in mq_records]
 
-        return jsonify({
+        general_total = _approx_count('pm', SensorData, device_id=device_id)
+        response = jsonify({
             "general_data": general_data,
             "mq_data": mq_data,
             "server_now": datetime.now(timezone.utc).isoformat(),
-            "general_total": len(general_data),       # Total valid records for general sensor data
-            "mq_total": mq_pagination.total,         # Total records for MQ sensor data
-            "page": pagination.page,                 # Current page
-            "per_page": pagination.per_page,         # Records per page
-            "pages": pagination.pages                # Total pages
+            "general_total": general_total,          # Approximate number of PM readings
+            "mq_total": _approx_count('mq', MQSensorData, device_id=device_id),  # Approximate number of MQ readings
+            "total_is_approximate": True,
+            "page": page,                            # Page number (None once paging by cursor)
+            "per_page": per_page,                    # Records per page
+            "pages": max(1, math.ceil(general_total / per_page)),  # Approximate PM page count
+            "next_cursor": next_cursor,              # PM cursor for the next (older) page
+            "mq_next_cursor": mq_next_cursor         # MQ cursor for the next (older) page
         })
+        if legacy_page is not None:
+            response.headers['Deprecation'] = 'true'
+        return response
 
     try:
         return _run_query_once()
     except OperationalError as oe:
-        # If schema is out of sync at runtime, try running the migration script once and retry
+        # If schema is out of sync at runtime (e.g. the DB file was swapped for an
+        # older one), migrate it and retry once
         try:
-            import subprocess, sys
-            migrate_script = os.path.join(os.path.dirname(__file__), 'scripts', 'migrate_db.py')
-            if os.path.exists(migrate_script):
-                subprocess.check_call([sys.executable, migrate_script, '--db', db_path, '--yes'])
+            if _ensure_schema():
                 # dispose engine and remove session to ensure new schema is seen
                 try:
                     db.session.remove()
@@ -510,6 +1415,46 @@ def get_data():
 
 
 
+@app.route("/api/pm-data", methods=["GET"])
+@_conditional_get('pm')
+def get_pm_data():
+    """Return PM rows only, newest first, one keyset page at a time.
+
+    Same paging as /api/data (``?per_page=&before_ts=&before_id=``) without
+    the MQ half; ``?fields=dust,pm2_5`` selects only those columns and
+    ``?format=columnar`` returns ``columns: {field: [values...]}`` instead
+    of ``pm_data`` rows. ``?device_id=`` limits the page to one station.
+    """
+    device_id = _request_device_id()
+    per_page = max(1, min(request.args.get("per_page", DEFAULT_PAGE_SIZE, type=int), MAX_PAGE_SIZE))
+    try:
+        cursor = _parse_keyset_cursor()
+        names = _parse_projection(PM_API_FIELDS)
+        columnar = _wants_columnar()
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    try:
+        rows, next_cursor = _keyset_page(SensorData, cursor, per_page, *_device_filters(SensorData, device_id),
+                                         columns=_projection_columns(PM_API_FIELDS, names, columnar))
+        total = _approx_count('pm', SensorData, device_id=device_id)
+        if columnar:
+            data = {"columns": _rows_to_columns(names, [r[:-1] for r in rows], PM_ZERO_FILLED), "count": len(rows)}
+        else:
+            data = {"pm_data": [_projected_row_to_dict(r, names, PM_ZERO_FILLED) for r in rows]}
+        return _json_response({
+            **data,
+            "server_now": datetime.now(timezone.utc).isoformat(),
+            "total": total,
+            "total_is_approximate": True,
+            "per_page": per_page,
+            "pages": max(1, math.ceil(total / per_page)),
+            "next_cursor": next_cursor
+        })
+    except Exception as e:
+        print("Error:", str(e))
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+
 @app.route("/")
 def index():
     return render_template("index.html")
@@ -520,56 +1465,69 @@ def mq_data():
 
 
 @app.route("/api/mq-data", methods=["GET"])
+@_conditional_get('mq')
 def get_mq_data():
+    """Return MQ sensor rows, newest first.
+
+    Supports an incremental mode so polling clients only receive rows they
+    have not seen yet:
+    - ``?after_id=<id>`` returns rows with ``id`` greater than the cursor.
+    - ``?since=<iso|epoch>`` returns rows with a timestamp after the value.
+    The response always carries ``cursor`` (highest id returned, or the
+    cursor that was passed in) so the client can send it back next time.
+    ``?fields=CO,CO2`` returns only those fields (plus id and timestamp), and
+    ``?format=columnar`` returns ``columns: {field: [values...]}`` instead of
+    ``mq_data`` rows, which is much cheaper to build and parse for long ranges.
+    ``?device_id=`` returns one station's rows only.
+    """
+    device_id = _request_device_id()
+    after_id = request.args.get("after_id", type=int)
+    since_raw = request.args.get("since")
+    since_ts = None
+    if since_raw:
+        since_dt = _parse_to_utc(since_raw)
+        if since_dt is None:
+            return jsonify({"status": "error", "message": "Invalid 'since' timestamp"}), 400
+        # DB rows are stored as naive UTC
+        since_ts = since_dt.replace(tzinfo=None)
     try:
-        mq_records = MQSensorData.query.filter(
-            MQSensorData.lpg.isnot(None),
-            MQSensorData.co.isnot(None),
-            MQSensorData.smoke.isnot(None),
-            MQSensorData.co_mq7.isnot(None),
-            MQSensorData.ch4.isnot(None),
-            MQSensorData.co_mq9.isnot(None),
-            MQSensorData.co2.isnot(None),
-            MQSensorData.nh3.isnot(None),
-            MQSensorData.nox.isnot(None),
-            MQSensorData.alcohol.isnot(None),
-            MQSensorData.benzene.isnot(None),
-            MQSensorData.h2.isnot(None),
-            MQSensorData.air.isnot(None),
-            MQSensorData.temperature.isnot(None),
-            MQSensorData.humidity.isnot(None)
-        ).order_by(MQSensorData.timestamp.desc()).all()
+        names = _parse_projection(MQ_API_FIELDS)
+        columnar = _wants_columnar()
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
 
-        mq_data = [{
-            "uuid": r.uuid if r.uuid is not None else None,
-            "sd_aqi": getattr(r, 'sd_aqi', None),
-            "sd_aqi_level": getattr(r, 'sd_aqi_level', None),
-            "timestamp": r.timestamp.isoformat() if r.timestamp else None,
-            "temperature": r.temperature,
-            "humidity": r.humidity,
-            "LPG": r.lpg,
-            "CO": r.co,
-            "Smoke": r.smoke,
-            "CO_MQ7": r.co_mq7,
-            "CH4": r.ch4,
-            "CO_MQ9": r.co_mq9,
-            "CO2": r.co2,
-            "NH3": r.nh3,
-            "NOx": r.nox,
-            "Alcohol": r.alcohol,
-            "Benzene": r.benzene,
-            "H2": r.h2,
-            "Air": r.air
-        } for r in mq_records]
+    def _run_query_once():
+        stmt = select(*_projection_columns(MQ_API_FIELDS, names, columnar)).where(
+            *[getattr(MQSensorData, f).isnot(None) for f in MQ_REQUIRED_FIELDS],
+            *_device_filters(MQSensorData, device_id)
+        )
+        if after_id is not None:
+            stmt = stmt.where(MQSensorData.id > after_id)
+        if since_ts is not None:
+            stmt = stmt.where(MQSensorData.timestamp > since_ts)
+        # Core execution: plain tuples, no ORM result machinery
+        mq_records = db.session.connection().execute(stmt.order_by(MQSensorData.timestamp.desc())).all()
+
+        if columnar:
+            columns = _rows_to_columns(names, mq_records)
+            data = {"columns": columns, "count": len(mq_records)}
+            cursor = max(columns['id'], default=after_id)
+        else:
+            data = {"mq_data": [_projected_row_to_dict(r, names) for r in mq_records]}
+            cursor = max((r.id for r in mq_records), default=after_id)
+        return _json_response({
+            **data,
+            "cursor": cursor,
+            "incremental": after_id is not None or since_ts is not None,
+            "server_now": datetime.now(timezone.utc).isoformat()
+        })
 
-        return jsonify({"mq_data": mq_data, "server_now": datetime.now(timezone.utc).isoformat()}), 200
+    try:
+        return _run_query_once()
     except OperationalError as oe:
         # Try running migration + disposing engine/session and retry once
         try:
-            import subprocess, sys
-            migrate_script = os.path.join(os.path.dirname(__file__), 'scripts', 'migrate_db.py')
-            if os.path.exists(migrate_script):
-                subprocess.check_call([sys.executable, migrate_script, '--db', DB_FILE, '--yes'])
+            if _ensure_schema():
                 try:
                     db.session.remove()
                 except Exception:
@@ -579,45 +1537,7 @@ def get_mq_data():
                 except Exception:
                     pass
                 # retry
-                mq_records = MQSensorData.query.filter(
-                    MQSensorData.lpg.isnot(None),
-                    MQSensorData.co.isnot(None),
-                    MQSensorData.smoke.isnot(None),
-                    MQSensorData.co_mq7.isnot(None),
-                    MQSensorData.ch4.isnot(None),
-                    MQSensorData.co_mq9.isnot(None),
-                    MQSensorData.co2.isnot(None),
-                    MQSensorData.nh3.isnot(None),
-                    MQSensorData.nox.isnot(None),
-                    MQSensorData.alcohol.isnot(None),
-                    MQSensorData.benzene.isnot(None),
-                    MQSensorData.h2.isnot(None),
-                    MQSensorData.air.isnot(None),
-                    MQSensorData.temperature.isnot(None),
-                    MQSensorData.humidity.isnot(None)
-                ).order_by(MQSensorData.timestamp.desc()).all()
-                mq_data = [{
-                    "uuid": r.uuid if r.uuid is not None else None,
-                    "sd_aqi": getattr(r, 'sd_aqi', None),
-                    "sd_aqi_level": getattr(r, 'sd_aqi_level', None),
-                    "timestamp": r.timestamp.isoformat() if r.timestamp else None,
-                    "temperature": r.temperature,
-                    "humidity": r.humidity,
-                    "LPG": r.lpg,
-                    "CO": r.co,
-                    "Smoke": r.smoke,
-                    "CO_MQ7": r.co_mq7,
-                    "CH4": r.ch4,
-                    "CO_MQ9": r.co_mq9,
-                    "CO2": r.co2,
-                    "NH3": r.nh3,
-                    "NOx": r.nox,
-                    "Alcohol": r.alcohol,
-                    "Benzene": r.benzene,
-                    "H2": r.h2,
-                    "Air": r.air
-                } for r in mq_records]
-                return jsonify({"mq_data": mq_data, "server_now": datetime.now(timezone.utc).isoformat()}), 200
+                return _run_query_once()
         except Exception:
             pass
         print("Error:", str(oe))
@@ -626,6 +1546,491 @@ def get_mq_data():
         print("Error:", str(e))
         return jsonify({"status": "error", "message": str(e)}), 500
 
+# Time buckets accepted by the /aggregate endpoints, finest first
+AGGREGATE_BUCKETS = {'1m': 60, '5m': 300, '15m': 900, '1h': 3600, '6h': 21600, '1d': 86400}
+AGGREGATE_MAX_BUCKETS = int(os.environ.get('AGGREGATE_MAX_BUCKETS', '5000'))
+
+MQ_AGGREGATE_FIELDS = {
+    "temperature": MQSensorData.temperature,
+    "humidity": MQSensorData.humidity,
+    "LPG": MQSensorData.lpg,
+    "CO": MQSensorData.co,
+    "Smoke": MQSensorData.smoke,
+    "CO_MQ7": MQSensorData.co_mq7,
+    "CH4": MQSensorData.ch4,
+    "CO_MQ9": MQSensorData.co_mq9,
+    "CO2": MQSensorData.co2,
+    "NH3": MQSensorData.nh3,
+    "NOx": MQSensorData.nox,
+    "Alcohol": MQSensorData.alcohol,
+    "Benzene": MQSensorData.benzene,
+    "H2": MQSensorData.h2,
+    "Air": MQSensorData.air,
+    "sd_aqi": MQSensorData.sd_aqi,
+}
+
+PM_AGGREGATE_FIELDS = {
+    "dust": SensorData.dust,
+    "pm2_5": SensorData.pm2_5,
+    "pm10": SensorData.pm10,
+}
+
+
+def _rollup_resolution_for(secs):
+    """Coarsest rollup resolution that evenly divides a bucket of ``secs``, or None."""
+    fitting = [r for r, width in rollups.RESOLUTIONS.items() if secs % width == 0]
+    return max(fitting, key=rollups.RESOLUTIONS.get) if fitting else None
+
+
+def _rollups_cover(model, source, resolution, fields, field_columns, from_naive):
+    """True when reading_rollup holds every reading of the range starting at ``from_naive``.
+
+    Rollups only start with the first reading ingested after reading_rollup
+    was created (until scripts/backfill_rollups.py is run), so a range with
+    raw readings before their first bucket has to be grouped from the raw
+    rows. Each first bucket is one seek on ux_reading_rollup_key, the raw
+    readings before it one range seek on the timestamp index.
+    """
+    first_bucket = None
+    for f in fields:
+        bucket = db.session.query(func.min(ReadingRollup.bucket)).filter(
+            ReadingRollup.source == source,
+            ReadingRollup.resolution == resolution,
+            ReadingRollup.field == field_columns[f].key
+        ).scalar()
+        if bucket is not None and (first_bucket is None or bucket < first_bucket):
+            first_bucket = bucket
+    if first_bucket is None:
+        return False
+    first_naive = datetime.fromtimestamp(first_bucket, timezone.utc).replace(tzinfo=None)
+    if first_naive <= from_naive:
+        return True
+    return db.session.query(model.id).filter(
+        model.timestamp >= from_naive, model.timestamp < first_naive).first() is None
+
+
+def _aggregate_from_rollups(source, resolution, secs, fields, field_columns, from_naive, to_naive):
+    """Rows shaped like the raw GROUP BY in _aggregate_readings, read from reading_rollup."""
+    width = rollups.RESOLUTIONS[resolution]
+    names = {field_columns[f].key: f for f in fields}
+    bucket_col = (ReadingRollup.bucket // secs * secs).label('bucket')
+    query = db.session.query(
+        bucket_col, ReadingRollup.field,
+        func.sum(ReadingRollup.count), func.sum(ReadingRollup.total),
+        func.min(ReadingRollup.minimum), func.max(ReadingRollup.maximum)
+    ).filter(
+        ReadingRollup.source == source,
+        ReadingRollup.resolution == resolution,
+        ReadingRollup.field.in_(list(names)),
+        ReadingRollup.bucket >= int(rollups.to_epoch(from_naive)) // width * width,
+        ReadingRollup.bucket < rollups.to_epoch(to_naive)
+    ).group_by(bucket_col, ReadingRollup.field)
+
+    by_bucket = {}
+    for bucket, field, count, total, low, high in query:
+        entry = by_bucket.setdefault(bucket, {'n': 0})
+        entry['n'] = max(entry['n'], count)
+        entry[names[field]] = (low, total / count if count else None, high)
+    rows = []
+    for bucket in sorted(by_bucket):
+        entry = by_bucket[bucket]
+        row = [bucket, entry['n']]
+        for f in fields:
+            row.extend(entry.get(f, (None, None, None)))
+        rows.append(row)
+    return rows
+
+
+def _aggregate_readings(model, field_columns, source, *filters):
+    """Downsample ``model`` into fixed time buckets with min/mean/max per field.
+
+    Query args: ``from``/``to`` (iso or epoch, default the last 24h),
+    ``bucket`` (one of AGGREGATE_BUCKETS) or ``points`` (target number of
+    buckets, e.g. the chart width in pixels; the finest bucket that fits is
+    used), ``fields`` (comma separated, default all) and ``device_id`` (one
+    station). Buckets are merged from reading_rollup when it is maintained
+    and covers the range, otherwise grouped from the raw rows in SQLite over
+    the timestamp index; rollups span all stations, so one station is always
+    grouped from its raw rows (over the per-station index). The response is
+    columnar so charts can plot the arrays directly.
+    """
+    device_id = _request_device_id()
+    now = datetime.now(timezone.utc)
+    to_dt = _parse_to_utc(request.args['to']) if request.args.get('to') else now
+    from_dt = _parse_to_utc(request.args['from']) if request.args.get('from') else None
+    if to_dt is None or (request.args.get('from') and from_dt is None):
+        return jsonify({"status": "error", "message": "Invalid 'from'/'to' timestamp"}), 400
+    if from_dt is None:
+        from_dt = to_dt - timedelta(hours=24)
+    span = (to_dt - from_dt).total_seconds()
+    if span <= 0:
+        return jsonify({"status": "error", "message": "'from' must be before 'to'"}), 400
+
+    bucket = request.args.get('bucket')
+    if bucket:
+        if bucket not in AGGREGATE_BUCKETS:
+            return jsonify({"status": "error", "message": f"bucket must be one of {', '.join(AGGREGATE_BUCKETS)}"}), 400
+    else:
+        points = max(1, request.args.get('points', 1000, type=int))
+        bucket = next((b for b, secs in AGGREGATE_BUCKETS.items() if span / secs <= points), '1d')
+    secs = AGGREGATE_BUCKETS[bucket]
+    if span / secs > AGGREGATE_MAX_BUCKETS:
+        return jsonify({"status": "error", "message": "Too many buckets for this range; use a coarser bucket"}), 400
+
+    fields_raw = request.args.get('fields')
+    fields = [f.strip() for f in fields_raw.split(',') if f.strip()] if fields_raw else list(field_columns)
+    unknown = [f for f in fields if f not in field_columns]
+    if unknown:
+        return jsonify({"status": "error", "message": f"Unknown field(s): {', '.join(unknown)}"}), 400
+
+    # DB rows are stored as naive UTC
+    from_naive = from_dt.astimezone(timezone.utc).replace(tzinfo=None)
+    to_naive = to_dt.astimezone(timezone.utc).replace(tzinfo=None)
+    resolution = _rollup_resolution_for(secs) if _rollups_available() and not device_id else None
+    if resolution and not _rollups_cover(model, source, resolution, fields, field_columns, from_naive):
+        resolution = None
+    if resolution:
+        rows = _aggregate_from_rollups(source, resolution, secs, fields, field_columns, from_naive, to_naive)
+    else:
+        bucket_col = (cast(func.strftime('%s', model.timestamp), Integer) // secs * secs).label('bucket')
+        columns = [bucket_col, func.count().label('n')]
+        for f in fields:
+            col = field_columns[f]
+            columns += [func.min(col), func.avg(col), func.max(col)]
+        rows = db.session.query(*columns).filter(
+            model.timestamp >= from_naive,
+            model.timestamp < to_naive,
+            *filters,
+            *_device_filters(model, device_id)
+        ).group_by(bucket_col).order_by(bucket_col).all()
+
+    series = {f: {"min": [], "mean": [], "max": []} for f in fields}
+    for row in rows:
+        for i, f in enumerate(fields):
+            series[f]["min"].append(row[2 + 3 * i])
+            series[f]["mean"].append(row[3 + 3 * i])
+            series[f]["max"].append(row[4 + 3 * i])
+
+    return jsonify({
+        "bucket": bucket,
+        "bucket_seconds": secs,
+        "source": "rollup" if resolution else "raw",
+        "device_id": device_id,
+        "from": from_dt.isoformat(),
+        "to": to_dt.isoformat(),
+        "fields": fields,
+        "t": [datetime.fromtimestamp(row[0], timezone.utc).isoformat() for row in rows],
+        "count": [row[1] for row in rows],
+        "series": series,
+        "server_now": now.isoformat()
+    }), 200
+
+
+@app.route("/api/mq-data/aggregate", methods=["GET"])
+def get_mq_data_aggregate():
+    """Time-bucketed min/mean/max of MQ readings for long-range charts."""
+    try:
+        return _aggregate_readings(MQSensorData, MQ_AGGREGATE_FIELDS, 'mq')
+    except Exception as e:
+        print("Error:", str(e))
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+
+@app.route("/api/data/aggregate", methods=["GET"])
+def get_data_aggregate():
+    """Time-bucketed min/mean/max of PM readings for long-range charts."""
+    try:
+        return _aggregate_readings(SensorData, PM_AGGREGATE_FIELDS, 'pm')
+    except Exception as e:
+        print("Error:", str(e))
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+
+def _parse_stream_cursor(raw):
+    """Parse a ``<pm_id>:<mq_id>`` Last-Event-ID into a dict of cursors."""
+    cursors = {'pm': None, 'mq': None}
+    if not raw:
+        return cursors
+    try:
+        pm_raw, mq_raw = str(raw).split(':', 1)
+        cursors['pm'] = int(pm_raw)
+        cursors['mq'] = int(mq_raw)
+    except Exception:
+        pass
+    return cursors
+
+
+def _stream_data_version(topics):
+    """The latest-state data version of ``topics``; it moves on every committed write."""
+    _, state = latest.read()
+    versions = state.get('versions') or {}
+    return state.get('epoch'), tuple(versions.get(t, 0) for t in sorted(topics))
+
+
+def _stream_catch_up(topics, cursors, device_id=None):
+    """Yield (topic, row_dict) pairs stored after the given cursors.
+
+    Both topics share reading ids, so primary-key range scans of the reading
+    table serve them, read in keyset pages of STREAM_CATCH_UP_PAGE rows. A
+    client more than STREAM_CATCH_UP_MAX_ROWS ids behind gets a single
+    ``reset`` pair instead and should reload through the REST APIs. With
+    ``device_id`` only that station's rows are returned. Advances ``cursors``
+    in place (past other stations' rows too) as pairs are yielded.
+    """
+    wanted = [t for t in ('pm', 'mq') if t in topics and cursors[t] is not None]
+    if not wanted:
+        return
+    start = after = min(cursors[t] for t in wanted)
+    while True:
+        rows = Reading.query.filter(Reading.id > after).order_by(Reading.id.asc()).limit(STREAM_CATCH_UP_PAGE).all()
+        if after == start and len(rows) == STREAM_CATCH_UP_PAGE:
+            # a full first page: check how far behind the client is
+            newest = db.session.query(db.func.max(Reading.id)).scalar()
+            if newest - start > STREAM_CATCH_UP_MAX_ROWS:
+                for t in wanted:
+                    cursors[t] = max(cursors[t], newest)
+                yield 'reset', {'last_id': '%s:%s' % (cursors['pm'], cursors['mq'])}
+                return
+        for r in rows:
+            own = device_id is None or r.device_id == device_id
+            if 'pm' in wanted and r.id > cursors['pm']:
+                cursors['pm'] = r.id
+                if r.has_pm and own:
+                    yield 'pm', _pm_record_to_dict(r)
+            if 'mq' in wanted and r.id > cursors['mq']:
+                cursors['mq'] = r.id
+                if r.has_mq and own and _mq_record_is_complete(r):
+                    yield 'mq', _mq_record_to_dict(r)
+        if len(rows) < STREAM_CATCH_UP_PAGE:
+            return
+        after = rows[-1].id
+
+
+@app.route("/api/stream", methods=["GET"])
+def stream():
+    """Server-Sent Events stream of newly stored readings.
+
+    Events are named ``pm`` and ``mq`` and carry the same row shape as
+    /api/data and /api/mq-data. ``?topics=pm,mq`` selects the tables and
+    ``?device_id=`` one station. The event id is ``<pm_id>:<mq_id>`` so a
+    reconnecting EventSource (which sends Last-Event-ID) resumes without
+    losing rows. A client too far behind to catch up gets a ``reset`` event
+    and reloads through the REST APIs.
+    """
+    topics = set(t.strip() for t in request.args.get('topics', 'pm,mq').split(',') if t.strip())
+    device_id = _request_device_id()
+    cursors = _parse_stream_cursor(request.headers.get('Last-Event-ID') or request.args.get('last_id'))
+
+    # Subscribe before reading the starting cursors so nothing committed in
+    # between can be missed.
+    q = broadcaster.subscribe()
+    try:
+        if cursors['pm'] is None or cursors['mq'] is None:
+            newest = db.session.query(db.func.max(Reading.id)).scalar() or 0
+            for topic in ('pm', 'mq'):
+                if cursors[topic] is None:
+                    cursors[topic] = newest
+        db.session.remove()
+    except Exception:
+        broadcaster.unsubscribe(q)
+        raise
+
+    def _format(topic, row):
+        return "id: %s:%s\nevent: %s\ndata: %s\n\n" % (
+            cursors['pm'], cursors['mq'], topic, json.dumps(row, ensure_ascii=False))
+
+    def _catch_up():
+        try:
+            for topic, row in _stream_catch_up(topics, cursors, device_id):
+                yield _format(topic, row)
+        finally:
+            db.session.remove()
+
+    def _generate():
+        try:
+            yield "retry: 3000\n\n"
+            # read before the catch-up, so a write racing with it is seen below
+            seen_version = _stream_data_version(topics)
+            yield from _catch_up()
+            last_keepalive = time.time()
+            while True:
+                try:
+                    topic, row_id, row = q.get(timeout=STREAM_POLL_SECONDS)
+                except queue.Empty:
+                    # Pick up rows committed by other processes: they moved the
+                    # data version. The heartbeat queries regardless, in case
+                    # a writer failed to update the snapshot.
+                    version = _stream_data_version(topics)
+                    heartbeat = time.time() - last_keepalive >= STREAM_HEARTBEAT_SECONDS
+                    if version != seen_version or heartbeat:
+                        seen_version = version
+                        yield from _catch_up()
+                    if heartbeat:
+                        yield ": keep-alive\n\n"
+                        last_keepalive = time.time()
+                    continue
+                if topic not in topics or (row_id is not None and row_id <= cursors[topic]):
+                    continue
+                if row_id is None or row_id != cursors[topic] + 1:
+                    # Gap: another process, a bulk insert or a dropped event
+                    # stored rows in between. Re-read them in id order.
+                    yield from _catch_up()
+                    continue
+                cursors[topic] = row_id
+                if row is not None and (device_id is None or row.get('device_id') == device_id):
+                    yield _format(topic, row)
+        finally:
+            broadcaster.unsubscribe(q)
+
+    headers = {
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+    }
+    return Response(stream_with_context(_generate()), mimetype='text/event-stream', headers=headers)
+
+
+# Rows fetched from the cursor and written out per chunk by /api/export
+EXPORT_CHUNK_ROWS = int(os.environ.get('EXPORT_CHUNK_ROWS', '5000'))
+
+# table -> (model, API fields, filters)
+EXPORT_TABLES = {
+    'mq': (MQSensorData, MQ_API_FIELDS, ()),
+    'pm': (SensorData, PM_API_FIELDS, ()),
+}
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+
+class _ChunkSink:
+    """Write-only file object whose contents are handed out chunk by chunk."""
+
+    closed = False
+
+    def __init__(self):
+        self._parts = []
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._parts)
+        self._parts = []
+        return data
+
+
+def _export_chunks(stmt):
+    """Yield result rows in EXPORT_CHUNK_ROWS-sized lists from a streaming cursor."""
+    with db.engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=EXPORT_CHUNK_ROWS).execute(stmt)
+        for rows in result.partitions():
+            yield rows
+
+
+def _export_csv(names, column_chunks):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(names)
+    yield buf.getvalue()
+    for columns in column_chunks:
+        buf.seek(0)
+        buf.truncate()
+        writer.writerows(zip(*columns.values()))
+        yield buf.getvalue()
+
+
+def _export_ndjson(names, column_chunks):
+    dumps = orjson.dumps if orjson is not None else (lambda obj: json.dumps(obj).encode('utf-8'))
+    for columns in column_chunks:
+        yield b''.join(dumps(dict(zip(names, values))) + b'\n' for values in zip(*columns.values()))
+
+
+def _export_parquet(names, column_chunks, pa, pq, types):
+    schema = pa.schema([(name, types[name]) for name in names])
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema)
+    # one row group per chunk, flushed to the client as soon as it is encoded
+    for columns in column_chunks:
+        arrays = []
+        for name in names:
+            if name == 'timestamp':
+                arrays.append(pa.array(columns[name], type=pa.string()).cast(types[name]))
+            else:
+                arrays.append(pa.array(columns[name], type=types[name]))
+        writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=schema))
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+
+def _arrow_type(pa, column):
+    if isinstance(column.type, db.Integer):
+        return pa.int64()
+    if isinstance(column.type, db.Float):
+        return pa.float64()
+    if isinstance(column.type, db.DateTime):
+        return pa.timestamp('us')
+    return pa.string()
+
+
+@app.route("/api/export", methods=["GET"])
+def export_data():
+    """Stream a table's history as CSV, NDJSON or Parquet.
+
+    Query args: ``table=mq|pm``, ``from``/``to`` (iso or epoch, both optional),
+    ``format=csv|ndjson|parquet``, ``fields=`` as in /api/mq-data and
+    ``device_id=`` (one station). Rows
+    come oldest first from a streaming cursor in EXPORT_CHUNK_ROWS chunks, so
+    memory use does not depend on the size of the range.
+    """
+    table = request.args.get('table', 'mq')
+    fmt = request.args.get('format', 'csv')
+    if table not in EXPORT_TABLES:
+        return jsonify({"status": "error", "message": "Invalid 'table' (expected mq or pm)"}), 400
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({"status": "error", "message": "Invalid 'format' (expected csv, ndjson or parquet)"}), 400
+    model, api_fields, filters = EXPORT_TABLES[table]
+    try:
+        names = _parse_projection(api_fields)
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+
+    stmt = select(*_projection_columns(api_fields, names, columnar=True)).where(
+        *filters, *_device_filters(model, _request_device_id()))
+    for arg, op in (('from', '__ge__'), ('to', '__le__')):
+        if request.args.get(arg):
+            bound = _parse_to_utc(request.args[arg])
+            if bound is None:
+                return jsonify({"status": "error", "message": f"Invalid '{arg}' timestamp"}), 400
+            stmt = stmt.where(getattr(model.timestamp, op)(bound.replace(tzinfo=None)))
+    stmt = stmt.order_by(model.timestamp.asc(), model.id.asc())
+
+    zero_filled = PM_ZERO_FILLED if table == 'pm' else ()
+    column_chunks = (_rows_to_columns(names, rows, zero_filled) for rows in _export_chunks(stmt))
+    if fmt == 'csv':
+        body = _export_csv(names, column_chunks)
+    elif fmt == 'ndjson':
+        body = _export_ndjson(names, column_chunks)
+    else:
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            return jsonify({"status": "error", "message": "Parquet export needs pyarrow installed"}), 501
+        types = {name: _arrow_type(pa, api_fields[name]) for name in names}
+        body = _export_parquet(names, column_chunks, pa, pq, types)
+
+    filename = f"{table}_export.{fmt}"
+    return Response(stream_with_context(body), mimetype=EXPORT_FORMATS[fmt],
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
+
 @app.route("/evaluation")
 def evaluation():
     return render_template("evaluation.html")
@@ -646,6 +2051,8 @@ def _debug_db_info():
                 return []
         sensor_cols = cols('sensor_data')
         mq_cols = cols('mq_sensor_data')
+        cur.execute("PRAGMA journal_mode")
+        journal_mode = cur.fetchone()[0]
         try:
             cur.close()
             conn.close()
@@ -654,7 +2061,11 @@ def _debug_db_info():
         return jsonify({
             'db_path': os.path.abspath(db_path),
             'sensor_cols': sensor_cols,
-            'mq_cols': mq_cols
+            'mq_cols': mq_cols,
+            'journal_mode': journal_mode,
+            'maintenance': dict(maintenance_stats, enabled=RETENTION_ENABLED),
+            'checkpoint': checkpoint_stats,
+            'ingest': _ingest_queue_status()
         }), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -690,28 +2101,59 @@ def _debug_xbee_status():
             except Exception:
                 recent_clean.append(repr(item))
 
-        return jsonify({'port': port, 'baud': baud, 'recent_raw': recent_clean}), 200
+        forwarder = dict(getattr(xb, 'forwarder_stats', {}))
+        try:
+            forwarder['queue_depth'] = xb._send_queue.qsize()
+            if xb._spool is not None:
+                forwarder['spool_pending'] = xb._spool.pending
+                forwarder['spool_dropped'] = xb._spool.dropped
+        except Exception:
+            pass
+
+        framer = getattr(xb, '_framer', None)
+        framer_stats = framer.stats() if framer is not None else {}
+
+        return jsonify({'port': port, 'baud': baud, 'recent_raw': recent_clean,
+                        'forwarder': forwarder, 'framer': framer_stats}), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route("/api/evaluation-data", methods=["GET"])
 def evaluation_data():
     try:
-        # Fetch the latest sensor data
-        latest_pm_data = SensorData.query.order_by(SensorData.timestamp.desc()).first()
-        latest_mq_data = MQSensorData.query.order_by(MQSensorData.timestamp.desc()).first()
+        # Served from the shared latest-state snapshot; the database is only
+        # queried to build it when it does not exist yet. ``?device_id=``
+        # answers for one station from its entry in the snapshot.
+        device_id = _request_device_id()
+        etag, state = latest.read()
+        entry = ((state.get('devices') or {}).get(device_id) or {}) if device_id else state
+        # the file may exist with only counts/versions (see _approx_count)
+        if etag is None or not (entry.get('pm') or entry.get('mq')):
+            _seed_latest_state(device_id)
+            etag, state = latest.read()
+            entry = ((state.get('devices') or {}).get(device_id) or {}) if device_id else state
+        pm = entry.get('pm') or {}
+        mq = entry.get('mq') or {}
 
         # Combine data for evaluation
         evaluation_data = {
-            "temperature": latest_mq_data.temperature if latest_mq_data else None,
-            "humidity": latest_mq_data.humidity if latest_mq_data else None,
-            "pm2_5": latest_pm_data.pm2_5 if latest_pm_data else None,
-            "pm10": latest_pm_data.pm10 if latest_pm_data else None,
-            "lpg": latest_mq_data.lpg if latest_mq_data else None,
-            "co": latest_mq_data.co if latest_mq_data else None,
+            "temperature": mq.get('temperature'),
+            "humidity": mq.get('humidity'),
+            "pm2_5": pm.get('pm2_5'),
+            "pm10": pm.get('pm10'),
+            "lpg": mq.get('lpg'),
+            "co": mq.get('co'),
         }
-
-        return jsonify(evaluation_data), 200
+        # SD-AQI is stored per reading at ingest; AQI comes from the PM sub-indices
+        evaluation_data.update(sdaqi.evaluate(pm=pm))
+        evaluation_data["sd_aqi"] = mq.get('sd_aqi')
+        evaluation_data["sd_aqi_level"] = mq.get('sd_aqi_level')
+
+        response = jsonify(evaluation_data)
+        if etag is not None:
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = 'no-cache'
+        return response.make_conditional(request)
     except Exception as e:
         print("Error:", str(e))
         return jsonify({"status": "error", "message": str(e)}), 500
@@ -751,6 +2193,206 @@ def xbee_listener():
             time.sleep(2)
 
 
+# Retention / maintenance worker. Opt-in with RETENTION_ENABLED=1: it expires
+# raw rows and fine-grained rollups in small chunks (one short write
+# transaction each) so ingestion is never blocked for long. Raw rows are only
+# expired once the rollups that outlive them cover every one of them; run
+# scripts/backfill_rollups.py before enabling it on an existing database,
+# otherwise the raw rows are kept and maintenance_stats says why.
+RETENTION_ENABLED = os.environ.get('RETENTION_ENABLED', '0') == '1'
+RETENTION_RAW_DAYS = float(os.environ.get('RETENTION_RAW_DAYS', '7'))
+# resolution -> days to keep; 0 keeps forever
+RETENTION_ROLLUP_DAYS = {
+    '1m': float(os.environ.get('RETENTION_1M_DAYS', '90')),
+    '1h': float(os.environ.get('RETENTION_1H_DAYS', '0')),
+    '1d': float(os.environ.get('RETENTION_1D_DAYS', '0')),
+}
+MAINTENANCE_INTERVAL_SECONDS = float(os.environ.get('MAINTENANCE_INTERVAL_SECONDS', '3600'))
+MAINTENANCE_CHUNK_ROWS = int(os.environ.get('MAINTENANCE_CHUNK_ROWS', '2000'))
+MAINTENANCE_CHUNK_PAUSE = float(os.environ.get('MAINTENANCE_CHUNK_PAUSE', '0.05'))
+MAINTENANCE_VACUUM_PAGES = int(os.environ.get('MAINTENANCE_VACUUM_PAGES', '500'))
+MAINTENANCE_LOCK_FILE = os.path.join(os.path.dirname(DB_FILE), 'maintenance.lock')
+
+CHECKPOINT_LOCK_FILE = os.path.join(os.path.dirname(DB_FILE), 'checkpoint.lock')
+
+maintenance_stats = {"runs": 0, "deleted": {}, "vacuumed_pages": 0, "raw_skipped": None,
+                     "last_run": None, "last_error": None}
+checkpoint_stats = {"runs": 0, "busy": 0, "wal_pages": None, "checkpointed_pages": None, "last_error": None}
+_process_locks = []
+
+
+def _delete_in_chunks(sql, params):
+    """Repeat a ``LIMIT :limit`` DELETE until it runs dry; returns rows deleted."""
+    deleted = 0
+    while True:
+        with db.engine.begin() as conn:
+            count = conn.execute(text(sql), dict(params, limit=MAINTENANCE_CHUNK_ROWS)).rowcount
+        deleted += count
+        if count < MAINTENANCE_CHUNK_ROWS:
+            return deleted
+        # let writers waiting on the lock in between chunks
+        time.sleep(MAINTENANCE_CHUNK_PAUSE)
+
+
+def _incremental_vacuum():
+    """Return free pages to the filesystem a few at a time (auto_vacuum=INCREMENTAL only)."""
+    conn = db.engine.raw_connection()
+    try:
+        cur = conn.cursor()
+        cur.execute("PRAGMA auto_vacuum")
+        if cur.fetchone()[0] != 2:
+            return 0
+        released = 0
+        while True:
+            cur.execute("PRAGMA freelist_count")
+            free = cur.fetchone()[0]
+            if not free:
+                return released
+            pages = min(free, MAINTENANCE_VACUUM_PAGES)
+            # executescript steps the pragma to completion; execute() would free a single page
+            conn.executescript(f"PRAGMA incremental_vacuum({pages});")
+            released += pages
+            time.sleep(MAINTENANCE_CHUNK_PAUSE)
+    finally:
+        conn.close()
+
+
+def _raw_expiry_skip_reason(cutoff_naive):
+    """Why readings older than ``cutoff_naive`` must not be deleted yet, or None.
+
+    Only the rollup resolutions kept at least as long as the raw rows count:
+    each must hold every expiring reading of both views, or the history
+    would be gone for good.
+    """
+    if not _rollups_available():
+        return "rollups are disabled"
+    kept = [r for r, days in RETENTION_ROLLUP_DAYS.items()
+            if r in rollups.RESOLUTIONS and (days <= 0 or days >= RETENTION_RAW_DAYS)]
+    if not kept:
+        return "no rollup resolution is kept as long as the raw readings"
+    for model, field_columns, source in ((SensorData, PM_AGGREGATE_FIELDS, 'pm'),
+                                         (MQSensorData, MQ_AGGREGATE_FIELDS, 'mq')):
+        oldest = db.session.query(func.min(model.timestamp)).filter(model.timestamp < cutoff_naive).scalar()
+        if oldest is None:
+            continue
+        for resolution in kept:
+            if not _rollups_cover(model, source, resolution, list(field_columns), field_columns, oldest):
+                return f"{resolution} rollups do not cover the {source} readings from {oldest.isoformat()}"
+    return None
+
+
+def run_maintenance_once(now=None):
+    """Apply the retention policy once; returns rows deleted per table/resolution."""
+    now = now or datetime.now(timezone.utc).replace(tzinfo=None)
+    deleted = {}
+    raw_skipped = _raw_expiry_skip_reason(now - timedelta(days=RETENTION_RAW_DAYS)) if RETENTION_RAW_DAYS > 0 else None
+    if RETENTION_RAW_DAYS > 0 and not raw_skipped:
+        # DB rows are stored as naive UTC text, so compare in the same format
+        cutoff = (now - timedelta(days=RETENTION_RAW_DAYS)).strftime(DB_TIMESTAMP_FORMAT)
+        deleted[Reading.__tablename__] = _delete_in_chunks(
+            "DELETE FROM reading WHERE id IN "
+            "(SELECT id FROM reading WHERE timestamp < :cutoff ORDER BY timestamp LIMIT :limit)",
+            {"cutoff": cutoff}
+        )
+        if RAW_PAYLOAD_COLUMNS:
+            # payloads of expired readings; ids grow with time, so everything
+            # below the oldest remaining reading is gone
+            deleted[RawPayload.__tablename__] = _delete_in_chunks(
+                "DELETE FROM raw_payload WHERE reading_id IN "
+                "(SELECT reading_id FROM raw_payload WHERE reading_id < "
+                "COALESCE((SELECT MIN(id) FROM reading), (SELECT MAX(reading_id) + 1 FROM raw_payload)) "
+                "LIMIT :limit)",
+                {}
+            )
+    if ROLLUP_COLUMNS:
+        for resolution, days in RETENTION_ROLLUP_DAYS.items():
+            if days <= 0:
+                continue
+            cutoff = rollups.to_epoch(now - timedelta(days=days))
+            deleted['rollup_' + resolution] = _delete_in_chunks(
+                "DELETE FROM reading_rollup WHERE id IN "
+                "(SELECT id FROM reading_rollup WHERE resolution = :resolution AND bucket < :cutoff LIMIT :limit)",
+                {"resolution": resolution, "cutoff": cutoff}
+            )
+    if any(deleted.values()):
+        latest.bump(('pm', 'mq'), reset_counts=True)
+    vacuumed = _incremental_vacuum()
+
+    maintenance_stats["runs"] += 1
+    maintenance_stats["deleted"] = deleted
+    maintenance_stats["vacuumed_pages"] = vacuumed
+    maintenance_stats["raw_skipped"] = raw_skipped
+    maintenance_stats["last_run"] = datetime.now(timezone.utc).isoformat()
+    maintenance_stats["last_error"] = None
+    return deleted
+
+
+def _maintenance_worker():
+    while True:
+        try:
+            with app.app_context():
+                deleted = run_maintenance_once()
+            if any(deleted.values()):
+                print(f"Maintenance: deleted {deleted}")
+        except Exception as e:
+            maintenance_stats["last_error"] = str(e)
+            print(f"Maintenance run failed: {e}")
+        time.sleep(MAINTENANCE_INTERVAL_SECONDS)
+
+
+def _checkpoint_worker():
+    """Run a PASSIVE WAL checkpoint every SQLITE_CHECKPOINT_INTERVAL seconds."""
+    while True:
+        time.sleep(SQLITE_CHECKPOINT_INTERVAL)
+        try:
+            with app.app_context():
+                conn = db.engine.raw_connection()
+                try:
+                    busy, wal_pages, checkpointed = conn.cursor().execute(
+                        "PRAGMA wal_checkpoint(PASSIVE)").fetchone()
+                finally:
+                    conn.close()
+            checkpoint_stats["runs"] += 1
+            checkpoint_stats["busy"] += busy
+            checkpoint_stats["wal_pages"] = wal_pages
+            checkpoint_stats["checkpointed_pages"] = checkpointed
+            checkpoint_stats["last_error"] = None
+        except Exception as e:
+            checkpoint_stats["last_error"] = str(e)
+            print(f"WAL checkpoint failed: {e}")
+
+
+def _acquire_process_lock(path):
+    """Take a non-blocking flock on ``path`` for the life of this process.
+
+    gunicorn imports the app once per worker; background jobs that must run
+    in one process only start where this returns True. The lock is released
+    when that process dies, so a restarted worker picks the job up again.
+    """
+    try:
+        import fcntl
+    except ImportError:
+        return True
+    lock = open(path, 'a')
+    try:
+        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock.close()
+        return False
+    _process_locks.append(lock)
+    return True
+
+
+def _start_background_workers():
+    if RETENTION_ENABLED and _acquire_process_lock(MAINTENANCE_LOCK_FILE):
+        threading.Thread(target=_maintenance_worker, name='maintenance', daemon=True).start()
+    if (SQLITE_JOURNAL_MODE.upper() == 'WAL' and SQLITE_CHECKPOINT_INTERVAL > 0
+            and _acquire_process_lock(CHECKPOINT_LOCK_FILE)):
+        threading.Thread(target=_checkpoint_worker, name='wal-checkpoint', daemon=True).start()
+
+
+_start_background_workers()
+
 
 if __name__ == "__main__":
     # Start the XBee listener in a background daemon thread.
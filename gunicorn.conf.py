@@ -0,0 +1,49 @@
+"""gunicorn hooks.
+
+With INGEST_MODE=queue the web workers only enqueue readings; the master
+starts ingest_writer.py as the single SQLite writer, restarts it if it exits
+and stops it on shutdown.
+"""
+
+import os
+import subprocess
+import sys
+import threading
+import time
+
+_writer = None
+_stopping = False
+
+
+def _spawn_writer(server):
+    global _writer
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ingest_writer.py')
+    _writer = subprocess.Popen([sys.executable, script])
+    server.log.info("Started ingest writer (pid %s)", _writer.pid)
+
+
+def _supervise_writer(server):
+    while not _stopping:
+        time.sleep(1)
+        if _stopping or _writer is None or _writer.poll() is None:
+            continue
+        server.log.warning("Ingest writer exited with %s; restarting", _writer.returncode)
+        _spawn_writer(server)
+
+
+def when_ready(server):
+    if os.environ.get('INGEST_MODE', 'direct') != 'queue':
+        return
+    _spawn_writer(server)
+    threading.Thread(target=_supervise_writer, args=(server,), name='ingest-writer-supervisor', daemon=True).start()
+
+
+def on_exit(server):
+    global _stopping
+    _stopping = True
+    if _writer is not None and _writer.poll() is None:
+        _writer.terminate()
+        try:
+            _writer.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            _writer.kill()
@@ -0,0 +1,196 @@
+"""Durable hand-off of readings from the web workers to the ingest writer.
+
+With INGEST_MODE=queue every gunicorn worker appends validated readings to
+its own segment files under INGEST_QUEUE_DIR and answers the POST right away:
+the request path never takes SQLite's write lock and workers never contend
+with each other. A single writer process (ingest_writer.py) drains all
+segments into SQLite in group commits and stores how far it got in the same
+transaction, so every record is applied exactly once. Records it cannot
+insert are moved to a dead-letter file instead of being retried forever.
+
+Segments are named ``<pid>.<start_ms>.<seq>`` and end in ``.open`` while a
+worker appends to them; they are renamed to ``.sealed`` on rotation or exit
+(or by the writer once the owning process is gone). Records use the same
+framing as the XBee spool: a 4-byte big-endian length and a UTF-8 JSON body.
+"""
+
+import atexit
+import json
+import logging
+import os
+import struct
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+_LEN = struct.Struct('>I')
+OPEN_SUFFIX = '.open'
+SEALED_SUFFIX = '.sealed'
+
+
+class SegmentWriter:
+    """Appends records to this process's current segment (thread-safe)."""
+
+    def __init__(self, directory, segment_bytes=8 * 1024 * 1024, fsync=True):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        self._fd = None
+        self._path = None
+        self._pid = None
+        self._size = 0
+        self._seq = 0
+        self._started_ms = int(time.time() * 1000)
+        atexit.register(self.close)
+
+    def _open(self):
+        if self._pid != os.getpid():
+            # forked (gunicorn preload): never append to the parent's segment
+            self._pid = os.getpid()
+            self._fd = None
+            self._seq = 0
+            self._started_ms = int(time.time() * 1000)
+        os.makedirs(self.directory, exist_ok=True)
+        self._seq += 1
+        stem = '%d.%d.%d' % (self._pid, self._started_ms, self._seq)
+        self._path = os.path.join(self.directory, stem + OPEN_SUFFIX)
+        self._fd = os.open(self._path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        self._size = os.fstat(self._fd).st_size
+        if self.fsync:
+            # the new directory entry has to survive a power cut too
+            dir_fd = os.open(self.directory, os.O_RDONLY)
+            try:
+                os.fsync(dir_fd)
+            finally:
+                os.close(dir_fd)
+
+    def _seal(self):
+        os.close(self._fd)
+        os.rename(self._path, self._path[:-len(OPEN_SUFFIX)] + SEALED_SUFFIX)
+        self._fd = None
+        self._path = None
+
+    def put_many(self, records):
+        """Append ``records`` (JSON-serialisable dicts) with a single write."""
+        data = bytearray()
+        for record in records:
+            body = json.dumps(record, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+            data += _LEN.pack(len(body))
+            data += body
+        view = memoryview(data)
+        with self._lock:
+            if self._fd is None or self._pid != os.getpid():
+                self._open()
+            while view:
+                written = os.write(self._fd, view)
+                view = view[written:]
+            if self.fsync:
+                os.fsync(self._fd)
+            self._size += len(data)
+            if self._size >= self.segment_bytes:
+                self._seal()
+        return len(records)
+
+    def close(self):
+        with self._lock:
+            if self._fd is not None and self._pid == os.getpid():
+                self._seal()
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def list_segments(directory):
+    """Return ``{stem: (path, sealed)}`` ordered by segment start time."""
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return {}
+    segments = []
+    for name in names:
+        for suffix, sealed in ((OPEN_SUFFIX, False), (SEALED_SUFFIX, True)):
+            if name.endswith(suffix):
+                stem = name[:-len(suffix)]
+                try:
+                    pid, started_ms, seq = (int(p) for p in stem.split('.'))
+                except ValueError:
+                    continue
+                segments.append(((started_ms, pid, seq), stem, os.path.join(directory, name), sealed))
+    segments.sort()
+    return {stem: (path, sealed) for _, stem, path, sealed in segments}
+
+
+def seal_orphans(directory):
+    """Seal ``.open`` segments whose process has exited; returns how many."""
+    sealed = 0
+    for stem, (path, is_sealed) in list_segments(directory).items():
+        if is_sealed or _pid_alive(int(stem.split('.')[0])):
+            continue
+        try:
+            os.rename(path, os.path.join(directory, stem + SEALED_SUFFIX))
+            sealed += 1
+        except FileNotFoundError:
+            pass
+    return sealed
+
+
+def read_records(path, offset, max_records, max_bytes=4 * 1024 * 1024):
+    """Read up to ``max_records`` complete records starting at ``offset``.
+
+    Returns ``(records, end_offset, at_end)``. ``at_end`` is True when nothing
+    but an incomplete record is left after ``end_offset`` (a record still being
+    written, or a torn tail if the segment is sealed).
+    """
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        buf = f.read(max_bytes)
+        if len(buf) >= _LEN.size:
+            (first,) = _LEN.unpack_from(buf, 0)
+            if _LEN.size + first > len(buf) == max_bytes:
+                # a single record larger than the read window
+                buf += f.read(_LEN.size + first - len(buf))
+        size = os.fstat(f.fileno()).st_size
+
+    records = []
+    pos = 0
+    while len(records) < max_records and pos + _LEN.size <= len(buf):
+        (length,) = _LEN.unpack_from(buf, pos)
+        end = pos + _LEN.size + length
+        if end > len(buf):
+            break
+        try:
+            records.append(json.loads(bytes(buf[pos + _LEN.size:end])))
+        except ValueError:
+            # never let one bad record wedge the writer
+            logger.warning("Skipping undecodable record at %s:%d", path, offset + pos)
+        pos = end
+    end_offset = offset + pos
+    at_end = end_offset >= size or (len(records) < max_records and offset + len(buf) >= size)
+    return records, end_offset, at_end
+
+
+def dead_letter(path, entries):
+    """Append ``entries`` (JSON-serialisable dicts) to the NDJSON file ``path``.
+
+    Used for records the writer could not apply; the file is fsynced so they
+    are not lost once their segment offset moves past them.
+    """
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    view = memoryview(''.join(json.dumps(e, separators=(',', ':'), ensure_ascii=False, default=str) + '\n'
+                              for e in entries).encode('utf-8'))
+    fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        while view:
+            view = view[os.write(fd, view):]
+        os.fsync(fd)
+    finally:
+        os.close(fd)
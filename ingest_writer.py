@@ -0,0 +1,17 @@
+#!/usr/bin/env python3
+"""Single SQLite writer for INGEST_MODE=queue.
+
+gunicorn.conf.py starts and supervises this process next to the web workers;
+it can also be run by hand: ``INGEST_MODE=queue python3 ingest_writer.py``.
+Only one writer runs at a time; another one exits while the lock is held.
+"""
+
+import os
+
+# read by app.py when it configures the engine (synchronous=FULL)
+os.environ['INGEST_WRITER'] = '1'
+
+import app  # noqa: E402
+
+if __name__ == '__main__':
+    app.run_ingest_writer()
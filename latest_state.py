@@ -0,0 +1,195 @@
+"""Latest-reading snapshot shared by every process that serves or stores data.
+
+The newest PM and MQ readings are kept in a small JSON file next to the
+database. Ingest paths (every gunicorn worker in direct mode, the ingest
+writer in queue mode) merge their newest row into it after committing, under
+an flock, and replace the file atomically. Readers never take the lock or
+touch SQLite: they stat the file and only re-read it when it changed, so
+serving the latest state is a dictionary lookup in the common case.
+
+The snapshot also carries a data version per section: a counter bumped by
+every write to that section (and by deletes, see ``bump``) plus a random
+epoch that changes whenever the file is recreated. Read APIs derive their
+ETags from it, so an unchanged poll is answered without a query.
+
+It keeps an approximate row count per section for paginated views: seeded
+once with COUNT(*) (``set_count``), then moved by every write. Bulk deletes
+drop the count so the next reader seeds it again.
+
+Finally the newest rows are also kept per station under ``devices`` (keyed by
+device id), and counts per station under ``count_key(section, device_id)``,
+so answering for one station stays a dictionary lookup however many report.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - non-POSIX
+    fcntl = None
+
+
+def _coerce(value):
+    # mirror SQLite REAL affinity: numeric strings are stored as numbers
+    if isinstance(value, str):
+        try:
+            return float(value)
+        except ValueError:
+            return value
+    if isinstance(value, int) and not isinstance(value, bool):
+        return float(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def count_key(section, device_id=None):
+    """Key of the row count of ``section``, or of one station's rows in it."""
+    return '%s@%s' % (section, device_id) if device_id else section
+
+
+def _bump(state, sections, added=None):
+    if not state.get('epoch'):
+        state['epoch'] = uuid.uuid4().hex
+    versions = state.setdefault('versions', {})
+    modified = state.setdefault('modified', {})
+    counts = state.get('counts') or {}
+    now = time.time()
+    for section in sections:
+        versions[section] = versions.get(section, 0) + 1
+        modified[section] = now
+    for key, n in (added or {}).items():
+        if key in counts:
+            counts[key] += n
+
+
+def _merge(target, rows):
+    """Store each row of ``rows`` in ``target`` unless it is older; True if any changed."""
+    changed = False
+    for section, row in rows.items():
+        current = target.get(section)
+        if current and current.get('timestamp', '') > row['timestamp']:
+            continue
+        if current != row:
+            target[section] = row
+            changed = True
+    return changed
+
+
+def _clean(rows):
+    return {section: {k: _coerce(v) for k, v in row.items()}
+            for section, row in rows.items() if row and row.get('timestamp')}
+
+
+class LatestState:
+    """The newest row per section ('pm', 'mq'), overall and per station, ordered by timestamp."""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock_path = path + '.lock'
+        self._cache_lock = threading.Lock()
+        self._cache_key = None
+        self._cache = (None, {})
+
+    @contextmanager
+    def _locked(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        with open(self.lock_path, 'a') as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            yield
+
+    def _load(self):
+        try:
+            with open(self.path, 'rb') as f:
+                return json.loads(f.read())
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def _store(self, state):
+        tmp = '%s.%d.tmp' % (self.path, os.getpid())
+        with open(tmp, 'w') as f:
+            json.dump(state, f, separators=(',', ':'))
+        os.replace(tmp, self.path)
+
+    def offer(self, rows, bump=True, added=None, devices=None):
+        """Merge ``{section: row_dict}`` rows, keeping the newest per section.
+
+        Each row needs a ``timestamp`` (naive-UTC datetime or ISO string);
+        a row replaces the stored one unless it is older. With ``bump`` the
+        data version of every offered section is bumped as well, since even
+        an older row changes what the read APIs return, and ``added``
+        (``{count_key: n}``) moves the row counts. ``devices`` maps device
+        ids to rows merged the same way into that station's entry.
+        """
+        rows = _clean(rows)
+        devices = {device_id: _clean(device_rows) for device_id, device_rows in (devices or {}).items()}
+        devices = {device_id: device_rows for device_id, device_rows in devices.items() if device_rows}
+        if not rows and not devices:
+            return
+        sections = set(rows)
+        for device_rows in devices.values():
+            sections.update(device_rows)
+        with self._locked():
+            state = self._load()
+            changed = _merge(state, rows)
+            for device_id, device_rows in devices.items():
+                changed = _merge(state.setdefault('devices', {}).setdefault(device_id, {}), device_rows) or changed
+            if bump:
+                _bump(state, sorted(sections), added)
+            elif not changed and state.get('epoch'):
+                return
+            state.setdefault('epoch', uuid.uuid4().hex)
+            self._store(state)
+
+    def bump(self, sections, reset_counts=False):
+        """Bump the data version of ``sections`` after rows were changed or deleted."""
+        with self._locked():
+            state = self._load()
+            _bump(state, sections)
+            if reset_counts:
+                counts = state.get('counts', {})
+                for key in list(counts):
+                    if key.split('@', 1)[0] in sections:
+                        del counts[key]
+            self._store(state)
+
+    def set_count(self, section, count):
+        """Seed the row count of ``section`` unless another process already did."""
+        with self._locked():
+            state = self._load()
+            counts = state.setdefault('counts', {})
+            if section in counts:
+                return
+            counts[section] = count
+            state.setdefault('epoch', uuid.uuid4().hex)
+            self._store(state)
+
+    def read(self):
+        """Return ``(etag, state)``; ``etag`` is None while no snapshot exists."""
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None, {}
+        key = (st.st_ino, st.st_mtime_ns, st.st_size)
+        with self._cache_lock:
+            if key == self._cache_key:
+                return self._cache
+        try:
+            with open(self.path, 'rb') as f:
+                raw = f.read()
+            state = json.loads(raw)
+        except (FileNotFoundError, ValueError):
+            return None, {}
+        cached = (hashlib.sha1(raw).hexdigest(), state)
+        with self._cache_lock:
+            self._cache_key = key
+            self._cache = cached
+        return cached
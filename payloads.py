@@ -0,0 +1,53 @@
+"""Compressed storage of the raw reading payloads.
+
+Each accepted reading keeps its original JSON once, in the ``raw_payload``
+table keyed by its ``reading`` id, instead of as a text copy next to the
+typed columns. Payloads are small and repetitive (the same keys every
+frame), so they are deflated with a preset dictionary made of typical frames:
+the keys then cost a back-reference each and a frame shrinks to about a third.
+
+Dictionaries are numbered and every stored row records which one it was
+compressed with. Never change a published dictionary; add a new id and point
+CURRENT_DICT_ID at it, old rows keep decompressing with theirs.
+"""
+
+import json
+import zlib
+
+# zlib only reads the last 32 KiB of a dictionary and prefers matches near its
+# end, so the most common strings come last.
+DICTIONARIES = {
+    1: (
+        b'{"dust_density":0.0,"pm2_5":0.0,"pm10":0.0,"timestamp":"2025-01-01T00:00:00.000000"}'
+        b'{"LPG":0.000,"CO":0.000,"Smoke":0.000,"CO_MQ7":0.000,"CH4":0.000,"CO_MQ9":0.000,'
+        b'"CO2":0.000,"NH3":0.000,"NOx":0.000,"Alcohol":0.000,"Benzene":0.000,"H2":0.000,'
+        b'"Air":0.000,"Temperature":0.00,"Humidity":0.00,"SD_AQI":0.00,'
+        b'"SD_AQI_level":"Good","SD_AQI_level":"Moderate","SD_AQI_level":"Excellent",'
+        b'"timestamp_ms":0,"timestamp":"2026-01-01T00:00:00.000000"}'
+    ),
+}
+CURRENT_DICT_ID = 1
+
+COMPRESS_LEVEL = 9
+
+
+def encode(data):
+    """Serialize one reading the way it is stored (compact JSON, UTF-8)."""
+    try:
+        return json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    except (TypeError, ValueError):
+        return str(data).encode('utf-8')
+
+
+def compress(data, dict_id=CURRENT_DICT_ID):
+    """Return ``(dict_id, blob)`` for a reading (dict) or an already encoded payload."""
+    raw = data if isinstance(data, bytes) else data.encode('utf-8') if isinstance(data, str) else encode(data)
+    # raw deflate: the zlib header and checksum would add 6 bytes per row
+    c = zlib.compressobj(COMPRESS_LEVEL, zlib.DEFLATED, -15, zdict=DICTIONARIES[dict_id])
+    return dict_id, c.compress(raw) + c.flush()
+
+
+def decompress(dict_id, blob):
+    """Inverse of ``compress``; returns the payload as text."""
+    d = zlib.decompressobj(-15, zdict=DICTIONARIES[dict_id])
+    return (d.decompress(blob) + d.flush()).decode('utf-8')
@@ -0,0 +1,80 @@
+"""Minute/hour/day rollups of sensor readings.
+
+Shared by app.py (incremental update at ingest time) and
+scripts/backfill_rollups.py. Each ``reading_rollup`` row holds count, sum,
+min, max and the latest value of one field in one time bucket, so long-range
+reads touch one row per bucket instead of every reading.
+
+Rows are merged with an upsert, so partial aggregates can be applied in any
+order (one reading, a batch, or a backfill chunk) and still add up.
+"""
+
+import calendar
+
+# resolution -> bucket width in seconds
+RESOLUTIONS = {'1m': 60, '1h': 3600, '1d': 86400}
+
+# source -> rolled-up columns of mq_sensor_data / sensor_data
+FIELDS = {
+    'mq': ('lpg', 'co', 'smoke', 'co_mq7', 'ch4', 'co_mq9', 'co2', 'nh3', 'nox',
+           'alcohol', 'benzene', 'h2', 'air', 'temperature', 'humidity', 'sd_aqi'),
+    'pm': ('dust', 'pm2_5', 'pm10'),
+}
+
+UPSERT_SQL = """
+INSERT INTO reading_rollup (source, resolution, field, bucket, count, total, minimum, maximum, latest, latest_ts)
+VALUES (:source, :resolution, :field, :bucket, :count, :total, :minimum, :maximum, :latest, :latest_ts)
+ON CONFLICT (source, resolution, field, bucket) DO UPDATE SET
+    count = count + excluded.count,
+    total = total + excluded.total,
+    minimum = min(minimum, excluded.minimum),
+    maximum = max(maximum, excluded.maximum),
+    latest = CASE WHEN excluded.latest_ts >= latest_ts THEN excluded.latest ELSE latest END,
+    latest_ts = max(latest_ts, excluded.latest_ts)
+"""
+
+
+def to_epoch(ts):
+    """Seconds since the epoch for a naive-UTC datetime."""
+    return calendar.timegm(ts.timetuple()) + ts.microsecond / 1e6
+
+
+def accumulate(acc, source, ts, values):
+    """Fold one reading into ``acc``.
+
+    ``ts`` is the reading's naive-UTC datetime and ``values`` maps column
+    names to values; missing or non-numeric values are skipped.
+    """
+    epoch = to_epoch(ts)
+    for field in FIELDS[source]:
+        value = values.get(field)
+        if value is None:
+            continue
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            continue
+        for resolution, seconds in RESOLUTIONS.items():
+            key = (source, resolution, field, int(epoch) // seconds * seconds)
+            cur = acc.get(key)
+            if cur is None:
+                acc[key] = [1, value, value, value, value, epoch]
+                continue
+            cur[0] += 1
+            cur[1] += value
+            if value < cur[2]:
+                cur[2] = value
+            if value > cur[3]:
+                cur[3] = value
+            if epoch >= cur[5]:
+                cur[4] = value
+                cur[5] = epoch
+
+
+def upsert_params(acc):
+    """Turn an accumulator into parameter dicts for UPSERT_SQL."""
+    return [{
+        'source': source, 'resolution': resolution, 'field': field, 'bucket': bucket,
+        'count': count, 'total': total, 'minimum': minimum, 'maximum': maximum,
+        'latest': latest, 'latest_ts': latest_ts,
+    } for (source, resolution, field, bucket), (count, total, minimum, maximum, latest, latest_ts) in acc.items()]
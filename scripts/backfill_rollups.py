@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Rebuild the `reading_rollup` table from the raw reading tables.
+
+The app keeps rollups up to date at ingest time; run this once after the
+`reading_rollup` table is first created (scripts/migrate_db.py), or after
+running with ROLLUPS_ENABLED=0, to cover the readings stored before that.
+
+For each source the script clears its rollups and snapshots the highest row
+id in one short write transaction, then folds the rows up to that id in chunks.
+Rows ingested while it runs are rolled up by the app itself, so it is safe to
+run against a live database.
+
+Usage:
+    python3 scripts/backfill_rollups.py --db instance/iot_data.db
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import rollups  # noqa: E402
+
+SOURCE_TABLES = {'mq': 'mq_sensor_data', 'pm': 'sensor_data'}
+
+
+def parse_timestamp(val):
+    if not val:
+        return None
+    try:
+        dt = datetime.fromisoformat(str(val))
+    except ValueError:
+        return None
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return dt
+
+
+def backfill_source(conn, source, chunk_size):
+    table = SOURCE_TABLES[source]
+    existing = [row[1] for row in conn.execute(f"PRAGMA table_info('{table}');")]
+    if not existing:
+        print(f"Table '{table}' does not exist; skipping {source} rollups.")
+        return 0
+    fields = [f for f in rollups.FIELDS[source] if f in existing]
+
+    conn.execute("BEGIN IMMEDIATE;")
+    max_id = conn.execute(f"SELECT MAX(id) FROM {table};").fetchone()[0] or 0
+    conn.execute("DELETE FROM reading_rollup WHERE source = ?;", (source,))
+    conn.commit()
+    print(f"Rebuilding {source} rollups from {table} rows up to id {max_id}")
+
+    last_id = 0
+    folded = 0
+    cols = ', '.join(['id', 'timestamp'] + fields)
+    while last_id < max_id:
+        rows = conn.execute(
+            f"SELECT {cols} FROM {table} WHERE id > ? AND id <= ? ORDER BY id LIMIT ?;",
+            (last_id, max_id, chunk_size)
+        ).fetchall()
+        if not rows:
+            break
+        acc = {}
+        for row in rows:
+            ts = parse_timestamp(row[1])
+            values = dict(zip(fields, row[2:]))
+            if ts is None:
+                continue
+            rollups.accumulate(acc, source, ts, values)
+            folded += 1
+        conn.execute("BEGIN;")
+        conn.executemany(rollups.UPSERT_SQL, rollups.upsert_params(acc))
+        conn.commit()
+        last_id = rows[-1][0]
+        print(f"  {source}: up to id {last_id} ({folded} readings)")
+    return folded
+
+
+def backfill(db_path, sources, chunk_size):
+    if not os.path.exists(db_path):
+        print(f"Database file {db_path} does not exist.")
+        return 1
+    conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+    try:
+        if conn.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='reading_rollup';").fetchone() is None:
+            print("Table 'reading_rollup' does not exist. Run scripts/migrate_db.py first.")
+            return 1
+        for source in sources:
+            folded = backfill_source(conn, source, chunk_size)
+            print(f"{source}: {folded} readings rolled up")
+        print("Backfill complete.")
+        return 0
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    p = argparse.ArgumentParser()
+    default_db = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'instance', 'iot_data.db'))
+    p.add_argument('--db', default=default_db, help=f'Path to sqlite DB file (default: {default_db})')
+    p.add_argument('--source', choices=['all'] + list(SOURCE_TABLES), default='all', help='Which readings to roll up')
+    p.add_argument('--chunk', type=int, default=5000, help='Rows folded per transaction')
+    args = p.parse_args()
+
+    sources = list(SOURCE_TABLES) if args.source == 'all' else [args.source]
+    sys.exit(backfill(args.db, sources, args.chunk))
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Time the read APIs in their row and columnar response formats.
+
+Runs the app in-process (Flask test client, rate limiting off) against the
+configured database and prints the median time and body size per URL, once
+with the JSON encoder in use (orjson if installed) and once with Flask's
+jsonify. Point it at a copy of a production-sized database.
+
+Usage:
+    python3 scripts/bench_read_formats.py [--runs 5] [URL ...]
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import app as iot_app  # noqa: E402
+
+DEFAULT_URLS = [
+    '/api/mq-data',
+    '/api/mq-data?format=columnar',
+    '/api/mq-data?fields=CO,CO2',
+    '/api/mq-data?fields=CO,CO2&format=columnar',
+    '/api/pm-data?per_page=1000',
+    '/api/pm-data?per_page=1000&format=columnar',
+]
+
+
+def bench(client, url, runs):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        response = client.get(url)
+        timings.append(time.perf_counter() - start)
+    if response.status_code != 200:
+        raise SystemExit(f"{url}: HTTP {response.status_code}")
+    return statistics.median(timings) * 1000, len(response.data)
+
+
+if __name__ == '__main__':
+    p = argparse.ArgumentParser()
+    p.add_argument('--runs', type=int, default=5, help='Requests per URL (median is reported)')
+    p.add_argument('urls', nargs='*', default=DEFAULT_URLS)
+    args = p.parse_args()
+
+    iot_app.limiter.enabled = False
+    client = iot_app.app.test_client()
+    encoders = [('orjson', iot_app.orjson), ('jsonify', None)] if iot_app.orjson else [('jsonify', None)]
+    for name, module in encoders:
+        iot_app.orjson = module
+        print(f"encoder: {name}")
+        for url in args.urls:
+            ms, size = bench(client, url, args.runs)
+            print(f"  {url:50s} {ms:9.1f} ms {size / 1e6:8.2f} MB")
@@ -4,32 +4,84 @@ Simple SQLite migration script for IoT-Babar-Scuba-Diving-AQI
 
 This script will:
 - Back up the existing `iot_data.db` to `iot_data.db.bak` (only if the DB exists)
-- Ensure `sensor_data` and `mq_sensor_data` tables exist with all expected columns
+- Ensure `reading`, `raw_payload`, `reading_rollup` and `ingest_offset` tables exist with all expected columns
 - For existing tables, add any missing columns via `ALTER TABLE ADD COLUMN`
+- Move the raw JSON payloads of the former reading tables into the
+  compressed `raw_payload` table (see payloads.py)
+- Fold the former `sensor_data` / `mq_sensor_data` tables into `reading`
+  (one row per frame, new ids in timestamp order, resumable chunks) and
+  replace them with views of the same name
+- Recreate those views when their columns changed
+- Create the indexes used by the read endpoints (`CREATE INDEX IF NOT EXISTS`)
+- Give every reading a uuid (set-based, in chunks)
+- Pad timestamps stored without a fraction to the 'YYYY-MM-DD HH:MM:SS.ffffff'
+  form of the others (in chunks), so they compare correctly as text
+- Record SCHEMA_VERSION in `PRAGMA user_version`
+
+app.py loads this module on startup and only calls `migrate()` when the
+database's user_version is behind SCHEMA_VERSION, so an up-to-date database
+costs a single PRAGMA read.
 
 Usage:
     python3 scripts/migrate_db.py --db iot_data.db
+    python3 scripts/migrate_db.py --db iot_data.db --indexes-only --yes
+
+`--indexes-only` skips the backup and column checks so it can be run against a
+live database: each index is built in its own short transaction and writers
+simply wait on `busy_timeout` while it is built.
+
+New databases are created with `auto_vacuum = INCREMENTAL` so the retention
+worker in app.py can hand freed pages back to the filesystem. Pass
+`--incremental-vacuum` to convert an existing database (this runs a full
+VACUUM, so stop the app first). Moving the raw payloads and merging the
+reading tables free most of the pages they used, but the file only shrinks
+after a VACUUM: pass `--vacuum` (again with the app stopped).
+
+Merging the reading tables copies every legacy row. gunicorn workers run the
+migration on import and wait for it on the lock, so for a large database run
+this script once before deploying; a run interrupted mid-merge resumes where
+it stopped. Merged rows get new ids, so `/api/stream` and `after_id` cursors
+taken before the merge are stale: they are below every new id, so a resuming
+stream catches up from the start (or is sent a reset event) and open
+dashboards should be reloaded.
 
 Be cautious: ALTERs are best-effort and SQLite has limitations (no DROP COLUMN, etc.).
 """
 
 import sqlite3
-import shutil
 import argparse
 import os
 import sys
 
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import payloads  # noqa: E402
+
+# Bump whenever EXPECTED / EXPECTED_INDEXES change or a data migration is
+# added, so existing databases get migrated on the next app start.
+SCHEMA_VERSION = 4
+
+# Columns of each sensor family in the `reading` table, in the order the
+# compatibility views expose them
+PM_FIELDS = ['dust', 'pm2_5', 'pm10']
+MQ_FIELDS = ['lpg', 'co', 'smoke', 'co_mq7', 'ch4', 'co_mq9', 'co2', 'nh3', 'nox',
+             'alcohol', 'benzene', 'h2', 'air', 'temperature', 'humidity']
+MQ_DERIVED = ['sd_aqi', 'sd_aqi_level']
+
 EXPECTED = {
-    'sensor_data': [
+    # one row per received frame; has_pm / has_mq say which sensor families
+    # it carried, the other family's columns stay NULL
+    'reading': [
         ( 'id', 'INTEGER PRIMARY KEY' ),
+        ( 'timestamp', 'TEXT' ),
+        ( 'uuid', 'TEXT' ),
+        # reporting station (XBee source address or payload field); NULL for
+        # frames stored before stations were told apart
+        ( 'device_id', 'TEXT' ),
+        ( 'has_pm', 'INTEGER NOT NULL DEFAULT 0' ),
+        ( 'has_mq', 'INTEGER NOT NULL DEFAULT 0' ),
         ( 'dust', 'REAL' ),
         ( 'pm2_5', 'REAL' ),
         ( 'pm10', 'REAL' ),
-        ( 'timestamp', 'TEXT' ),
-        ( 'uuid', 'TEXT' )
-    ],
-    'mq_sensor_data': [
-        ( 'id', 'INTEGER PRIMARY KEY' ),
         ( 'lpg', 'REAL' ),
         ( 'co', 'REAL' ),
         ( 'smoke', 'REAL' ),
@@ -45,13 +97,98 @@ EXPECTED = {
         ( 'air', 'REAL' ),
         ( 'temperature', 'REAL' ),
         ( 'humidity', 'REAL' ),
-        ( 'timestamp', 'TEXT' ),
-        ( 'uuid', 'TEXT' ),
         ( 'sd_aqi', 'REAL' ),
         ( 'sd_aqi_level', 'TEXT' )
+    ],
+    # original JSON of each reading, deflated (see payloads.py)
+    'raw_payload': [
+        ( 'reading_id', 'INTEGER PRIMARY KEY' ),
+        ( 'dict_id', 'INTEGER NOT NULL' ),
+        ( 'payload', 'BLOB NOT NULL' )
+    ],
+    # minute/hour/day aggregates maintained at ingest (see rollups.py)
+    'reading_rollup': [
+        ( 'id', 'INTEGER PRIMARY KEY' ),
+        ( 'source', 'TEXT NOT NULL' ),
+        ( 'resolution', 'TEXT NOT NULL' ),
+        ( 'field', 'TEXT NOT NULL' ),
+        ( 'bucket', 'INTEGER NOT NULL' ),
+        ( 'count', 'INTEGER NOT NULL' ),
+        ( 'total', 'REAL NOT NULL' ),
+        ( 'minimum', 'REAL' ),
+        ( 'maximum', 'REAL' ),
+        ( 'latest', 'REAL' ),
+        ( 'latest_ts', 'REAL' )
+    ],
+    # how far the ingest writer got in each queue segment (INGEST_MODE=queue)
+    'ingest_offset': [
+        ( 'segment', 'TEXT PRIMARY KEY' ),
+        ( 'position', 'INTEGER NOT NULL' )
     ]
 }
 
+# The former reading tables, now read-only views over `reading`, so the
+# existing queries keep working: view -> (flag column, columns). A view whose
+# columns differ from these is recreated.
+EXPECTED_VIEWS = {
+    'sensor_data': ('has_pm', ['id'] + PM_FIELDS + ['timestamp', 'uuid', 'device_id']),
+    'mq_sensor_data': ('has_mq', ['id'] + MQ_FIELDS + ['timestamp', 'uuid'] + MQ_DERIVED + ['device_id']),
+}
+
+# name -> (table, columns). Names match what SQLAlchemy generates for the
+# models in app.py so create_all() and this script agree on a fresh DB.
+EXPECTED_INDEXES = {
+    # retention expires frames by age
+    'ix_reading_timestamp': ('reading', ['timestamp']),
+    'ix_reading_uuid': ('reading', ['uuid']),
+    # (timestamp, rowid) order of each family for the views' keyset pages;
+    # SQLite uses them because the view's WHERE repeats the index's
+    'ix_reading_pm_timestamp': ('reading', ['timestamp']),
+    'ix_reading_mq_timestamp': ('reading', ['timestamp']),
+    # the same per station: `device_id = ?` filters walk one station's rows
+    # in (timestamp, rowid) order
+    'ix_reading_pm_device_timestamp': ('reading', ['device_id', 'timestamp']),
+    'ix_reading_mq_device_timestamp': ('reading', ['device_id', 'timestamp']),
+    # conflict target of the rollup upsert
+    'ux_reading_rollup_key': ('reading_rollup', ['source', 'resolution', 'field', 'bucket']),
+    # lets the retention worker expire one resolution by bucket
+    'ix_reading_rollup_resolution_bucket': ('reading_rollup', ['resolution', 'bucket']),
+}
+
+UNIQUE_INDEXES = {'ux_reading_rollup_key'}
+
+# name -> WHERE clause of partial indexes
+PARTIAL_INDEXES = {
+    'ix_reading_pm_timestamp': 'has_pm = 1',
+    'ix_reading_mq_timestamp': 'has_mq = 1',
+    'ix_reading_pm_device_timestamp': 'has_pm = 1',
+    'ix_reading_mq_device_timestamp': 'has_mq = 1',
+}
+
+# How long a single index build waits for other writers before giving up (ms)
+BUSY_TIMEOUT_MS = 30000
+
+# Rows given a uuid per transaction by backfill_uuids()
+UUID_BACKFILL_CHUNK = 5000
+
+# Id range whose timestamps normalize_timestamps() rewrites per transaction
+TIMESTAMP_CHUNK = 5000
+
+# Payloads moved per transaction by move_raw_payloads()
+RAW_PAYLOAD_CHUNK = 5000
+
+# Legacy rows moved into `reading` per transaction by merge_reading_tables()
+MERGE_CHUNK = 5000
+
+# A random (version 4) uuid generated inside SQLite, so the backfill is one
+# UPDATE per chunk instead of a round trip per row.
+UUID4_SQL = (
+    "lower(hex(randomblob(4))) || '-' || lower(hex(randomblob(2))) || '-4' || "
+    "substr(lower(hex(randomblob(2))), 2) || '-' || "
+    "substr('89ab', 1 + (abs(random()) % 4), 1) || substr(lower(hex(randomblob(2))), 2) || '-' || "
+    "lower(hex(randomblob(6)))"
+)
+
 
 def table_exists(conn, table):
     cur = conn.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?;", (table,))
@@ -79,21 +216,309 @@ def add_column(conn, table, name, typ):
     conn.commit()
 
 
+def index_exists(conn, name):
+    cur = conn.execute("SELECT name FROM sqlite_master WHERE type='index' AND name=?;", (name,))
+    return cur.fetchone() is not None
+
+
+def create_index(conn, name, table, cols, unique=False, where=None):
+    sql = f"CREATE {'UNIQUE ' if unique else ''}INDEX IF NOT EXISTS {name} ON {table} ({', '.join(cols)})"
+    sql += f" WHERE {where};" if where else ";"
+    print(f"Creating index {name} -> {sql}")
+    conn.execute(sql)
+    conn.commit()
+
+
+def ensure_indexes(conn):
+    """Create any missing index from EXPECTED_INDEXES; returns how many were built."""
+    built = 0
+    for name, (table, cols) in EXPECTED_INDEXES.items():
+        if not table_exists(conn, table) or index_exists(conn, name):
+            continue
+        existing = get_columns(conn, table)
+        missing = [c for c in cols if c not in existing]
+        if missing:
+            print(f"Skipping index {name}: {table} has no column(s) {missing}")
+            continue
+        create_index(conn, name, table, cols, unique=name in UNIQUE_INDEXES, where=PARTIAL_INDEXES.get(name))
+        built += 1
+    if built:
+        # refresh planner statistics so the new indexes are picked up
+        conn.execute("ANALYZE;")
+        conn.commit()
+    return built
+
+
+def enable_incremental_vacuum(conn):
+    mode = conn.execute("PRAGMA auto_vacuum;").fetchone()[0]
+    if mode == 2:
+        print("auto_vacuum is already INCREMENTAL")
+        return
+    print("Switching auto_vacuum to INCREMENTAL (full VACUUM, may take a while)")
+    conn.execute("PRAGMA auto_vacuum = INCREMENTAL;")
+    conn.execute("VACUUM;")
+
+
+def backfill_uuids(conn, table):
+    """Give rows without a uuid a random one; returns how many were updated."""
+    if 'uuid' not in get_columns(conn, table):
+        return 0
+    total = 0
+    while True:
+        cur = conn.execute(
+            f"UPDATE {table} SET uuid = {UUID4_SQL} WHERE id IN "
+            f"(SELECT id FROM {table} WHERE uuid IS NULL OR uuid = '' LIMIT ?);",
+            (UUID_BACKFILL_CHUNK,)
+        )
+        conn.commit()
+        total += cur.rowcount
+        if cur.rowcount < UUID_BACKFILL_CHUNK:
+            break
+    if total:
+        print(f"Backfilled uuid for {total} rows in {table}")
+    return total
+
+
+def normalize_timestamps(conn):
+    """Pad reading timestamps that have no fractional seconds; returns how many changed.
+
+    Rows stamped by the former CURRENT_TIMESTAMP default were stored as
+    'YYYY-MM-DD HH:MM:SS', every other row (and every bound the app compares
+    them with) as 'YYYY-MM-DD HH:MM:SS.ffffff', so text comparisons were off
+    exactly at the boundaries.
+    """
+    max_id = conn.execute("SELECT MAX(id) FROM reading;").fetchone()[0] or 0
+    total = 0
+    for start in range(0, max_id, TIMESTAMP_CHUNK):
+        cur = conn.execute(
+            "UPDATE reading SET timestamp = timestamp || '.000000' "
+            "WHERE id > ? AND id <= ? AND length(timestamp) = 19;",
+            (start, start + TIMESTAMP_CHUNK)
+        )
+        conn.commit()
+        total += cur.rowcount
+    if total:
+        print(f"Normalized {total} timestamps in reading")
+    return total
+
+
+def move_raw_payloads(conn):
+    """Compress the legacy mq_sensor_data.raw_payload texts into the raw_payload table.
+
+    sensor_data held a second copy of the same JSON and is left alone:
+    merge_reading_tables() drops both tables afterwards. Returns how many
+    payloads were moved.
+    """
+    if not table_exists(conn, 'raw_payload') or not table_exists(conn, 'mq_sensor_data'):
+        return 0
+    if 'raw_payload' not in get_columns(conn, 'mq_sensor_data'):
+        return 0
+    moved = 0
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            "SELECT id, raw_payload FROM mq_sensor_data WHERE id > ? AND raw_payload IS NOT NULL "
+            "ORDER BY id LIMIT ?;",
+            (last_id, RAW_PAYLOAD_CHUNK)
+        ).fetchall()
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        params = [(row_id,) + payloads.compress(raw) for row_id, raw in rows]
+        # OR IGNORE: an interrupted migration simply starts over
+        conn.executemany(
+            "INSERT OR IGNORE INTO raw_payload (reading_id, dict_id, payload) VALUES (?, ?, ?);", params)
+        conn.commit()
+        moved += len(rows)
+    if moved:
+        print(f"Moved {moved} raw payloads into raw_payload")
+    return moved
+
+
+def view_exists(conn, name):
+    cur = conn.execute("SELECT name FROM sqlite_master WHERE type='view' AND name=?;", (name,))
+    return cur.fetchone() is not None
+
+
+def create_view(conn, name, flag, cols):
+    sql = f"CREATE VIEW IF NOT EXISTS {name} AS SELECT {', '.join(cols)} FROM reading WHERE {flag} = 1;"
+    print(f"Creating view {name} -> {sql}")
+    conn.execute(sql)
+
+
+def merge_in_progress(conn):
+    """True when an earlier merge_reading_tables() run was interrupted."""
+    if not table_exists(conn, 'reading') or not any(table_exists(conn, t) for t in EXPECTED_VIEWS):
+        return False
+    return conn.execute("SELECT 1 FROM reading LIMIT 1;").fetchone() is not None
+
+
+def merge_reading_tables(conn):
+    """Move the legacy sensor_data / mq_sensor_data tables into `reading`.
+
+    Legacy ingest wrote one row to each table per frame without linking them,
+    so rows are moved one to one, oldest first across both tables, and get
+    new ids in timestamp order. The ids start above every legacy id (and every
+    raw_payload key), so the MQ rows' payloads are simply re-keyed and a
+    stream cursor from before the migration is older than every new row.
+
+    The all-zero PM rows written for MQ-only frames are dropped. MQ rows are
+    all kept with has_mq = 1, including those without any gas value: they
+    were in mq_sensor_data before and may own a raw payload.
+
+    Each chunk of MERGE_CHUNK rows is inserted, re-keyed and deleted from the
+    legacy tables in one short transaction, so an interrupted run (e.g. a
+    gunicorn worker killed during startup) resumes where it stopped. The
+    emptied tables are then replaced by views. Returns how many rows were
+    copied.
+    """
+    legacy = [t for t in EXPECTED_VIEWS if table_exists(conn, t)]
+    if not legacy:
+        return 0
+    reading_cols = get_columns(conn, 'reading')
+    # src -> (table, has_pm, has_mq, filter of the rows worth keeping, columns)
+    sources = {}
+    if 'mq_sensor_data' in legacy:
+        existing = get_columns(conn, 'mq_sensor_data')
+        sources['mq'] = ('mq_sensor_data', 0, 1, None,
+                         [c for c in MQ_FIELDS + MQ_DERIVED + ['timestamp', 'uuid'] if c in existing and c in reading_cols])
+    if 'sensor_data' in legacy:
+        existing = get_columns(conn, 'sensor_data')
+        values = [c for c in PM_FIELDS if c in existing]
+        # rows with no PM value, or only zeros, were placeholders for MQ-only frames
+        keep = (f"({' OR '.join(f'{c} IS NOT NULL' for c in values)}) "
+                f"AND ({' OR '.join(f'{c} IS NOT 0' for c in values)})") if values else '0'
+        sources['pm'] = ('sensor_data', 1, 0, keep, values + [c for c in ('timestamp', 'uuid') if c in existing])
+    for table in legacy:
+        # walked in (timestamp, id) order below; dropped with the table
+        conn.execute(f"CREATE INDEX IF NOT EXISTS ix_{table}_merge ON {table} (timestamp, id);")
+    conn.commit()
+
+    next_id = conn.execute("SELECT MAX(id) FROM reading;").fetchone()[0]
+    if next_id is None:
+        bounds = [f"(SELECT MAX(id) FROM {table})" for table in legacy]
+        if table_exists(conn, 'raw_payload'):
+            bounds.append("(SELECT MAX(reading_id) FROM raw_payload)")
+        next_id = conn.execute(f"SELECT MAX(0, {', '.join(bounds)});").fetchone()[0]
+    next_id += 1
+
+    oldest = ' UNION ALL '.join(
+        f"SELECT * FROM (SELECT timestamp, '{src}' AS src, id FROM {table} "
+        f"ORDER BY timestamp, id LIMIT {MERGE_CHUNK})"
+        for src, (table, *_) in sources.items()
+    ) + f" ORDER BY timestamp, src, id LIMIT {MERGE_CHUNK};"
+    copied = 0
+    while True:
+        conn.execute("BEGIN;")
+        try:
+            chunk = conn.execute(oldest).fetchall()
+            if not chunk:
+                conn.rollback()
+                break
+            ids = {src: [row_id for _, s, row_id in chunk if s == src] for src in sources}
+            kept = {}
+            for src, (table, _, _, keep, _) in sources.items():
+                kept[src] = set(ids[src])
+                if keep is not None and ids[src]:
+                    kept[src] = {r[0] for r in conn.execute(
+                        f"SELECT id FROM {table} WHERE id IN ({', '.join('?' * len(ids[src]))}) AND {keep};",
+                        ids[src])}
+            # new ids follow the chunk's (timestamp, src, id) order across both tables
+            renumbered = {src: [] for src in sources}
+            for _, src, row_id in chunk:
+                if row_id in kept[src]:
+                    renumbered[src].append((next_id, row_id))
+                    next_id += 1
+            for src, (table, has_pm, has_mq, _, cols) in sources.items():
+                conn.executemany(
+                    f"INSERT INTO reading (id, has_pm, has_mq, {', '.join(cols)}) "
+                    f"SELECT ?, {has_pm}, {has_mq}, {', '.join(cols)} FROM {table} WHERE id = ?;", renumbered[src])
+                if src == 'mq' and table_exists(conn, 'raw_payload'):
+                    conn.executemany("UPDATE raw_payload SET reading_id = ? WHERE reading_id = ?;", renumbered[src])
+                conn.executemany(f"DELETE FROM {table} WHERE id = ?;", [(row_id,) for row_id in ids[src]])
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        copied += sum(len(rows) for rows in renumbered.values())
+        print(f"Merged {copied} rows into reading")
+
+    conn.execute("BEGIN;")
+    try:
+        for table in legacy:
+            print(f"Dropping legacy table {table}")
+            conn.execute(f"DROP TABLE {table};")
+        for name, (flag, cols) in EXPECTED_VIEWS.items():
+            create_view(conn, name, flag, cols)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    print(f"Merged {copied} rows from {', '.join(legacy)} into reading (run with --vacuum to shrink the file)")
+    return copied
+
+
+def ensure_views(conn):
+    for name, (flag, cols) in EXPECTED_VIEWS.items():
+        if table_exists(conn, name):
+            continue
+        if view_exists(conn, name):
+            if get_columns(conn, name) == cols:
+                continue
+            # views cannot be altered; replacing one is cheap (no data moves)
+            print(f"Recreating view {name} with columns {cols}")
+            conn.execute(f"DROP VIEW {name};")
+        create_view(conn, name, flag, cols)
+    conn.commit()
+
+
+def get_user_version(conn):
+    return conn.execute("PRAGMA user_version;").fetchone()[0]
+
+
 def backup_db(db_path):
     bak = db_path + '.bak'
     print(f"Backing up {db_path} -> {bak}")
-    shutil.copy2(db_path, bak)
+    # The app runs in WAL mode, so recent commits may still live in the -wal
+    # file; the online backup API copies a consistent snapshot including them.
+    src = sqlite3.connect(db_path)
+    dst = sqlite3.connect(bak)
+    try:
+        src.backup(dst)
+    finally:
+        dst.close()
+        src.close()
+
 
+def migrate(db_path, auto_yes=False, indexes_only=False, incremental_vacuum=False, vacuum=False):
+    if indexes_only:
+        conn = sqlite3.connect(db_path, timeout=BUSY_TIMEOUT_MS / 1000.0)
+        try:
+            built = ensure_indexes(conn)
+            print(f"Index migration complete ({built} built).")
+        finally:
+            conn.close()
+        return
 
-def migrate(db_path, auto_yes=False):
-    if not os.path.exists(db_path):
+    is_new = not os.path.exists(db_path)
+    if is_new:
         print(f"Database file {db_path} does not exist. A new DB will be created with expected tables.")
-    else:
-        backup_db(db_path)
 
-    conn = sqlite3.connect(db_path)
+    conn = sqlite3.connect(db_path, timeout=BUSY_TIMEOUT_MS / 1000.0)
 
     try:
+        if not is_new:
+            if merge_in_progress(conn):
+                # the backup taken before the interrupted run is the one to keep
+                print(f"Resuming an interrupted merge; keeping {db_path}.bak")
+            else:
+                backup_db(db_path)
+        if is_new:
+            # must be set before the first table is created to take effect without a VACUUM
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL;")
+        elif incremental_vacuum:
+            enable_incremental_vacuum(conn)
+
         for table, cols in EXPECTED.items():
             if not table_exists(conn, table):
                 print(f"Table '{table}' does not exist. Creating with expected schema.")
@@ -111,6 +536,18 @@ def migrate(db_path, auto_yes=False):
                     continue
                 add_column(conn, table, name, typ)
 
+        move_raw_payloads(conn)
+        merge_reading_tables(conn)
+        ensure_views(conn)
+        ensure_indexes(conn)
+        backfill_uuids(conn, 'reading')
+        normalize_timestamps(conn)
+
+        conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION};")
+        conn.commit()
+        if vacuum and not (is_new or incremental_vacuum):
+            print("Running VACUUM (may take a while)")
+            conn.execute("VACUUM;")
         print("Migration complete.")
     finally:
         conn.close()
@@ -121,6 +558,9 @@ if __name__ == '__main__':
     default_db = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'instance', 'iot_data.db'))
     p.add_argument('--db', default=default_db, help=f'Path to sqlite DB file (default: {default_db})')
     p.add_argument('--yes', action='store_true', help='Auto-confirm destructive or altering actions')
+    p.add_argument('--indexes-only', action='store_true', help='Only create missing indexes (no backup, safe on a live DB)')
+    p.add_argument('--incremental-vacuum', action='store_true', help='Convert an existing DB to auto_vacuum=INCREMENTAL (runs VACUUM)')
+    p.add_argument('--vacuum', action='store_true', help='Run a full VACUUM after migrating to return freed space')
     args = p.parse_args()
 
     if not args.yes:
@@ -131,4 +571,5 @@ if __name__ == '__main__':
             print('Aborted by user')
             sys.exit(1)
 
-    migrate(args.db, auto_yes=args.yes)
+    migrate(args.db, auto_yes=args.yes, indexes_only=args.indexes_only, incremental_vacuum=args.incremental_vacuum,
+            vacuum=args.vacuum)
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Recompute `sd_aqi` and `sd_aqi_level` for every stored MQ reading.
+
+Run this after changing the weights or level bands in sdaqi.py. Rows are read
+in id-ordered chunks, scored with the vectorized sdaqi path and written back
+with one executemany per chunk, each in its own short transaction. Rows whose
+gases are all NULL keep the value the device sent.
+
+The `sd_aqi` rollups are not touched; rebuild them afterwards with
+`python3 scripts/backfill_rollups.py --source mq`.
+
+Usage:
+    python3 scripts/recompute_sdaqi.py --db instance/iot_data.db
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import latest_state  # noqa: E402
+import sdaqi  # noqa: E402
+
+# read through the MQ view, written to the table behind it
+TABLE = 'mq_sensor_data'
+WRITE_TABLE = 'reading'
+
+
+def recompute(db_path, chunk_size):
+    if not os.path.exists(db_path):
+        print(f"Database file {db_path} does not exist.")
+        return 1
+    conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+    try:
+        existing = [row[1] for row in conn.execute(f"PRAGMA table_info('{TABLE}');")]
+        if 'sd_aqi' not in existing or 'sd_aqi_level' not in existing:
+            print(f"Table '{TABLE}' has no sd_aqi columns. Run scripts/migrate_db.py first.")
+            return 1
+        fields = [f for f in sdaqi.WEIGHTS if f in existing]
+        cols = ', '.join(['id'] + fields)
+        max_id = conn.execute(f"SELECT MAX(id) FROM {TABLE};").fetchone()[0] or 0
+        print(f"Recomputing SD-AQI for {TABLE} rows up to id {max_id}")
+
+        last_id = 0
+        updated = 0
+        while last_id < max_id:
+            rows = conn.execute(
+                f"SELECT {cols} FROM {TABLE} WHERE id > ? AND id <= ? ORDER BY id LIMIT ?;",
+                (last_id, max_id, chunk_size)
+            ).fetchall()
+            if not rows:
+                break
+            # NULL -> NaN through the object array; one float64 column per gas
+            data = np.array(rows, dtype=np.float64)
+            values = sdaqi.sd_aqi_array({f: data[:, i + 1] for i, f in enumerate(fields)})
+            levels = sdaqi.sd_aqi_level_array(values)
+            known = ~np.isnan(values)
+            params = list(zip(values[known].tolist(), levels[known].tolist(), data[known, 0].astype(np.int64).tolist()))
+            conn.execute("BEGIN;")
+            conn.executemany(f"UPDATE {WRITE_TABLE} SET sd_aqi = ?, sd_aqi_level = ? WHERE id = ?;", params)
+            conn.commit()
+            updated += len(params)
+            last_id = rows[-1][0]
+            print(f"  up to id {last_id} ({updated} rows updated)")
+        # invalidate the read APIs' ETags (see latest_state.py)
+        state_file = os.environ.get('LATEST_STATE_FILE', os.path.join(os.path.dirname(db_path), 'latest_state.json'))
+        if updated and os.path.exists(state_file):
+            latest_state.LatestState(state_file).bump(('mq',))
+        print(f"Done: {updated} rows updated. Rebuild the sd_aqi rollups with scripts/backfill_rollups.py --source mq.")
+        return 0
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    p = argparse.ArgumentParser()
+    default_db = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'instance', 'iot_data.db'))
+    p.add_argument('--db', default=default_db, help=f'Path to sqlite DB file (default: {default_db})')
+    p.add_argument('--chunk', type=int, default=50000, help='Rows scored per transaction')
+    args = p.parse_args()
+    sys.exit(recompute(args.db, args.chunk))
@@ -0,0 +1,190 @@
+"""SD-AQI and EPA AQI computation.
+
+The SD-AQI formula and its level bands mirror ``calculateSDAQI()`` in
+SD-AQI-v1/SD-AQI-v1.ino. The AQI sub-indices for PM2.5 and PM10 use the EPA
+breakpoint tables (2024 revision) with linear interpolation inside a band.
+
+Every function has a scalar form, used per reading at ingest time, and an
+``*_array`` form that works on NumPy arrays so the index can be recomputed
+over the whole history in a few vector operations (scripts/recompute_sdaqi.py).
+Missing values are ``None`` in the scalar path and NaN in the array path.
+"""
+
+import math
+
+import numpy as np
+
+# mq_sensor_data column -> weight in the SD-AQI sum
+WEIGHTS = {
+    'co': 0.05, 'co_mq7': 0.1, 'co_mq9': 0.1, 'ch4': 0.1,
+    'h2': 0.05, 'co2': 0.5, 'nox': 0.1, 'air': 0.05,
+}
+
+# (upper bound, label); a value belongs to the first band whose bound it does not exceed
+SD_AQI_LEVELS = (
+    (50.0, 'Excellent'),
+    (100.0, 'Good'),
+    (150.0, 'Moderate'),
+    (200.0, 'Unhealthy for Sensitive Groups'),
+    (300.0, 'Unhealthy'),
+    (math.inf, 'Hazardous'),
+)
+
+AQI_LEVELS = (
+    (50.0, 'Good'),
+    (100.0, 'Moderate'),
+    (150.0, 'Unhealthy for Sensitive Groups'),
+    (200.0, 'Unhealthy'),
+    (300.0, 'Very Unhealthy'),
+    (math.inf, 'Hazardous'),
+)
+
+# pollutant -> (decimals the concentration is truncated to,
+#               ((conc_lo, conc_hi, aqi_lo, aqi_hi), ...))
+AQI_BREAKPOINTS = {
+    'pm2_5': (1, (
+        (0.0, 9.0, 0, 50),
+        (9.1, 35.4, 51, 100),
+        (35.5, 55.4, 101, 150),
+        (55.5, 125.4, 151, 200),
+        (125.5, 225.4, 201, 300),
+        (225.5, 325.4, 301, 500),
+    )),
+    'pm10': (0, (
+        (0, 54, 0, 50),
+        (55, 154, 51, 100),
+        (155, 254, 101, 150),
+        (255, 354, 151, 200),
+        (355, 424, 201, 300),
+        (425, 604, 301, 500),
+    )),
+}
+
+AQI_MAX = 500
+
+
+def _number(value):
+    if value is None:
+        return None
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return None if math.isnan(value) else value
+
+
+def _level(value, levels):
+    if value is None:
+        return None
+    for upper, label in levels:
+        if value <= upper:
+            return label
+    return levels[-1][1]
+
+
+def sd_aqi(values, weights=None):
+    """SD-AQI of one reading (a mapping of mq_sensor_data columns to values).
+
+    Missing gases count as zero; returns None if none of them is present.
+    """
+    weights = WEIGHTS if weights is None else weights
+    total = 0.0
+    present = False
+    for field, weight in weights.items():
+        value = _number(values.get(field))
+        if value is not None:
+            total += value * weight
+            present = True
+    return total if present else None
+
+
+def sd_aqi_level(value):
+    return _level(_number(value), SD_AQI_LEVELS)
+
+
+def aqi_subindex(pollutant, concentration):
+    """EPA AQI sub-index for one concentration (µg/m³); None if unknown or negative."""
+    concentration = _number(concentration)
+    if concentration is None or concentration < 0:
+        return None
+    decimals, table = AQI_BREAKPOINTS[pollutant]
+    scale = 10 ** decimals
+    concentration = math.floor(concentration * scale) / scale
+    for c_lo, c_hi, i_lo, i_hi in table:
+        if concentration <= c_hi:
+            return round((i_hi - i_lo) / (c_hi - c_lo) * (max(concentration, c_lo) - c_lo) + i_lo)
+    return AQI_MAX
+
+
+def aqi_level(value):
+    return _level(_number(value), AQI_LEVELS)
+
+
+def evaluate(pm=None, mq=None):
+    """All indices for one PM and/or MQ reading, as stored/served by the API.
+
+    The overall AQI is the highest available sub-index, as in the EPA method.
+    """
+    pm = pm or {}
+    mq = mq or {}
+    sub = {p: aqi_subindex(p, pm.get(p)) for p in AQI_BREAKPOINTS}
+    known = [v for v in sub.values() if v is not None]
+    aqi = max(known) if known else None
+    sd = sd_aqi(mq)
+    return {
+        'sd_aqi': sd,
+        'sd_aqi_level': sd_aqi_level(sd),
+        'aqi_pm2_5': sub['pm2_5'],
+        'aqi_pm10': sub['pm10'],
+        'aqi': aqi,
+        'aqi_level': aqi_level(aqi),
+    }
+
+
+def sd_aqi_array(columns, weights=None):
+    """Vectorized ``sd_aqi``: ``columns`` maps column names to equal-length arrays."""
+    weights = WEIGHTS if weights is None else weights
+    total = None
+    present = None
+    for field, weight in weights.items():
+        if field not in columns:
+            continue
+        values = np.asarray(columns[field], dtype=np.float64)
+        known = ~np.isnan(values)
+        term = np.where(known, values, 0.0) * weight
+        total = term if total is None else total + term
+        present = known if present is None else present | known
+    if total is None:
+        return np.full(len(next(iter(columns.values()), ())), np.nan)
+    return np.where(present, total, np.nan)
+
+
+def _level_array(values, levels):
+    values = np.asarray(values, dtype=np.float64)
+    uppers = np.array([upper for upper, _ in levels[:-1]])
+    labels = np.array([label for _, label in levels] + [None], dtype=object)
+    idx = np.searchsorted(uppers, values, side='left')
+    idx[np.isnan(values)] = len(levels)
+    return labels[idx]
+
+
+def sd_aqi_level_array(values):
+    """Vectorized ``sd_aqi_level``; NaN maps to None."""
+    return _level_array(values, SD_AQI_LEVELS)
+
+
+def aqi_subindex_array(pollutant, concentrations):
+    """Vectorized ``aqi_subindex``; unknown or negative concentrations give NaN."""
+    decimals, table = AQI_BREAKPOINTS[pollutant]
+    scale = 10 ** decimals
+    conc = np.floor(np.asarray(concentrations, dtype=np.float64) * scale) / scale
+    c_lo, c_hi, i_lo, i_hi = (np.array(col, dtype=np.float64) for col in zip(*table))
+    band = np.minimum(np.searchsorted(c_hi, conc, side='left'), len(table) - 1)
+    clipped = np.maximum(conc, c_lo[band])
+    result = np.round((i_hi[band] - i_lo[band]) / (c_hi[band] - c_lo[band]) * (clipped - c_lo[band]) + i_lo[band])
+    result = np.where(conc > c_hi[-1], AQI_MAX, result)
+    return np.where(np.isnan(conc) | (conc < 0), np.nan, result)
+
+
+def aqi_level_array(values):
+    return _level_array(values, AQI_LEVELS)
@@ -0,0 +1,127 @@
+"""Compact binary sensor records sent by the SD-AQI firmware.
+
+A record is a fixed little-endian layout selected by its schema id:
+
+    magic    b'\\xa5\\x5a'
+    u8       schema id
+    u8       sequence number (wraps at 256; a gap means records were lost)
+    ...      the schema's fields
+    u16      CRC-16/CCITT-FALSE of everything from the schema id on
+
+Schema 1 carries the 15 gas/environment readings as float16 and SD_AQI as
+float32: 40 bytes instead of the ~330 of the JSON object, so a 9600-baud
+XBee link carries eight times as many readings. The firmware
+(SD-AQI-v1.ino, BINARY_RECORDS) writes the same layout.
+
+Never change a published schema; add a new id with its own layout. Gateways
+skip records whose schema they do not know.
+"""
+
+import binascii
+import functools
+import math
+import re
+import struct
+
+MAGIC = b'\xa5\x5a'
+_HEADER = '<2sBB'
+_CRC = 'H'
+
+# schema id -> (struct format of the fields, reading keys in the same order)
+SCHEMAS = {
+    1: ('15ef', ('LPG', 'CO', 'Smoke', 'CO_MQ7', 'CH4', 'CO_MQ9', 'CO2', 'NH3', 'NOx',
+                   'Alcohol', 'Benzene', 'H2', 'Air', 'Temperature', 'Humidity', 'SD_AQI')),
+}
+CURRENT_SCHEMA = 1
+
+# float16 saturates here; the firmware clamps the same way
+HALF_MAX = 65504.0
+
+# schema id -> struct of the whole record
+_STRUCTS = {schema_id: struct.Struct(_HEADER + fmt + _CRC) for schema_id, (fmt, _) in SCHEMAS.items()}
+MIN_RECORD_SIZE = min(s.size for s in _STRUCTS.values())
+
+
+def crc16(data):
+    """CRC-16/CCITT-FALSE (poly 0x1021, init 0xFFFF), as computed by the firmware."""
+    return binascii.crc_hqx(data, 0xFFFF)
+
+
+def record_size(schema_id):
+    """Size in bytes of a record of ``schema_id``, or None for an unknown schema."""
+    s = _STRUCTS.get(schema_id)
+    return s.size if s is not None else None
+
+
+def check(buf, pos=0):
+    """Validate the record whose magic starts at ``buf[pos]``.
+
+    Returns its size when it is complete and its CRC matches, 0 when it is
+    not a record (unknown schema or bad CRC) and -1 when more bytes are
+    needed to tell.
+    """
+    if len(buf) - pos < 3:
+        return -1
+    size = record_size(buf[pos + 2])
+    if size is None:
+        return 0
+    if len(buf) - pos < size:
+        return -1
+    end = pos + size
+    crc = buf[end - 2] | buf[end - 1] << 8
+    return size if crc16(memoryview(buf)[pos + 2:end - 2]) == crc else 0
+
+
+def _field_codes(fmt):
+    return [code for count, code in re.findall(r'(\d*)(\D)', fmt) for _ in range(int(count or 1))]
+
+
+def encode(reading, seq=0, schema_id=CURRENT_SCHEMA):
+    """Pack a reading dict (missing values become NaN) into one record."""
+    fmt, keys = SCHEMAS[schema_id]
+    values = []
+    for key, code in zip(keys, _field_codes(fmt)):
+        value = reading.get(key)
+        value = float('nan') if value is None else float(value)
+        if code == 'e' and math.isfinite(value):
+            value = max(-HALF_MAX, min(HALF_MAX, value))
+        values.append(value)
+    body = struct.pack('<BB' + fmt, schema_id, seq & 0xFF, *values)
+    return MAGIC + body + struct.pack('<' + _CRC, crc16(body))
+
+
+@functools.lru_cache(maxsize=65536)
+def _shortest(value, code):
+    # the shortest decimal that packs to the same bits, so a float16 3.1 is
+    # stored as 3.1 rather than 3.099609375
+    if not math.isfinite(value):
+        return None
+    packed = struct.pack('<' + code, value)
+    for digits in range(1, 17):
+        candidate = float('%.*g' % (digits, value))
+        try:
+            if struct.pack('<' + code, candidate) == packed:
+                return candidate
+        except OverflowError:  # rounded up past the format's range
+            continue
+    return value
+
+
+def decode(buf):
+    """Decode a run of consecutive, already checked records of one schema.
+
+    The whole run is unpacked with one ``struct.iter_unpack``; returns a list
+    of reading dicts with the sequence number under ``seq``. NaN and
+    infinite values (missing or out-of-range readings) become None.
+    """
+    if len(buf) < MIN_RECORD_SIZE:
+        return []
+    schema_id = buf[2]
+    fmt, keys = SCHEMAS[schema_id]
+    fields = list(zip(keys, _field_codes(fmt)))
+    readings = []
+    for record in _STRUCTS[schema_id].iter_unpack(buf):
+        reading = {key: _shortest(value, code) for (key, code), value in zip(fields, record[3:-1])}
+        reading['seq'] = record[2]
+        readings.append(reading)
+    return readings
@@ -1,30 +1,31 @@
+// Station shown by this page: ?device_id=<id> in the page URL limits every
+// API request to that station, otherwise all stations are shown
+const DEVICE_ID = new URLSearchParams(window.location.search).get('device_id');
+
 async function fetchEvaluationData() {
     try {
-        const response = await fetch('/api/evaluation-data');
+        const params = DEVICE_ID ? `?${new URLSearchParams({ device_id: DEVICE_ID })}` : '';
+        const response = await fetch(`/api/evaluation-data${params}`);
         const result = await response.json();
 
-        // Calculate Scuba Diving Index
-        const scubaDivingIndex = calculateScubaDivingIndex(result);
-        document.getElementById('scuba-diving-index').innerText = `Scuba Diving Index: ${scubaDivingIndex.toFixed(2)}`;
+        // Indices are computed server-side (sdaqi.py)
+        document.getElementById('scuba-diving-index').innerText =
+            `Scuba Diving Index (SD-AQI): ${formatIndex(result.sd_aqi, 2)}${formatLevel(result.sd_aqi_level)}`;
 
-        // Calculate AQI
-        const airQualityIndex = calculateAirQualityIndex(result);
-        document.getElementById('air-quality-index').innerText = `Air Quality Index: ${airQualityIndex.toFixed(2)}`;
+        document.getElementById('air-quality-index').innerText =
+            `Air Quality Index: ${formatIndex(result.aqi, 0)}${formatLevel(result.aqi_level)}` +
+            ` (PM2.5: ${formatIndex(result.aqi_pm2_5, 0)}, PM10: ${formatIndex(result.aqi_pm10, 0)})`;
     } catch (error) {
         console.error('Error fetching evaluation data:', error);
     }
 }
 
-function calculateScubaDivingIndex(data) {
-    // Example calculation logic for Scuba Diving Index
-    const { humidity, temperature } = data;
-    return temperature > 15 && temperature < 30 && humidity > 40 && humidity < 70 ? 100 : 50;
+function formatIndex(value, digits) {
+    return (value === null || value === undefined || isNaN(value)) ? 'N/A' : Number(value).toFixed(digits);
 }
 
-function calculateAirQualityIndex(data) {
-    // Example calculation logic for AQI
-    const { pm2_5, pm10 } = data;
-    return (pm2_5 + pm10) / 2; // Simplified calculation
+function formatLevel(level) {
+    return level ? ` — ${level}` : '';
 }
 
 // Fetch data on page load
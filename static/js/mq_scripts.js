@@ -1,3 +1,12 @@
+// Station shown by this page: ?device_id=<id> in the page URL limits every
+// API request to that station, otherwise all stations are shown
+const DEVICE_ID = new URLSearchParams(window.location.search).get('device_id');
+
+function withDevice(params) {
+    if (DEVICE_ID) params.set('device_id', DEVICE_ID);
+    return params;
+}
+
 // Custom plugin for gradient background
 const backgroundPlugin = {
     id: 'customBackground',
@@ -59,6 +68,7 @@ let mqDataTable = null;
 let lastFilteredData = [];
 let pollIntervalMs = 1000;
 let pollTimerId = null;
+let liveSource = null; // EventSource for /api/stream (preferred over pollTimerId)
 let isPolling = true;
 
 document.getElementById('timeFilter').addEventListener('change', (event) => {
@@ -76,6 +86,7 @@ if (chartTimeFilterEl) {
 }
 
 document.getElementById('applyFilter').addEventListener('click', () => {
+    mqEtag = null; // the filter is applied client-side, so always re-render
     fetchMqData(); // Re-fetch data with the selected filter
 });
 
@@ -129,13 +140,53 @@ function parseServerTimestamp(ts) {
     }
 }
 
+// Highest row id merged into mqData. Once set, polls only ask the server for
+// newer rows (`?after_id=`) instead of re-downloading the whole table.
+let mqCursor = null;
+// ETag of the last /api/mq-data response. Polls send it back as If-None-Match;
+// a 304 means no reading arrived since, so nothing is re-rendered.
+let mqEtag = null;
+
+// Merge an /api/mq-data response into the newest-first mqData array.
+// Full responses replace the array; incremental ones are prepended,
+// de-duplicated by uuid/id and re-sorted newest-first.
+function mergeMqDelta(current, result) {
+    const rows = result.mq_data || [];
+    if (!result.incremental) return rows;
+    if (rows.length === 0) return current;
+    const seen = new Set(rows.map(r => r.uuid || r.id));
+    const merged = rows.concat(current.filter(r => !seen.has(r.uuid || r.id)));
+    merged.sort((a, b) => parseServerTimestamp(b.timestamp) - parseServerTimestamp(a.timestamp));
+    return merged;
+}
+
 async function fetchMqData() {
     try {
-        const response = await fetch('/api/mq-data');
+        const params = withDevice(new URLSearchParams());
+        if (mqCursor !== null) params.set('after_id', mqCursor);
+        const url = `/api/mq-data?${params}`;
+        const response = await fetch(url, {
+            headers: mqEtag ? { 'If-None-Match': mqEtag } : {},
+            cache: 'no-store', // let us see the 304 instead of the browser's cached copy
+        });
+        if (response.status === 304) return;
+        mqEtag = response.headers.get('ETag');
         const result = await response.json();
+        applyMqResult(result);
+    } catch (error) {
+        console.error('Error fetching MQ data:', error);
+    }
+}
 
+// Merge an /api/mq-data style result (full or incremental) into mqData and
+// re-render the summary, chart, table and analysis cards.
+function applyMqResult(result) {
+    try {
         // Store result in the global mqData so other controls can use it
-        mqData = result.mq_data || [];
+        mqData = mergeMqDelta(mqData, result);
+        if (result.cursor !== null && result.cursor !== undefined) {
+            mqCursor = (mqCursor === null) ? result.cursor : Math.max(mqCursor, result.cursor);
+        }
 
         // Note: render summary after filtering so the "previous" value for deltas is available
         // (use fallback logic below if filter yields no results)
@@ -240,7 +291,7 @@ async function fetchMqData() {
             }
         }
     } catch (error) {
-        console.error('Error fetching MQ data:', error);
+        console.error('Error rendering MQ data:', error);
     }
 }
 
@@ -503,7 +554,86 @@ function filterDataByCriteria(data) {
 }
 
 
+// Windows longer than this are charted from /api/mq-data/aggregate (one point
+// per time bucket, sized to the canvas width) instead of from raw rows.
+const AGGREGATE_MIN_SPAN_MS = 60 * 60 * 1000;
+let mqAggregate = { key: null, fetchedAt: 0, bucketMs: 0, result: null, pending: false };
+
+// Map a chart dataset label to the key used by /api/mq-data records
+function labelToKey(label) {
+    const lower = label.toLowerCase();
+    if (lower === 'temperature') return 'temperature';
+    if (lower === 'humidity') return 'humidity';
+    return label.replace(/ /g, '_');
+}
+
+// Time window the chart shows (chartTimeFilter overrides the UI timeFilter), or null
+function getChartRange() {
+    const chartFilterEl = document.getElementById('chartTimeFilter');
+    const ctf = chartFilterEl ? chartFilterEl.value : 'inherit';
+    const mode = (ctf && ctf !== 'inherit') ? ctf : activeFilter;
+    const end = new Date();
+    if (mode === 'custom') {
+        const fromChart = (ctf === 'custom');
+        const s = document.getElementById(fromChart ? 'chartStartDate' : 'startDate').value;
+        const e = document.getElementById(fromChart ? 'chartEndDate' : 'endDate').value;
+        if (!s) return null;
+        return { key: `custom:${s}:${e}`, start: new Date(s), end: e ? new Date(e) : end };
+    }
+    const spans = { '1hour': 60 * 60 * 1000, '24hours': 24 * 60 * 60 * 1000, '7days': 7 * 24 * 60 * 60 * 1000 };
+    if (!spans[mode]) return null;
+    return { key: mode, start: new Date(end.getTime() - spans[mode]), end };
+}
+
+// Chart a long window from server-side min/mean/max buckets. The cached result
+// is redrawn on every call and refetched at most once per bucket.
+function updateMqChartAggregated(range) {
+    if (mqAggregate.key === range.key && mqAggregate.result) {
+        renderMqAggregate(mqAggregate.result);
+    }
+    const stale = mqAggregate.key !== range.key || Date.now() - mqAggregate.fetchedAt > mqAggregate.bucketMs;
+    if (!stale || mqAggregate.pending) return;
+
+    // One bucket per horizontal pixel is the most the canvas can show
+    const points = Math.max(50, Math.round(mqChart.chartArea ? mqChart.chartArea.width : mqChart.width || 1000));
+    const params = withDevice(new URLSearchParams({
+        from: range.start.toISOString(),
+        to: range.end.toISOString(),
+        points: String(points),
+    }));
+    mqAggregate.pending = true;
+    fetch(`/api/mq-data/aggregate?${params}`)
+        .then(response => response.json())
+        .then(result => {
+            if (!result.t) throw new Error(result.message || 'aggregate request failed');
+            mqAggregate = { key: range.key, fetchedAt: Date.now(), bucketMs: result.bucket_seconds * 1000, result, pending: false };
+            // The user may have switched to another window while this was in flight
+            const current = getChartRange();
+            if (current && current.key === range.key) renderMqAggregate(result);
+            else updateMqChart(lastFilteredData.slice());
+        })
+        .catch(error => {
+            mqAggregate.pending = false;
+            console.error('Error fetching aggregated MQ data:', error);
+        });
+}
+
+function renderMqAggregate(result) {
+    mqChart.data.labels = result.t.map(t => parseServerTimestamp(t));
+    mqChart.data.datasets.forEach((dataset) => {
+        const series = result.series[labelToKey(dataset.label)];
+        dataset.data = series ? series.mean : [];
+    });
+    mqChart.update();
+}
+
 function updateMqChart(filteredMqData) {
+    const range = getChartRange();
+    if (range && range.end - range.start > AGGREGATE_MIN_SPAN_MS) {
+        updateMqChartAggregated(range);
+        return;
+    }
+
     // Chart-specific time filtering (chartTimeFilter overrides UI timeFilter when set)
     const maxDataPoints = parseInt(document.getElementById('maxDataPoints').value, 10) || 50;
     let chartFiltered = filteredMqData.slice();
@@ -539,13 +669,6 @@ function updateMqChart(filteredMqData) {
     const timestamps = limitedData.map(record => parseServerTimestamp(record.timestamp));
     mqChart.data.labels = timestamps;
 
-    function labelToKey(label) {
-        const lower = label.toLowerCase();
-        if (lower === 'temperature') return 'temperature';
-        if (lower === 'humidity') return 'humidity';
-        return label.replace(/ /g, '_');
-    }
-
     mqChart.data.datasets.forEach((dataset) => {
         const key = labelToKey(dataset.label);
         dataset.data = limitedData.map(record => {
@@ -909,9 +1032,6 @@ function showDetails(record) {
 }
 
 
-setInterval(fetchMqData, 1000);
-fetchMqData();
-
 // Initialize DataTable once DOM is ready
 document.addEventListener('DOMContentLoaded', () => {
     try {
@@ -948,12 +1068,38 @@ document.addEventListener('DOMContentLoaded', () => {
 
     function startPolling() {
         stopPolling();
-        pollTimerId = setInterval(fetchMqData, pollIntervalMs);
+        if (window.EventSource) {
+            // Live mode: the server pushes each new row once, no timer needed.
+            // Catch up on anything stored while paused, then subscribe.
+            fetchMqData();
+            liveSource = new EventSource(`/api/stream?${withDevice(new URLSearchParams({ topics: 'mq' }))}`);
+            liveSource.addEventListener('mq', (event) => {
+                try {
+                    const row = JSON.parse(event.data);
+                    applyMqResult({ mq_data: [row], incremental: true, cursor: row.id, server_now: new Date().toISOString() });
+                } catch (err) {
+                    console.error('Error handling live MQ reading:', err);
+                }
+            });
+            liveSource.addEventListener('reset', () => {
+                // Too far behind for the stream to replay every row: reload instead
+                mqCursor = null;
+                mqEtag = null;
+                fetchMqData();
+            });
+            liveSource.onerror = () => {
+                // EventSource reconnects on its own and resumes from Last-Event-ID
+                console.warn('Live MQ stream interrupted; reconnecting...');
+            };
+        } else {
+            pollTimerId = setInterval(fetchMqData, pollIntervalMs);
+        }
         isPolling = true;
         if (pollToggle) { pollToggle.innerText = 'Pause'; pollToggle.classList.remove('btn-primary'); pollToggle.classList.add('btn-success'); }
     }
     function stopPolling() {
         if (pollTimerId) { clearInterval(pollTimerId); pollTimerId = null; }
+        if (liveSource) { liveSource.close(); liveSource = null; }
         isPolling = false;
         if (pollToggle) { pollToggle.innerText = 'Resume'; pollToggle.classList.remove('btn-success'); pollToggle.classList.add('btn-primary'); }
     }
@@ -981,6 +1127,7 @@ document.addEventListener('DOMContentLoaded', () => {
                 refreshBtn.disabled = true;
                 const old = refreshBtn.innerText;
                 refreshBtn.innerText = 'Refreshing...';
+                mqEtag = null;
                 await fetchMqData();
                 // short visual confirmation
                 refreshBtn.innerText = 'Done';
@@ -996,7 +1143,8 @@ document.addEventListener('DOMContentLoaded', () => {
     // build dynamic parameter controls for chart datasets
     try { buildParameterControls(); } catch (e) { console.warn('buildParameterControls error', e); }
 
-    // start polling according to initial interval
+    // Initial load, then live updates (or polling at the initial interval
+    // when the browser has no EventSource support)
     pollIntervalInput.value = pollIntervalMs;
     startPolling();
 
@@ -1,3 +1,12 @@
+// Station shown by this page: ?device_id=<id> in the page URL limits every
+// API request to that station, otherwise all stations are shown
+const DEVICE_ID = new URLSearchParams(window.location.search).get('device_id');
+
+function withDevice(params) {
+    if (DEVICE_ID) params.set('device_id', DEVICE_ID);
+    return params;
+}
+
 // Custom plugin for gradient background
 const backgroundPlugin = {
     id: 'customBackground',
@@ -76,6 +85,9 @@ const liveChart = new Chart(ctx, {
 
 const recordsPerPage = 10;
 let currentPage = 1;
+// Keyset cursors of the PM table pages visited so far: pmPageCursors[n - 1]
+// fetches page n (null = newest page). /api/pm-data returns the next one.
+let pmPageCursors = [null];
 let activeFilter = '24hours'; // Default filter
 
 document.getElementById('pm_timeFilter').addEventListener('change', (event) => {
@@ -84,19 +96,37 @@ document.getElementById('pm_timeFilter').addEventListener('change', (event) => {
 });
 
 document.getElementById('applyFilter').addEventListener('click', () => {
+    pmEtag = null; // the filter is applied client-side, so always re-render
     fetchDataAndUpdate(); // Re-fetch data with the selected filter
 });
 
 let pmData = []; // Global variable to store MQ sensor data
+let pmPerPage = 50; // Rows per page as reported by /api/pm-data
+// ETag of the last /api/pm-data response. Polls send it back as If-None-Match;
+// a 304 means no reading arrived since, so nothing is re-rendered.
+let pmEtag = null;
 
 
 async function fetchDataAndUpdate() {
     try {
-        const response = await fetch('/api/data');
+        // Only the PM columns this page renders (id/timestamp are always included)
+        const params = withDevice(new URLSearchParams({ fields: 'dust,pm2_5,pm10' }));
+        const cursor = pmPageCursors[currentPage - 1];
+        if (cursor) {
+            params.set('before_ts', cursor.before_ts);
+            params.set('before_id', cursor.before_id);
+        }
+        const response = await fetch(`/api/pm-data?${params}`, {
+            headers: pmEtag ? { 'If-None-Match': pmEtag } : {},
+            cache: 'no-store', // let us see the 304 instead of the browser's cached copy
+        });
+        if (response.status === 304) return;
+        pmEtag = response.headers.get('ETag');
         const result = await response.json();
 
-        // Access the general sensor data
-        pmData = result.general_data || [];
+        // Access the PM sensor data
+        pmData = result.pm_data || [];
+        if (result.per_page) pmPerPage = result.per_page;
         //console.log('Fetched general data:', data);
 
         // Filter out records with null or 0 values
@@ -127,7 +157,8 @@ async function fetchDataAndUpdate() {
 
         // Render the table and pagination controls
         renderTablePage(filteredData);
-        renderPagination(result.pages);
+        pmPageCursors[currentPage] = result.next_cursor || null;
+        renderPagination(result.pages, !!result.next_cursor);
     } catch (error) {
         console.error('Error fetching data:', error);
     }
@@ -159,7 +190,75 @@ function filterDataByCriteria(data) {
     return filteredData;
 }
 
+// Windows longer than this are charted from /api/data/aggregate (one point per
+// time bucket, sized to the canvas width) instead of from the current page.
+const AGGREGATE_MIN_SPAN_MS = 60 * 60 * 1000;
+const PM_AGGREGATE_FIELDS = ['dust', 'pm2_5', 'pm10']; // same order as liveChart datasets
+let pmAggregate = { key: null, fetchedAt: 0, bucketMs: 0, result: null, pending: false };
+
+// Time window selected in the filter modal, or null
+function getChartRange() {
+    const end = new Date();
+    if (activeFilter === 'custom') {
+        const s = document.getElementById('startDate').value;
+        const e = document.getElementById('endDate').value;
+        if (!s) return null;
+        return { key: `custom:${s}:${e}`, start: new Date(s), end: e ? new Date(e) : end };
+    }
+    const spans = { '1hour': 60 * 60 * 1000, '24hours': 24 * 60 * 60 * 1000, '7days': 7 * 24 * 60 * 60 * 1000 };
+    if (!spans[activeFilter]) return null;
+    return { key: activeFilter, start: new Date(end.getTime() - spans[activeFilter]), end };
+}
+
+// Chart a long window from server-side min/mean/max buckets. The cached result
+// is redrawn on every call and refetched at most once per bucket.
+function updatePMChartAggregated(range) {
+    if (pmAggregate.key === range.key && pmAggregate.result) {
+        renderPMAggregate(pmAggregate.result);
+    }
+    const stale = pmAggregate.key !== range.key || Date.now() - pmAggregate.fetchedAt > pmAggregate.bucketMs;
+    if (!stale || pmAggregate.pending) return;
+
+    // One bucket per horizontal pixel is the most the canvas can show
+    const points = Math.max(50, Math.round(liveChart.chartArea ? liveChart.chartArea.width : liveChart.width || 1000));
+    const params = withDevice(new URLSearchParams({
+        from: range.start.toISOString(),
+        to: range.end.toISOString(),
+        points: String(points),
+        fields: PM_AGGREGATE_FIELDS.join(','),
+    }));
+    pmAggregate.pending = true;
+    fetch(`/api/data/aggregate?${params}`)
+        .then(response => response.json())
+        .then(result => {
+            if (!result.t) throw new Error(result.message || 'aggregate request failed');
+            pmAggregate = { key: range.key, fetchedAt: Date.now(), bucketMs: result.bucket_seconds * 1000, result, pending: false };
+            if (isPaused) return;
+            // The user may have switched to another window while this was in flight
+            const current = getChartRange();
+            if (current && current.key === range.key) renderPMAggregate(result);
+            else updatePMChart(filterDataByCriteria(pmData).slice());
+        })
+        .catch(error => {
+            pmAggregate.pending = false;
+            console.error('Error fetching aggregated PM data:', error);
+        });
+}
+
+function renderPMAggregate(result) {
+    liveChart.data.labels = result.t.map(t => new Date(t));
+    PM_AGGREGATE_FIELDS.forEach((field, idx) => {
+        liveChart.data.datasets[idx].data = result.series[field] ? result.series[field].mean : [];
+    });
+    liveChart.update();
+}
+
 function updatePMChart(filteredPMData) {
+    const range = getChartRange();
+    if (range && range.end - range.start > AGGREGATE_MIN_SPAN_MS) {
+        updatePMChartAggregated(range);
+        return;
+    }
 
     const maxDataPoints = parseInt(document.getElementById('pm_maxDataPoints').value, 10) || 50;
     const sortedData = filteredPMData.sort((a, b) => new Date(b.timestamp) - new Date(a.timestamp));
@@ -223,49 +322,44 @@ document.getElementById('resetFilter').addEventListener('click', () => {
     updatePMChart(latestData);
 });
 
-function renderPagination(totalPages) {
+// Newer/Older controls for keyset pages. The page count is approximate (it
+// comes from a server-side counter), so it is only shown as a hint.
+function renderPagination(approxPages, hasOlder) {
     const paginationControls = document.getElementById('pagination-controls');
     paginationControls.innerHTML = '';
 
-    const maxVisibleButtons = 10; // Limit the number of visible buttons
-    const startPage = Math.max(1, currentPage - Math.floor(maxVisibleButtons / 2));
-    const endPage = Math.min(totalPages, startPage + maxVisibleButtons - 1);
+    const addButton = (label, onClick) => {
+        const button = document.createElement('button');
+        button.innerText = label;
+        button.classList.add('pagination-button');
+        button.addEventListener('click', onClick);
+        paginationControls.appendChild(button);
+    };
 
-    // Add Previous Button
-    if (currentPage > 1) {
-        const prevButton = document.createElement('button');
-        prevButton.innerText = 'Previous';
-        prevButton.addEventListener('click', () => {
-            currentPage--;
+    if (currentPage > 2) {
+        addButton('Latest', () => {
+            currentPage = 1;
             fetchDataAndUpdate();
         });
-        paginationControls.appendChild(prevButton);
     }
-
-    // Add Page Buttons
-    for (let i = startPage; i <= endPage; i++) {
-        const button = document.createElement('button');
-        button.innerText = i;
-        button.classList.add('pagination-button');
-        if (i === currentPage) {
-            button.classList.add('active');
-        }
-        button.addEventListener('click', () => {
-            currentPage = i;
+    if (currentPage > 1) {
+        addButton('Newer', () => {
+            currentPage--;
             fetchDataAndUpdate();
         });
-        paginationControls.appendChild(button);
     }
 
-    // Add Next Button
-    if (currentPage < totalPages) {
-        const nextButton = document.createElement('button');
-        nextButton.innerText = 'Next';
-        nextButton.addEventListener('click', () => {
+    const position = document.createElement('button');
+    position.innerText = `Page ${currentPage} of ~${Math.max(approxPages || 1, currentPage)}`;
+    position.classList.add('pagination-button', 'active');
+    position.disabled = true;
+    paginationControls.appendChild(position);
+
+    if (hasOlder) {
+        addButton('Older', () => {
             currentPage++;
             fetchDataAndUpdate();
         });
-        paginationControls.appendChild(nextButton);
     }
 }
 
@@ -298,33 +392,54 @@ function showDetails(record) {
     modal.show();
 }
 
-let fetchInterval; // To store the interval reference
 let isPaused = false; // State to track if the graph is paused
-
-// Function to fetch and update the graph data
-async function fetchAndUpdateGraph() {
-    try {
-        const response = await fetch('/api/data'); // Replace with your actual API endpoint
-        const result = await response.json();
-
-        // Process and filter data as needed
-        const filteredData = filterDataByCriteria(result.general_data || []);
-
-        // Update the chart
-        updatePMChart(filteredData);
-    } catch (error) {
-        console.error('Error fetching data:', error);
-    }
+let liveSource = null; // EventSource for /api/stream
+
+// Merge a live PM reading pushed by the server into pmData (newest-first).
+function handleLivePmReading(record) {
+    if (!record || pmData.some(r => (r.uuid && r.uuid === record.uuid) || (r.id !== undefined && r.id === record.id))) return;
+    // Only the first page shows the latest readings; other pages stay put
+    if (currentPage !== 1) return;
+    pmData.unshift(record);
+    if (pmData.length > pmPerPage) pmData.length = pmPerPage;
+    const filteredData = filterDataByCriteria(pmData);
+    if (!isPaused) updatePMChart(filteredData.slice());
+    renderTablePage(filteredData);
 }
 
-// Start fetching data at regular intervals
-function startFetchingData(intervalTime = 1000) {
-    fetchInterval = setInterval(fetchAndUpdateGraph, intervalTime);
+// Subscribe to server-pushed PM readings instead of polling every second
+function startLiveUpdates() {
+    stopLiveUpdates();
+    if (!window.EventSource) {
+        // Browsers without SSE support fall back to polling
+        const timerId = setInterval(fetchDataAndUpdate, 1000);
+        liveSource = { close: () => clearInterval(timerId) };
+        return;
+    }
+    liveSource = new EventSource(`/api/stream?${withDevice(new URLSearchParams({ topics: 'pm' }))}`);
+    liveSource.addEventListener('pm', (event) => {
+        try {
+            handleLivePmReading(JSON.parse(event.data));
+        } catch (error) {
+            console.error('Error handling live PM reading:', error);
+        }
+    });
+    liveSource.addEventListener('reset', () => {
+        // Too far behind for the stream to replay every row: reload instead
+        pmEtag = null;
+        fetchDataAndUpdate();
+    });
+    liveSource.onerror = () => {
+        // EventSource reconnects on its own and resumes from Last-Event-ID
+        console.warn('Live PM stream interrupted; reconnecting...');
+    };
 }
 
-// Stop fetching data
-function stopFetchingData() {
-    clearInterval(fetchInterval);
+function stopLiveUpdates() {
+    if (liveSource) {
+        liveSource.close();
+        liveSource = null;
+    }
 }
 
 // Event listeners for Pause/Resume buttons
@@ -334,7 +449,6 @@ document.addEventListener('DOMContentLoaded', () => {
 
     pauseButton.addEventListener('click', () => {
         if (!isPaused) {
-            stopFetchingData();
             isPaused = true;
             pauseButton.disabled = true;
             resumeButton.disabled = false;
@@ -344,20 +458,16 @@ document.addEventListener('DOMContentLoaded', () => {
 
     resumeButton.addEventListener('click', () => {
         if (isPaused) {
-            startFetchingData();
             isPaused = false;
             pauseButton.disabled = false;
             resumeButton.disabled = true;
+            updatePMChart(filterDataByCriteria(pmData).slice());
             console.log('Graph updates resumed.');
         }
     });
 });
 
-// Initialize the graph updates
-startFetchingData(); // Start fetching data on page load
 
-
-// Initialize the page
+// Initialize the page: one full load, then readings are pushed by the server
 fetchDataAndUpdate();
-setInterval(fetchDataAndUpdate, 1000);
-
+startLiveUpdates();
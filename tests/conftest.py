@@ -0,0 +1,43 @@
+import os
+import shutil
+import sys
+
+import pytest
+from sqlalchemy import text
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+@pytest.fixture(scope='session')
+def _app_module(tmp_path_factory):
+    # app.py opens (and migrates) its database on import, so point it at a
+    # scratch instance directory first
+    instance = tmp_path_factory.mktemp('instance')
+    os.environ['DB_FILE'] = str(instance / 'iot_data.db')
+    os.environ['SQLITE_CHECKPOINT_INTERVAL'] = '0'
+    import app
+    app.limiter.enabled = False
+    return app
+
+
+@pytest.fixture
+def app_module(_app_module, monkeypatch):
+    """The app module with an empty database, queue and latest-state snapshot."""
+    app = _app_module
+    with app.app.app_context():
+        for table in ('reading', 'raw_payload', 'reading_rollup', 'ingest_offset'):
+            app.db.session.execute(text('DELETE FROM %s' % table))
+        app.db.session.commit()
+    app._ingest_writer_queue.close()
+    shutil.rmtree(app.INGEST_QUEUE_DIR, ignore_errors=True)
+    for path in (app.LATEST_STATE_FILE,):
+        if os.path.exists(path):
+            os.remove(path)
+    monkeypatch.setattr(app, 'INGEST_MODE', 'direct')
+    return app
+
+
+@pytest.fixture
+def client(app_module):
+    return app_module.app.test_client()
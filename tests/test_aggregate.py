@@ -0,0 +1,80 @@
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import text
+
+
+def _utc_now():
+    return datetime.now(timezone.utc).replace(tzinfo=None, microsecond=0)
+
+
+def _post(client, co, ts):
+    assert client.post('/api/data', json={'CO': co, 'timestamp': ts.isoformat() + 'Z'}).status_code == 200
+
+
+def _insert_without_rollups(app, client, monkeypatch, readings):
+    # readings stored before reading_rollup existed (an upgraded database)
+    with monkeypatch.context() as m:
+        m.setattr(app, 'ROLLUPS_ENABLED', False)
+        for ts, co in readings:
+            _post(client, co, ts)
+
+
+def _aggregate(client, start, end, bucket='1h'):
+    resp = client.get('/api/mq-data/aggregate?fields=CO&bucket=%s&from=%s&to=%s'
+                      % (bucket, start.isoformat() + 'Z', end.isoformat() + 'Z'))
+    assert resp.status_code == 200
+    return resp.get_json()
+
+
+def test_readings_are_grouped_into_buckets(app_module, client):
+    start = datetime(2024, 1, 1, 10, 0, 0)
+    for minutes, co in ((5, 1.0), (30, 3.0), (70, 8.0)):
+        _post(client, co, start + timedelta(minutes=minutes))
+    body = _aggregate(client, start, start + timedelta(hours=2))
+    assert body['t'] == ['2024-01-01T10:00:00+00:00', '2024-01-01T11:00:00+00:00']
+    assert body['count'] == [2, 1]
+    assert body['series']['CO'] == {'min': [1.0, 8.0], 'mean': [2.0, 8.0], 'max': [3.0, 8.0]}
+
+
+def test_rollups_serve_ranges_they_cover(app_module, client):
+    now = _utc_now()
+    _post(client, 2.0, now - timedelta(minutes=5))
+    body = _aggregate(client, now - timedelta(hours=3), now + timedelta(minutes=1))
+    assert body['source'] == 'rollup'
+    assert body['series']['CO']['mean'] == [2.0]
+
+
+def test_ranges_older_than_the_rollups_are_grouped_from_raw_rows(app_module, client, monkeypatch):
+    now = _utc_now()
+    _insert_without_rollups(app_module, client, monkeypatch,
+                            [(now - timedelta(days=3, minutes=m), float(m)) for m in (10, 20)])
+    _post(client, 5.0, now - timedelta(minutes=5))
+
+    body = _aggregate(client, now - timedelta(days=4), now + timedelta(minutes=1), bucket='1d')
+    assert body['source'] == 'raw'
+    assert sum(body['count']) == 3
+
+    # a range the rollups cover still uses them
+    body = _aggregate(client, now - timedelta(hours=1), now + timedelta(minutes=1))
+    assert body['source'] == 'rollup'
+    assert body['series']['CO']['mean'] == [5.0]
+
+
+def test_no_rollups_at_all_falls_back_to_raw_rows(app_module, client, monkeypatch):
+    now = _utc_now()
+    _insert_without_rollups(app_module, client, monkeypatch, [(now - timedelta(hours=2), 1.0)])
+    body = _aggregate(client, now - timedelta(hours=3), now)
+    assert body['source'] == 'raw'
+    assert body['count'] == [1]
+
+
+def test_raw_range_includes_a_reading_stamped_exactly_on_from(app_module, client, monkeypatch):
+    assert client.post('/api/data', json={'CO': 4.0}).status_code == 200  # stamped by the column default
+    with app_module.app.app_context():
+        stored = app_module.db.session.execute(text('SELECT timestamp FROM reading')).scalar()
+    start = datetime.strptime(stored, app_module.DB_TIMESTAMP_FORMAT)
+    with monkeypatch.context() as m:
+        m.setattr(app_module, 'ROLLUPS_ENABLED', False)
+        body = _aggregate(client, start, start + timedelta(minutes=1))
+    assert body['source'] == 'raw'
+    assert body['count'] == [1]
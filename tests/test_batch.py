@@ -0,0 +1,29 @@
+import json
+
+from sqlalchemy import text
+
+
+def _stored_co(app):
+    with app.app.app_context():
+        return app.db.session.execute(text('SELECT co FROM reading ORDER BY id')).scalars().all()
+
+
+def test_ndjson_batch_round_trip(app_module, client):
+    body = '\n'.join(json.dumps({'CO': float(n)}) for n in range(3)) + '\n'
+    resp = client.post('/api/data/batch', data=body, content_type='application/x-ndjson')
+    assert resp.status_code == 200
+    assert resp.get_json()['stored'] == 3
+    assert _stored_co(app_module) == [0.0, 1.0, 2.0]
+
+
+def test_malformed_items_are_reported_per_line(app_module, client):
+    body = '{"CO": 1.0}\n{"CO": \n[1, 2]\n{"CO": 2.0}\n'
+    resp = client.post('/api/data/batch', data=body, content_type='application/x-ndjson')
+    result = resp.get_json()
+    assert resp.status_code == 200 and result['status'] == 'partial'
+    assert [r['status'] for r in result['results']] == ['success', 'error', 'error', 'success']
+    assert result['results'][1]['message'].startswith('Invalid JSON')
+    assert _stored_co(app_module) == [1.0, 2.0]
+
+    resp = client.post('/api/data/batch', data='"just a string"', content_type='application/json')
+    assert resp.status_code == 400
@@ -0,0 +1,14 @@
+MQ = ('LPG', 'CO', 'Smoke', 'CO_MQ7', 'CH4', 'CO_MQ9', 'CO2', 'NH3', 'NOx',
+      'Alcohol', 'Benzene', 'H2', 'Air', 'temperature', 'humidity')
+
+
+def test_columnar_matches_row_mode(app_module, client):
+    readings = [dict(dict.fromkeys(MQ, 1.0), pm2_5=2.0, timestamp='2024-01-01T10:00:00Z'),
+                dict(dict.fromkeys(MQ, 3.0), pm2_5=4.0, timestamp='2024-01-01T10:00:01.250000Z')]
+    assert client.post('/api/data/batch', json=readings).status_code == 200
+    for path, key in (('/api/mq-data', 'mq_data'), ('/api/pm-data', 'pm_data')):
+        rows = client.get(path).get_json()[key]
+        columns = client.get(path + '?format=columnar').get_json()['columns']
+        assert columns['timestamp'] == [r['timestamp'] for r in rows]
+        assert columns['timestamp'] == ['2024-01-01T10:00:01.250000', '2024-01-01T10:00:00']
+        assert columns['id'] == [r['id'] for r in rows]
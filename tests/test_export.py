@@ -0,0 +1,38 @@
+import json
+from datetime import datetime
+
+from sqlalchemy import text
+
+
+def _export(client, **args):
+    resp = client.get('/api/export', query_string=dict({'table': 'mq', 'format': 'ndjson', 'fields': 'CO'}, **args))
+    assert resp.status_code == 200
+    return [json.loads(line) for line in resp.get_data(as_text=True).splitlines()]
+
+
+def test_ndjson_export_round_trip(app_module, client):
+    readings = [{'CO': float(n), 'timestamp': '2024-01-01T10:00:0%dZ' % n} for n in range(3)]
+    assert client.post('/api/data/batch', json=readings).status_code == 200
+    rows = _export(client)
+    assert [r['CO'] for r in rows] == [0.0, 1.0, 2.0]
+
+
+def test_bounds_include_rows_stamped_exactly_on_them(app_module, client):
+    # one reading stamped by the device, one by the column default
+    client.post('/api/data', json={'CO': 1.0, 'timestamp': '2024-01-01T10:00:00Z'})
+    client.post('/api/data', json={'CO': 2.0})
+    with app_module.app.app_context():
+        stored = app_module.db.session.execute(
+            text('SELECT timestamp FROM reading ORDER BY id')).scalars().all()
+    # every row is stored in the format DateTime bounds are rendered in
+    assert [datetime.strptime(ts, app_module.DB_TIMESTAMP_FORMAT) for ts in stored]
+
+    for ts, co in zip(stored, (1.0, 2.0)):
+        bound = ts.replace(' ', 'T') + 'Z'
+        assert [r['CO'] for r in _export(client, **{'from': bound, 'to': bound})] == [co]
+
+
+def test_invalid_bound_is_rejected(app_module, client):
+    resp = client.get('/api/export?table=mq&from=not-a-time')
+    assert resp.status_code == 400
+    assert "Invalid 'from'" in resp.get_json()['message']
@@ -0,0 +1,36 @@
+import json
+
+from xbreemw import SensorFrameExtractor, parse_xbee_data
+
+READING = {'co': 1.5, 'CO2': '412.0', 'note': 'a "}" and a \\ inside {strings}', 'deviceid': 'boat-1'}
+
+
+def test_json_frames_round_trip_across_chunks():
+    line = json.dumps(READING).encode() + b'\r\n'
+    stream = b'Calibrating MQ-2...\r\n' + line * 3
+    extractor = SensorFrameExtractor()
+    frames = []
+    for size in (1, 7, 64):
+        frames += [f for i in range(0, len(stream), size) for f in extractor.feed(stream[i:i + size])]
+    assert frames == [line.rstrip()] * 9
+    assert extractor.stats()['buffered_bytes'] == 0
+
+    reading = parse_xbee_data(frames[0].decode())
+    assert reading['CO'] == 1.5 and reading['CO2'] == 412.0
+    assert reading['device_id'] == 'boat-1'
+    assert reading['note'] == READING['note']
+
+
+def test_oversized_frame_is_dropped_and_the_stream_resynchronises():
+    good = b'{"CO": 2.0}'
+    # a frame whose closing brace was lost, then a good frame on the next line
+    stream = b'{"CO": 1.0, "CO2": 4' + b'\r\n' + good + b'\r\n' + b'{"pad": "' + b'x' * 200
+    extractor = SensorFrameExtractor(max_frame_bytes=64)
+    assert extractor.feed(stream) == [good]
+    stats = extractor.stats()
+    assert stats['dropped_frames'] == 2
+    assert stats['buffered_bytes'] == 0
+
+
+def test_invalid_json_frame_is_skipped():
+    assert parse_xbee_data('{"CO": 1.0,,}') is None
@@ -0,0 +1,103 @@
+import json
+import os
+from datetime import datetime
+
+import pytest
+from sqlalchemy import text
+
+import ingest_queue
+
+
+def test_segment_round_trip(tmp_path):
+    writer = ingest_queue.SegmentWriter(str(tmp_path), segment_bytes=64)
+    writer.put_many([{'row': {'co': 1.5}}, {'row': {'co': 2.5}}])
+    writer.put_many([{'row': {'co': 3.5}}])
+    writer.close()
+
+    segments = ingest_queue.list_segments(str(tmp_path))
+    assert all(sealed for _, sealed in segments.values())
+    records = []
+    for path, _ in segments.values():
+        offset = 0
+        while True:
+            batch, offset, at_end = ingest_queue.read_records(path, offset, 1)
+            records += batch
+            if at_end:
+                break
+    assert [r['row']['co'] for r in records] == [1.5, 2.5, 3.5]
+
+
+def test_read_records_skips_garbage_and_stops_at_torn_tail(tmp_path):
+    path = tmp_path / '1.1.1.sealed'
+    good = json.dumps({'row': {'co': 1.0}}).encode()
+    path.write_bytes(
+        len(good).to_bytes(4, 'big') + good
+        + (3).to_bytes(4, 'big') + b'{x}'           # undecodable body
+        + len(good).to_bytes(4, 'big') + good
+        + (100).to_bytes(4, 'big') + b'{"row":'      # torn tail
+    )
+    records, end, at_end = ingest_queue.read_records(str(path), 0, 10)
+    assert records == [{'row': {'co': 1.0}}, {'row': {'co': 1.0}}]
+    assert end == 2 * (4 + len(good)) + 4 + 3
+    assert at_end
+
+
+def test_queue_mode_rejects_non_numeric_values(app_module, client, monkeypatch):
+    monkeypatch.setattr(app_module, 'INGEST_MODE', 'queue')
+    resp = client.post('/api/data', json={'CO': 'abc', 'CO2': 'x'})
+    assert resp.status_code == 400
+    resp = client.post('/api/data/batch', json=[{'CO': 'abc'}, {'CO': '2.5', 'CO2': 400}])
+    body = resp.get_json()
+    assert body['status'] == 'partial'
+    assert [r['status'] for r in body['results']] == ['error', 'success']
+    assert 'Invalid value for co' in body['results'][0]['message']
+
+
+def _queue(app, rows):
+    app._enqueue_readings(rows, datetime(2024, 1, 1, 12, 0, 0))
+    app._ingest_writer_queue.close()
+
+
+def test_writer_dead_letters_records_it_cannot_insert(app_module):
+    app = app_module
+    good = app._reading_to_row({'CO': 1.0, 'CO2': 400})
+    # a record queued by a version that did not check its values
+    bad = dict(good, co='abc')
+    _queue(app, [good, bad, dict(good, co=2.0)])
+    with app.app.app_context():
+        assert app._drain_ingest_queue_once() == 3
+        assert app._drain_ingest_queue_once() == 0
+        stored = app.db.session.execute(text('SELECT co FROM reading ORDER BY id')).scalars().all()
+        assert app.IngestOffset.query.count() == 0  # segment fully applied and removed
+    assert stored == [1.0, 2.0]
+    with open(app.INGEST_DEAD_LETTER_FILE) as f:
+        dead = [json.loads(line) for line in f]
+    assert len(dead) == 1
+    assert dead[0]['record']['row']['co'] == 'abc'
+    assert 'could not convert' in dead[0]['error']
+    os.remove(app.INGEST_DEAD_LETTER_FILE)
+
+
+def test_writer_dead_letters_undecodable_rows(app_module):
+    app = app_module
+    good = app._reading_to_row({'CO': 1.0})
+    _queue(app, [good])
+    app._ingest_writer_queue.put_many([{'row': {'timestamp': 'not a time', 'co': 1.0}}])
+    app._ingest_writer_queue.close()
+    with app.app.app_context():
+        app._drain_ingest_queue_once()
+        assert app.db.session.execute(text('SELECT COUNT(*) FROM reading')).scalar() == 1
+    with open(app.INGEST_DEAD_LETTER_FILE) as f:
+        assert len(f.readlines()) == 1
+    os.remove(app.INGEST_DEAD_LETTER_FILE)
+
+
+def test_second_writer_exits_while_the_lock_is_held(app_module, tmp_path, monkeypatch):
+    app = app_module
+    monkeypatch.setattr(app, 'INGEST_WRITER_LOCK_FILE', str(tmp_path / 'ingest_writer.lock'))
+    assert app._acquire_process_lock(app.INGEST_WRITER_LOCK_FILE)
+    try:
+        with pytest.raises(SystemExit):
+            app.run_ingest_writer()
+    finally:
+        app._process_locks.pop().close()
@@ -0,0 +1,59 @@
+from sqlalchemy import text
+
+
+def _store_pm(client, count):
+    # three readings per timestamp, so pages split groups of equal timestamps
+    readings = [{'pm2_5': float(n), 'timestamp': '2024-01-01T10:%02d:00Z' % (n // 3)} for n in range(count)]
+    assert client.post('/api/data/batch', json=readings).status_code == 200
+
+
+def _pm_pages(client, per_page, **cursor):
+    pages = []
+    while True:
+        args = dict(cursor, per_page=per_page)
+        resp = client.get('/api/data', query_string=args)
+        assert resp.status_code == 200
+        body = resp.get_json()
+        pages.append([r['pm2_5'] for r in body['general_data']])
+        cursor = body['next_cursor']
+        if cursor is None:
+            return pages
+
+
+def test_pages_walk_every_row_once_newest_first(app_module, client):
+    _store_pm(client, 25)
+    pages = _pm_pages(client, 4)
+    assert [len(p) for p in pages] == [4] * 6 + [1]
+    # (timestamp, id) order: equal timestamps are neither skipped nor repeated
+    assert sum(pages, []) == [float(n) for n in reversed(range(25))]
+
+
+def test_hand_written_and_legacy_cursors(app_module, client):
+    _store_pm(client, 9)
+    with app_module.app.app_context():
+        ids = app_module.db.session.execute(text(
+            "SELECT id FROM reading WHERE timestamp LIKE '2024-01-01 10:01:%' ORDER BY id")).scalars().all()
+    # an ISO timestamp alone: everything strictly older
+    assert _pm_pages(client, 50, before_ts='2024-01-01T10:01:00Z') == [[2.0, 1.0, 0.0]]
+    # a stored-format cursor without fractional seconds still lands exactly
+    assert _pm_pages(client, 50, before_ts='2024-01-01 10:01:00', before_id=ids[1]) == [[3.0, 2.0, 1.0, 0.0]]
+
+
+def test_invalid_cursor_is_rejected(app_module, client):
+    resp = client.get('/api/data?before_ts=yesterday')
+    assert resp.status_code == 400
+    assert "Invalid 'before_ts'" in resp.get_json()['message']
+    resp = client.get('/api/data?mq_before_ts=2024-13-45')
+    assert resp.status_code == 400
+
+
+def test_deprecated_page_parameter_still_pages(app_module, client):
+    _store_pm(client, 10)
+    resp = client.get('/api/data?page=2&per_page=4')
+    assert resp.status_code == 200 and resp.headers['Deprecation'] == 'true'
+    body = resp.get_json()
+    assert body['page'] == 2
+    assert [r['pm2_5'] for r in body['general_data']] == [5.0, 4.0, 3.0, 2.0]
+    # the cursor it hands out continues from there
+    assert _pm_pages(client, 4, **body['next_cursor']) == [[1.0, 0.0]]
+    assert 'Deprecation' not in client.get('/api/data?per_page=4').headers
@@ -0,0 +1,36 @@
+from datetime import datetime
+
+from latest_state import LatestState, count_key
+
+
+def test_offer_and_read_round_trip(tmp_path):
+    state = LatestState(str(tmp_path / 'latest.json'))
+    assert state.read() == (None, {})
+    state.set_count('mq', 10)
+    state.offer({'mq': {'co': 1, 'timestamp': datetime(2024, 1, 1, 10, 0, 1)}},
+                added={'mq': 1, count_key('mq', 'boat-1'): 1},
+                devices={'boat-1': {'mq': {'co': 1, 'timestamp': datetime(2024, 1, 1, 10, 0, 1)}}})
+    # an older row bumps the version but does not replace the newest one
+    state.offer({'mq': {'co': 2, 'timestamp': '2024-01-01T10:00:00'}})
+
+    etag, snapshot = state.read()
+    assert snapshot['mq'] == {'co': 1.0, 'timestamp': '2024-01-01T10:00:01'}
+    assert snapshot['devices']['boat-1']['mq']['co'] == 1.0
+    assert snapshot['versions'] == {'mq': 2}
+    assert snapshot['counts'] == {'mq': 11}  # per-station counts are only moved once seeded
+
+    # another process (a fresh instance) sees the same snapshot
+    assert LatestState(state.path).read() == (etag, snapshot)
+
+
+def test_corrupt_snapshot_is_replaced(tmp_path):
+    path = tmp_path / 'latest.json'
+    path.write_bytes(b'{"mq": {"co": 1')  # torn by a crash of an older version
+    state = LatestState(str(path))
+    assert state.read() == (None, {})
+
+    state.offer({'pm': {'pm2_5': 3, 'timestamp': '2024-01-01T10:00:00'}})
+    etag, snapshot = state.read()
+    assert etag is not None
+    assert snapshot['pm']['pm2_5'] == 3.0
+    assert snapshot['epoch'] and snapshot['versions'] == {'pm': 1}
@@ -0,0 +1,121 @@
+import importlib.util
+import os
+import sqlite3
+
+import payloads
+from conftest import ROOT
+
+spec = importlib.util.spec_from_file_location('migrate_db', os.path.join(ROOT, 'scripts', 'migrate_db.py'))
+migrate_db = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(migrate_db)
+
+MQ_COLUMNS = migrate_db.MQ_FIELDS + ['timestamp', 'uuid', 'sd_aqi', 'sd_aqi_level', 'raw_payload']
+
+
+def _legacy_db(path):
+    """A version 1 database: one sensor_data and one mq_sensor_data row per frame."""
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE sensor_data (id INTEGER PRIMARY KEY, dust REAL, pm2_5 REAL, pm10 REAL, "
+                 "timestamp TEXT, uuid TEXT, raw_payload TEXT);")
+    conn.execute("CREATE TABLE mq_sensor_data (id INTEGER PRIMARY KEY, %s);"
+                 % ', '.join('%s %s' % (c, 'TEXT' if c in ('timestamp', 'uuid', 'sd_aqi_level', 'raw_payload') else 'REAL')
+                             for c in MQ_COLUMNS))
+    frames = [
+        # (timestamp, pm2_5 or None for an MQ-only frame, co or None for a PM-only frame)
+        ('2024-01-01 10:00:03', None, 1.0),
+        ('2024-01-01 10:00:01', 12.0, None),
+        ('2024-01-01 10:00:02', 13.0, 2.0),
+        ('2024-01-01 10:00:00', None, 3.0),
+    ]
+    for ts, pm2_5, co in frames:
+        raw = '{"CO": %s, "ts": "%s"}' % (co, ts)
+        # legacy ingest wrote both rows for every frame: zeros / NULLs for the missing family
+        conn.execute("INSERT INTO sensor_data (dust, pm2_5, pm10, timestamp, raw_payload) VALUES (?, ?, ?, ?, ?);",
+                     (0.0, pm2_5 or 0.0, 0.0, ts, raw))
+        conn.execute("INSERT INTO mq_sensor_data (co, timestamp, raw_payload) VALUES (?, ?, ?);", (co, ts, raw))
+    conn.commit()
+    conn.close()
+
+
+def test_legacy_tables_are_merged_in_timestamp_order(tmp_path):
+    path = str(tmp_path / 'iot_data.db')
+    _legacy_db(path)
+    migrate_db.migrate(path, auto_yes=True)
+
+    conn = sqlite3.connect(path)
+    assert conn.execute("PRAGMA user_version;").fetchone()[0] == migrate_db.SCHEMA_VERSION
+    assert conn.execute("SELECT type FROM sqlite_master WHERE name = 'mq_sensor_data';").fetchone() == ('view',)
+    rows = conn.execute("SELECT id, timestamp, has_pm, has_mq, pm2_5, co FROM reading ORDER BY id;").fetchall()
+    # ids follow time and start above every legacy id (stale cursors stay below them)
+    assert [r[1] for r in rows] == sorted(r[1] for r in rows)
+    assert rows[0][0] > 4
+    # the all-zero PM placeholders are gone; every MQ row is kept, the one
+    # without a gas value included
+    assert [r[2:] for r in rows] == [
+        (0, 1, None, 3.0),
+        (0, 1, None, None),
+        (1, 0, 12.0, None),
+        (0, 1, None, 2.0),
+        (1, 0, 13.0, None),
+        (0, 1, None, 1.0),
+    ]
+    assert conn.execute("SELECT COUNT(*) FROM sensor_data;").fetchone()[0] == 2
+    assert conn.execute("SELECT COUNT(*) FROM mq_sensor_data;").fetchone()[0] == 4
+    assert conn.execute("SELECT COUNT(*) FROM reading WHERE uuid IS NULL;").fetchone()[0] == 0
+    # CURRENT_TIMESTAMP-style values are padded to the format the app binds
+    assert rows[0][1] == '2024-01-01 10:00:00.000000'
+
+    # raw payloads follow their MQ rows to the new ids
+    stored = conn.execute("SELECT r.timestamp, p.dict_id, p.payload FROM raw_payload p "
+                          "JOIN reading r ON r.id = p.reading_id ORDER BY r.id;").fetchall()
+    conn.close()
+    assert len(stored) == 4
+    for ts, dict_id, blob in stored:
+        assert ts[:19] in payloads.decompress(dict_id, blob)
+
+
+def test_interrupted_merge_resumes(tmp_path, monkeypatch):
+    path = str(tmp_path / 'iot_data.db')
+    _legacy_db(path)
+    monkeypatch.setattr(migrate_db, 'MERGE_CHUNK', 2)
+    killed = []
+
+    class Killed(Exception):
+        pass
+
+    real_connect = sqlite3.connect
+
+    class FlakyConnection(sqlite3.Connection):
+        # dies after the first merged chunk, like a worker killed at startup
+        def commit(self):
+            super().commit()
+            if self.execute("SELECT COUNT(*) FROM sqlite_master WHERE name = 'reading';").fetchone()[0] \
+                    and self.execute("SELECT COUNT(*) FROM reading;").fetchone()[0] and not killed:
+                killed.append(1)
+                raise Killed()
+
+    monkeypatch.setattr(migrate_db.sqlite3, 'connect', lambda *a, **kw: real_connect(*a, factory=FlakyConnection, **kw))
+    try:
+        migrate_db.migrate(path, auto_yes=True)
+    except Killed:
+        pass
+    monkeypatch.setattr(migrate_db.sqlite3, 'connect', real_connect)
+
+    conn = sqlite3.connect(path)
+    assert conn.execute("SELECT COUNT(*) FROM reading;").fetchone()[0] == 1  # the 10:00:00 frame
+    assert conn.execute("PRAGMA user_version;").fetchone()[0] == 0
+    conn.close()
+    bak = sqlite3.connect(path + '.bak')
+    assert bak.execute("SELECT COUNT(*) FROM mq_sensor_data;").fetchone()[0] == 4
+    bak.close()
+
+    migrate_db.migrate(path, auto_yes=True)
+    conn = sqlite3.connect(path)
+    ids = [r[0] for r in conn.execute("SELECT id FROM reading ORDER BY timestamp, id;")]
+    assert ids == sorted(ids) and len(ids) == 6
+    assert conn.execute("SELECT COUNT(*) FROM raw_payload;").fetchone()[0] == 4
+    conn.close()
+    # the backup of the untouched database was kept
+    bak = sqlite3.connect(path + '.bak')
+    assert bak.execute("SELECT COUNT(*) FROM mq_sensor_data;").fetchone()[0] == 4
+    bak.close()
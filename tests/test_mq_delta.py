@@ -0,0 +1,32 @@
+MQ = ('LPG', 'CO', 'Smoke', 'CO_MQ7', 'CH4', 'CO_MQ9', 'CO2', 'NH3', 'NOx',
+      'Alcohol', 'Benzene', 'H2', 'Air', 'Temperature', 'Humidity')
+
+
+def _post_mq(client, value, second):
+    reading = dict(dict.fromkeys(MQ, value), timestamp='2024-01-01T10:00:%02dZ' % second)
+    assert client.post('/api/data', json=reading).status_code == 200
+
+
+def _co(body):
+    return [r['CO'] for r in body['mq_data']]
+
+
+def test_after_id_returns_only_rows_the_client_has_not_seen(app_module, client):
+    for n in range(3):
+        _post_mq(client, float(n), n)
+    body = client.get('/api/mq-data').get_json()
+    assert _co(body) == [2.0, 1.0, 0.0]
+
+    _post_mq(client, 3.0, 3)
+    delta = client.get('/api/mq-data', query_string={'after_id': body['cursor']}).get_json()
+    assert _co(delta) == [3.0]
+    # nothing new: the cursor is handed back unchanged
+    idle = client.get('/api/mq-data', query_string={'after_id': delta['cursor']}).get_json()
+    assert _co(idle) == [] and idle['cursor'] == delta['cursor']
+
+
+def test_since_filters_by_timestamp(app_module, client):
+    for n in range(3):
+        _post_mq(client, float(n), n)
+    assert _co(client.get('/api/mq-data?since=2024-01-01T10:00:00Z').get_json()) == [2.0, 1.0]
+    assert client.get('/api/mq-data?since=yesterday').status_code == 400
@@ -0,0 +1,36 @@
+import json
+import zlib
+
+import pytest
+from sqlalchemy import text
+
+import payloads
+
+FRAME = {'LPG': 0.125, 'CO': 3.1, 'Smoke': 0.5, 'CO2': 412.0, 'SD_AQI': 42.11,
+         'SD_AQI_level': 'Excellent', 'device_id': 'bouée-1'}
+
+
+def test_round_trip_with_the_preset_dictionary():
+    dict_id, blob = payloads.compress(FRAME)
+    assert dict_id == payloads.CURRENT_DICT_ID
+    assert json.loads(payloads.decompress(dict_id, blob)) == FRAME
+    # the dictionary makes the keys nearly free
+    assert len(blob) < len(payloads.encode(FRAME)) / 2
+    # text and bytes are stored as given
+    assert payloads.decompress(*payloads.compress('{"CO": 1}')) == '{"CO": 1}'
+
+
+def test_corrupt_payload_raises():
+    _, blob = payloads.compress(FRAME)
+    with pytest.raises(zlib.error):
+        payloads.decompress(payloads.CURRENT_DICT_ID, b'\xff' + blob[1:])
+    with pytest.raises(KeyError):
+        payloads.decompress(99, blob)
+
+
+def test_stored_payload_is_the_posted_frame(app_module, client):
+    assert client.post('/api/data', json=FRAME).status_code == 200
+    with app_module.app.app_context():
+        dict_id, blob = app_module.db.session.execute(text(
+            'SELECT p.dict_id, p.payload FROM raw_payload p JOIN reading r ON r.id = p.reading_id')).one()
+    assert json.loads(payloads.decompress(dict_id, blob)) == FRAME
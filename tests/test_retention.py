@@ -0,0 +1,53 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+
+
+def test_expires_old_readings_payloads_and_rollups_in_chunks(app_module, client, monkeypatch):
+    app = app_module
+    monkeypatch.setattr(app, 'MAINTENANCE_CHUNK_ROWS', 2)
+    monkeypatch.setattr(app, 'MAINTENANCE_CHUNK_PAUSE', 0)
+    monkeypatch.setattr(app, 'RETENTION_ROLLUP_DAYS', {'1m': 5, '1h': 0, '1d': 0})
+    now = datetime(2024, 3, 1, 12, 0, 0)
+    cutoff = now - timedelta(days=app.RETENTION_RAW_DAYS)
+    readings = [{'CO': float(n), 'timestamp': (cutoff - timedelta(hours=n)).isoformat() + 'Z'} for n in (3, 2, 1)]
+    readings.append({'CO': 0.0, 'timestamp': cutoff.isoformat() + 'Z'})  # exactly on the cutoff: kept
+    readings.append({'CO': 9.0, 'timestamp': (now - timedelta(hours=1)).isoformat() + 'Z'})
+    assert client.post('/api/data/batch', json=readings).status_code == 200
+
+    with app.app.app_context():
+        deleted = app.run_maintenance_once(now=now)
+    assert deleted['reading'] == 3
+    assert deleted['raw_payload'] == 3
+    assert deleted['rollup_1m'] > 0
+    with app.app.app_context():
+        query = app.db.session.execute
+        assert query(text('SELECT co FROM reading ORDER BY id')).scalars().all() == [0.0, 9.0]
+        assert query(text('SELECT COUNT(*) FROM raw_payload')).scalar() == 2
+        # 1-minute rollups only of the last reading remain; hourly ones are kept forever
+        buckets = query(text("SELECT DISTINCT bucket FROM reading_rollup WHERE resolution = '1m'")).scalars().all()
+        assert buckets == [int(app.rollups.to_epoch(now - timedelta(hours=1)))]
+        assert query(text("SELECT COUNT(DISTINCT bucket) FROM reading_rollup WHERE resolution = '1h'")).scalar() == 5
+
+        # nothing left to expire
+        assert not any(app.run_maintenance_once(now=now).values())
+
+
+def test_raw_readings_are_kept_without_rollups_covering_them(app_module, client, monkeypatch):
+    app = app_module
+    monkeypatch.setattr(app, 'MAINTENANCE_CHUNK_PAUSE', 0)
+    now = datetime(2024, 3, 1, 12, 0, 0)
+    old = now - timedelta(days=app.RETENTION_RAW_DAYS + 1)
+    monkeypatch.setattr(app, 'ROLLUPS_ENABLED', False)
+    assert client.post('/api/data', json={'CO': 1.0, 'timestamp': old.isoformat() + 'Z'}).status_code == 200
+
+    with app.app.app_context():
+        assert not any(app.run_maintenance_once(now=now).values())
+        assert app.maintenance_stats['raw_skipped'] == 'rollups are disabled'
+
+        # turned back on, but the old reading was never backfilled into a rollup
+        monkeypatch.setattr(app, 'ROLLUPS_ENABLED', True)
+        assert client.post('/api/data', json={'CO': 2.0}).status_code == 200
+        assert not app.run_maintenance_once(now=now).get('reading')
+        assert 'rollups do not cover the mq readings' in app.maintenance_stats['raw_skipped']
+        assert app.db.session.execute(text('SELECT co FROM reading ORDER BY id')).scalars().all() == [1.0, 2.0]
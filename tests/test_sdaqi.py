@@ -0,0 +1,58 @@
+import math
+
+import numpy as np
+
+import sdaqi
+
+GASES = ('co', 'co_mq7', 'co_mq9', 'ch4', 'h2', 'co2', 'nox', 'air')
+
+# calculateSDAQI() and the level chain of SD-AQI-v1.ino compiled on the host:
+# (arguments in the firmware's order, SD_AQI as float32, SD_AQI_level)
+FIRMWARE_CASES = [
+    ((1.2, 3.4, 2.2, 10.0, 5.0, 80.0, 0.7, 3.5), 42.1150017, 'Excellent'),
+    ((0, 0, 0, 0, 0, 100.0, 0, 0), 50.0, 'Excellent'),
+    ((12.5, 30.0, 28.0, 150.0, 40.0, 250.0, 8.0, 20.0), 150.225006, 'Unhealthy for Sensitive Groups'),
+    ((0.3, 0.9, 1.1, 2.0, 0.4, 405.7, 0.2, 3.1), 203.460007, 'Unhealthy'),
+    ((50, 60, 70, 80, 90, 600, 10, 40), 331.0, 'Hazardous'),
+]
+
+
+def test_sd_aqi_matches_the_firmware():
+    for args, expected, level in FIRMWARE_CASES:
+        value = sdaqi.sd_aqi(dict(zip(GASES, args)))
+        # the firmware sums in float32
+        assert math.isclose(value, expected, rel_tol=1e-6)
+        assert sdaqi.sd_aqi_level(value) == level
+
+    columns = {gas: [args[i] for args, _, _ in FIRMWARE_CASES] for i, gas in enumerate(GASES)}
+    values = sdaqi.sd_aqi_array(columns)
+    assert np.allclose(values, [expected for _, expected, _ in FIRMWARE_CASES], rtol=1e-6)
+    assert list(sdaqi.sd_aqi_level_array(values)) == [level for _, _, level in FIRMWARE_CASES]
+
+
+def test_missing_and_malformed_values():
+    assert sdaqi.sd_aqi({}) is None
+    assert sdaqi.sd_aqi({'co2': None, 'co': 'n/a', 'nox': float('nan')}) is None
+    # missing gases count as zero, strings are parsed
+    assert sdaqi.sd_aqi({'co2': '100', 'co': None}) == 50.0
+    assert sdaqi.sd_aqi_level(None) is None
+    assert sdaqi.sd_aqi_level('garbage') is None
+
+    values = sdaqi.sd_aqi_array({'co2': [np.nan, 100.0], 'co': [np.nan, np.nan]})
+    assert np.isnan(values[0]) and values[1] == 50.0
+    assert list(sdaqi.sd_aqi_level_array(values)) == [None, 'Excellent']
+
+
+def test_aqi_breakpoints():
+    cases = [('pm2_5', 9.05, 50), ('pm2_5', 35.4, 100), ('pm2_5', 35.5, 101), ('pm2_5', 400.0, 500),
+             ('pm10', 54.9, 50), ('pm10', 155, 101), ('pm10', 605, 500)]
+    for pollutant, concentration, expected in cases:
+        assert sdaqi.aqi_subindex(pollutant, concentration) == expected
+        assert sdaqi.aqi_subindex_array(pollutant, [concentration])[0] == expected
+    assert sdaqi.aqi_subindex('pm2_5', -1) is None
+    assert sdaqi.aqi_subindex('pm10', 'bad') is None
+    assert np.isnan(sdaqi.aqi_subindex_array('pm10', [np.nan, -3.0])).all()
+
+    result = sdaqi.evaluate(pm={'pm2_5': 35.5, 'pm10': 20}, mq={'co2': 100.0})
+    assert (result['aqi'], result['aqi_level']) == (101, 'Unhealthy for Sensitive Groups')
+    assert (result['sd_aqi'], result['sd_aqi_level']) == (50.0, 'Excellent')
@@ -0,0 +1,69 @@
+import sensor_record
+from xbreemw import SensorFrameExtractor, parse_sensor_records
+
+# Two schema 1 records (seq 0 and 1) written by sendBinaryRecord() in
+# SD-AQI-v1.ino, built on the host with the firmware's floatToHalf and
+# crc16Ccitt, for FIRMWARE_READING with SD_AQI 57.25 and then 0.001
+FIRMWARE_RECORDS = bytes.fromhex(
+    'a55a0100003e33422c4a662e00470041705e007e00bdff7b8e060068ff7b134ef05200006542d918'
+    'a55a0101003e33422c4a662e00470041705e007e00bdff7b8e060068ff7b134ef0526f12833a589a'
+)
+FIRMWARE_READING = {
+    'LPG': 1.5, 'CO': 3.1, 'Smoke': 12.34, 'CO_MQ7': 0.1, 'CH4': 7.0, 'CO_MQ9': 2.5,
+    'CO2': 412.0, 'NH3': None, 'NOx': -1.25,
+    'Alcohol': 100000.0,   # saturates to the float16 maximum (65504, read back as 65500)
+    'Benzene': 0.0001,
+    'H2': 2049.0,          # a tie: rounds to the even 2048, not up to 2050
+    'Air': 65519.0,        # just below the rounding point to infinity
+    'Temperature': 24.3, 'Humidity': 55.5, 'SD_AQI': 57.25,
+}
+
+
+def test_firmware_records_round_trip():
+    first = FIRMWARE_RECORDS[:40]
+    assert sensor_record.record_size(1) == len(first) == 40
+    assert sensor_record.check(FIRMWARE_RECORDS) == 40
+    assert sensor_record.check(FIRMWARE_RECORDS, 40) == 40
+    assert sensor_record.encode(FIRMWARE_READING, seq=0) == first
+
+    readings = sensor_record.decode(FIRMWARE_RECORDS)
+    assert [r['seq'] for r in readings] == [0, 1]
+    assert readings[0] == dict(FIRMWARE_READING, Alcohol=65500.0, H2=2048.0, Air=65500.0, seq=0)
+    assert readings[1]['SD_AQI'] == 0.001  # the shortest decimal of the float32
+    assert sensor_record.encode(dict(readings[0], NH3=None), seq=0) == first
+
+
+def test_crc_mismatch_and_incomplete_records():
+    corrupt = bytearray(FIRMWARE_RECORDS[:40])
+    corrupt[10] ^= 0x01
+    assert sensor_record.check(corrupt) == 0
+    assert sensor_record.check(FIRMWARE_RECORDS[:39]) == -1
+    assert sensor_record.check(b'\xa5\x5a') == -1
+    assert sensor_record.check(b'\xa5\x5a\x09' + bytes(37)) == 0  # unknown schema
+
+
+def test_extractor_splits_records_from_json_and_skips_corrupt_ones():
+    corrupt = bytearray(FIRMWARE_RECORDS[:40])
+    corrupt[-1] ^= 0xFF
+    stream = b'noise' + FIRMWARE_RECORDS + b'{"CO": 1.0}\r\n' + bytes(corrupt) + FIRMWARE_RECORDS[40:]
+    extractor = SensorFrameExtractor()
+    frames = extractor.feed(stream)
+    # consecutive records come out as one frame, the corrupt one is skipped
+    assert frames == [FIRMWARE_RECORDS, b'{"CO": 1.0}', FIRMWARE_RECORDS[40:]]
+    stats = extractor.stats()
+    assert (stats['records'], stats['bad_records']) == (3, 1)
+    # the corrupt record holds a '{' byte: the bogus object it opened is dropped
+    assert stats['dropped_frames'] == 1
+
+    # byte by byte: records and objects are reassembled across reads
+    extractor = SensorFrameExtractor()
+    frames = [frame for i in range(len(stream)) for frame in extractor.feed(stream[i:i + 1])]
+    assert b''.join(frames) == FIRMWARE_RECORDS + b'{"CO": 1.0}' + FIRMWARE_RECORDS[40:]
+
+
+def test_parse_sensor_records_sets_device_id():
+    readings = parse_sensor_records(FIRMWARE_RECORDS, source_address='0013a200414f5e9c')
+    assert len(readings) == 2
+    assert all('seq' not in r for r in readings)
+    assert {r['device_id'] for r in readings} == {'0013a200414f5e9c'}
+    assert readings[0]['CO'] == 3.1
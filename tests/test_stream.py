@@ -0,0 +1,81 @@
+MQ_KEYS = ('LPG', 'CO', 'Smoke', 'CO_MQ7', 'CH4', 'CO_MQ9', 'CO2', 'NH3', 'NOx',
+           'Alcohol', 'Benzene', 'H2', 'Air', 'Temperature', 'Humidity')
+
+
+def _store(client, count, **extra):
+    # every reading is complete for both families, so it is both a pm and an mq event
+    for start in range(0, count, 500):
+        readings = [dict(extra, pm2_5=float(n), **dict.fromkeys(MQ_KEYS, float(n)))
+                    for n in range(start, min(count, start + 500))]
+        assert client.post('/api/data/batch', json=readings).status_code == 200
+
+
+def test_catch_up_pages_through_the_backlog(app_module, client, monkeypatch):
+    monkeypatch.setattr(app_module, 'STREAM_CATCH_UP_PAGE', 100)
+    _store(client, 450)
+    cursors = {'pm': 0, 'mq': 0}
+    with app_module.app.app_context():
+        pairs = list(app_module._stream_catch_up({'pm', 'mq'}, cursors))
+    assert [p[0] for p in pairs[:2]] == ['pm', 'mq']
+    pm_ids = [row['id'] for topic, row in pairs if topic == 'pm']
+    assert pm_ids == sorted(pm_ids) and len(pm_ids) == 450
+    assert cursors['pm'] == cursors['mq'] == pm_ids[-1]
+
+
+def test_catch_up_resets_clients_too_far_behind(app_module, client, monkeypatch):
+    monkeypatch.setattr(app_module, 'STREAM_CATCH_UP_PAGE', 50)
+    monkeypatch.setattr(app_module, 'STREAM_CATCH_UP_MAX_ROWS', 200)
+    _store(client, 300)
+    cursors = {'pm': 0, 'mq': 0}
+    with app_module.app.app_context():
+        newest = app_module.db.session.query(app_module.db.func.max(app_module.Reading.id)).scalar()
+        assert list(app_module._stream_catch_up({'pm'}, cursors)) == [('reset', {'last_id': '%d:0' % newest})]
+        assert cursors == {'pm': newest, 'mq': 0}
+        # caught up: nothing more to send
+        assert list(app_module._stream_catch_up({'pm'}, cursors)) == []
+
+
+def test_stream_resumes_from_last_event_id(app_module, client, monkeypatch):
+    monkeypatch.setattr(app_module, 'STREAM_CATCH_UP_PAGE', 2)
+    _store(client, 3, device_id='a')
+    _store(client, 1, device_id='b')
+    with app_module.app.app_context():
+        first = app_module.db.session.query(app_module.db.func.min(app_module.Reading.id)).scalar()
+    resp = client.get('/api/stream?topics=mq&device_id=a',
+                      headers={'Last-Event-ID': '%d:%d' % (first, first)})
+    chunks = iter(resp.response)
+    assert next(chunks).startswith(b'retry:')
+    events = [next(chunks).decode() for _ in range(2)]
+    resp.close()
+    assert [e.split('\n')[0] for e in events] == ['id: %d:%d' % (first, first + n) for n in (1, 2)]
+    assert all('event: mq' in e and '"device_id": "a"' in e for e in events)
+
+
+def test_idle_stream_does_not_query_until_the_data_version_moves(app_module, client, monkeypatch):
+    monkeypatch.setattr(app_module, 'STREAM_POLL_SECONDS', 0.01)
+    monkeypatch.setattr(app_module, 'STREAM_HEARTBEAT_SECONDS', 0.3)
+    calls = []
+    real_catch_up = app_module._stream_catch_up
+
+    def counting_catch_up(*args):
+        calls.append(1)
+        return real_catch_up(*args)
+
+    monkeypatch.setattr(app_module, '_stream_catch_up', counting_catch_up)
+    _store(client, 1)
+    resp = client.get('/api/stream?topics=mq')
+    chunks = iter(resp.response)
+    next(chunks)                                   # retry:
+    assert next(chunks) == b': keep-alive\n\n'     # ~30 idle polls later
+    assert len(calls) == 2                         # the initial catch-up and the heartbeat
+
+    # a row committed by another process (e.g. the queue writer): no broadcast,
+    # only the snapshot's data version moves
+    row = app_module._reading_to_row(dict.fromkeys(MQ_KEYS, 7.0))
+    with app_module.app.app_context():
+        app_module._insert_readings([row])
+        app_module.db.session.commit()
+    app_module._update_latest_state([row])
+    assert b'event: mq' in next(chunks)
+    assert len(calls) == 3
+    resp.close()
@@ -0,0 +1,61 @@
+from xbreemw import XBeeApiFrameParser, XBeeApiReceiver
+
+# Zigbee Receive Packet example from the XBee API documentation (AP=1):
+# source 0013A20040522BAA, 16-bit address 7D84, RF data "RxData"
+DIGI_RX_FRAME = bytes.fromhex('7e0012900013a20040522baa7d84015278446174610d')
+
+
+def _rx_frame(source64, data, escaped=True):
+    """A 0x90 receive packet from ``source64`` (8 bytes) carrying ``data``."""
+    frame = b'\x90' + source64 + b'\xff\xfe' + b'\x01' + data
+    body = len(frame).to_bytes(2, 'big') + frame + bytes([0xFF - sum(frame) & 0xFF])
+    if escaped:
+        for special in (0x7D, 0x7E, 0x11, 0x13):  # 0x7D first
+            body = body.replace(bytes([special]), bytes([0x7D, special ^ 0x20]))
+    return b'\x7e' + body
+
+
+def test_documented_frame():
+    parser = XBeeApiFrameParser(escaped=False)
+    (frame,) = parser.feed(DIGI_RX_FRAME)
+    assert frame.frame_type == 0x90
+    assert frame.source == '0013A20040522BAA'
+    assert bytes(frame.data) == b'RxData'
+
+
+def test_escaped_frames_round_trip_byte_by_byte():
+    source = bytes.fromhex('0013a200414f5e9c')
+    data = b'{"CO": 1.5}\x7e\x7d\x11\x13'
+    stream = _rx_frame(source, data) + _rx_frame(source, b'second')
+    parser = XBeeApiFrameParser(escaped=True)
+    frames = [f for i in range(len(stream)) for f in parser.feed(stream[i:i + 1])]
+    assert [bytes(f.data) for f in frames] == [data, b'second']
+    assert {f.source for f in frames} == {'0013A200414F5E9C'}
+    assert parser.stats()['buffered_bytes'] == 0
+
+
+def test_corrupt_frames_are_counted_and_skipped():
+    source = bytes.fromhex('0013a200414f5e9c')
+    bad_checksum = bytearray(_rx_frame(source, b'bad'))
+    bad_checksum[-1] ^= 0x01
+    truncated = _rx_frame(source, b'cut short')[:-4]
+    modem_status = b'\x7e\x00\x02\x8a\x06\x6f'
+    stream = b'noise' + bytes(bad_checksum) + truncated + modem_status + _rx_frame(source, b'good')
+    parser = XBeeApiFrameParser(escaped=True)
+    assert [bytes(f.data) for f in parser.feed(stream)] == [b'good']
+    stats = parser.stats()
+    assert stats['checksum_errors'] == 1
+    assert stats['dropped_frames'] == 1
+    assert stats['other_frames'] == 1
+    # the rest of the bad frame is rescanned as garbage
+    assert stats['garbage_bytes'] == len(b'noise') + len(bad_checksum) - 1
+
+
+def test_receiver_keeps_interleaved_sources_apart():
+    a, b = bytes.fromhex('0013a20000000001'), bytes.fromhex('0013a20000000002')
+    stream = (_rx_frame(a, b'{"CO": ') + _rx_frame(b, b'{"CO": 2.0')
+              + _rx_frame(a, b'1.0}\r\n') + _rx_frame(b, b'}\r\n'))
+    receiver = XBeeApiReceiver()
+    assert receiver.feed(stream) == [('0013A20000000001', b'{"CO": 1.0}'),
+                                     ('0013A20000000002', b'{"CO": 2.0}')]
+    assert receiver.stats()['sources']['0013A20000000001']['rx_frames'] == 2
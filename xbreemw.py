@@ -1,12 +1,19 @@
 import serial
 import serial.tools.list_ports
 import requests
+from requests.adapters import HTTPAdapter
 import json
 import time
 import os
 import logging
+import queue
+import struct
+import threading
+import atexit
 from datetime import datetime
-from collections import deque
+from collections import deque, namedtuple
+
+import sensor_record
 
 # List of possible serial ports
 # Try common baud rates if initial connection doesn't yield data
@@ -16,6 +23,23 @@ BAUD_CONFIG_PATH = os.path.join(os.path.dirname(__file__), 'instance', 'xbee_bau
 # Keep a small recent raw buffer for diagnostics
 recent_raw = deque(maxlen=32)
 FLASK_API_URL = "http://127.0.0.1:5000/api/data"
+FLASK_BATCH_API_URL = FLASK_API_URL + "/batch"
+# Forwarding to Flask happens on a background thread so serial reads never
+# wait on the network. Readings are queued (bounded; overflow goes to the
+# spool) and posted in micro-batches over one keep-alive session.
+SEND_QUEUE_MAXSIZE = int(os.getenv("XBEE_SEND_QUEUE_MAXSIZE", "1000"))
+SEND_BATCH_MAX = int(os.getenv("XBEE_SEND_BATCH_MAX", "50"))
+SEND_BATCH_WAIT = float(os.getenv("XBEE_SEND_BATCH_WAIT", "0.5"))  # seconds to wait for more readings
+HTTP_TIMEOUT = (3.05, 10)  # (connect, read) seconds
+# Readings Flask could not accept are appended to an on-disk spool and
+# replayed in order, in bulk and rate-limited once the API is reachable.
+SPOOL_PATH = os.path.join(os.path.dirname(__file__), 'instance', 'xbee_spool.bin')
+SPOOL_MAX_BYTES = int(os.getenv("XBEE_SPOOL_MAX_BYTES", str(50 * 1024 * 1024)))
+SPOOL_REPLAY_BATCH = int(os.getenv("XBEE_SPOOL_REPLAY_BATCH", "200"))
+SPOOL_REPLAY_INTERVAL = float(os.getenv("XBEE_SPOOL_REPLAY_INTERVAL", "1.0"))  # min seconds between replay batches
+# Station id stamped on readings that carry neither a device_id field nor a
+# source address (transparent mode has no addressing); empty leaves it unset.
+DEFAULT_DEVICE_ID = os.getenv("XBEE_DEVICE_ID", "")
 
 # module logger: quiet by default, enable verbose by setting XBEE_VERBOSE or XBEE_DEBUG
 logger = logging.getLogger(__name__)
@@ -86,7 +110,16 @@ def verify_xbee(port):
 # Serial object and internal port tracker
 ser = None
 _port = None
-_buffer = ""  # accumulate incoming serial data
+# Upper bound for a single JSON frame; larger frames are dropped and the
+# extractor resynchronises (see SensorFrameExtractor)
+MAX_FRAME_BYTES = int(os.getenv("XBEE_MAX_FRAME_BYTES", "4096"))
+# XBee serial interface mode (the module's AP setting): 0 = transparent, the
+# port carries the sensor's JSON text; 1 = API frames; 2 = API frames with
+# escaping. API mode is needed to tell several remote nodes apart.
+API_MODE = int(os.getenv("XBEE_API_MODE", "0"))
+# SensorFrameExtractor (transparent mode) or XBeeApiReceiver (API mode) for
+# incoming serial data, created by main()
+_framer = None
 
 def connect_xbee(retries=3, delay=2):
     """Attempt to find, verify and connect to an XBee device.
@@ -195,23 +228,444 @@ def connect_xbee(retries=3, delay=2):
 # connect_xbee(retries=1, delay=1)
 
 
-def send_to_flask(data):
+class ReadingSpool:
+    """Append-only on-disk spool of readings that could not be delivered.
+
+    Each record is a 4-byte big-endian length followed by the UTF-8 JSON of
+    one reading. The replay position is kept in a sidecar ``.offset`` file so
+    records are not re-sent after a restart. Once everything is replayed
+    the spool is truncated. When ``max_bytes`` would be exceeded the oldest
+    records are discarded and the file is compacted.
+
+    A replay reads a batch, POSTs it without holding the lock and commits it
+    afterwards, so appends may trim or compact the spool in between. Batches
+    therefore carry positions that survive compaction (file offset plus
+    ``_base``, the bytes compacted away so far) and the ``generation`` they
+    were read at; ``commit`` rebases a batch whose generation is stale.
+    """
+
+    HEADER = struct.Struct('>I')
+
+    def __init__(self, path, max_bytes):
+        self.path = path
+        self.offset_path = path + '.offset'
+        self.max_bytes = max_bytes
+        self.dropped = 0
+        self._lock = threading.Lock()
+        self._offset = 0
+        self._size = 0
+        self._pending = 0
+        self._base = 0
+        self._generation = 0
+        self._load()
+
+    @property
+    def pending(self):
+        return self._pending
+
+    def _load(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        try:
+            with open(self.offset_path, 'r') as fh:
+                self._offset = int(fh.read().strip() or 0)
+        except (OSError, ValueError):
+            self._offset = 0
+        if not os.path.exists(self.path):
+            self._offset = 0
+            return
+        # Count pending records and cut off a record torn by a crash mid-write
+        with open(self.path, 'rb') as fh:
+            size = os.fstat(fh.fileno()).st_size
+            if self._offset > size:
+                self._offset = 0
+            pos = self._offset
+            count = 0
+            fh.seek(pos)
+            while True:
+                header = fh.read(self.HEADER.size)
+                if len(header) < self.HEADER.size:
+                    break
+                (length,) = self.HEADER.unpack(header)
+                if pos + self.HEADER.size + length > size:
+                    break
+                fh.seek(length, os.SEEK_CUR)
+                pos += self.HEADER.size + length
+                count += 1
+        if pos < size:
+            logger.warning("Spool %s has %d trailing bytes of a partial record; truncating", self.path, size - pos)
+            with open(self.path, 'r+b') as fh:
+                fh.truncate(pos)
+        self._size = pos
+        self._pending = count
+        if count:
+            logger.info("Spool %s has %d undelivered reading(s)", self.path, count)
+
+    def _write_offset(self):
+        tmp = self.offset_path + '.tmp'
+        with open(tmp, 'w') as fh:
+            fh.write(str(self._offset))
+        os.replace(tmp, self.offset_path)
+
+    def _scan(self, fh, start, max_records):
+        """Yield (end_offset, payload_bytes) for up to max_records from start."""
+        fh.seek(start)
+        pos = start
+        for _ in range(max_records):
+            header = fh.read(self.HEADER.size)
+            if len(header) < self.HEADER.size:
+                return
+            (length,) = self.HEADER.unpack(header)
+            payload = fh.read(length)
+            if len(payload) < length:
+                return
+            pos += self.HEADER.size + length
+            yield pos, payload
+
+    def _compact(self):
+        """Rewrite the spool without the already-replayed prefix."""
+        tmp = self.path + '.tmp'
+        with open(self.path, 'rb') as src, open(tmp, 'wb') as dst:
+            src.seek(self._offset)
+            while True:
+                chunk = src.read(1024 * 1024)
+                if not chunk:
+                    break
+                dst.write(chunk)
+            dst.flush()
+            os.fsync(dst.fileno())
+        os.replace(tmp, self.path)
+        self._size -= self._offset
+        self._base += self._offset
+        self._offset = 0
+        self._generation += 1
+        self._write_offset()
+
+    def _make_room(self, needed):
+        """Discard the oldest records until ``needed`` more bytes fit.
+
+        Frees an extra 10% of ``max_bytes`` so that a full spool is not
+        compacted again on every append.
+        """
+        if self._size - self._offset + needed > self.max_bytes and self._pending:
+            target = self.max_bytes - needed - self.max_bytes // 10
+            with open(self.path, 'rb') as fh:
+                for end, _ in self._scan(fh, self._offset, self._pending):
+                    self._offset = end
+                    self._pending -= 1
+                    self.dropped += 1
+                    if self._size - self._offset <= target:
+                        break
+            self._generation += 1
+            logger.warning("Spool full; discarded oldest readings (total dropped: %d)", self.dropped)
+        if self._offset and self._size + needed > self.max_bytes:
+            self._compact()
+
+    def append_many(self, readings):
+        """Durably append readings (list of dicts) to the spool."""
+        records = []
+        for reading in readings:
+            try:
+                payload = json.dumps(reading, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+            except (TypeError, ValueError) as e:
+                logger.warning("Cannot spool reading %r: %s", reading, e)
+                continue
+            records.append(self.HEADER.pack(len(payload)) + payload)
+        if not records:
+            return
+        with self._lock:
+            needed = sum(len(r) for r in records)
+            self._make_room(needed)
+            # A single burst larger than the whole spool keeps its newest part
+            while records and self._size - self._offset + needed > self.max_bytes:
+                needed -= len(records.pop(0))
+                self.dropped += 1
+            if not records:
+                return
+            with open(self.path, 'ab') as fh:
+                fh.write(b''.join(records))
+                fh.flush()
+                os.fsync(fh.fileno())
+            self._size += needed
+            self._pending += len(records)
+
+    def read_batch(self, max_records):
+        """Return (readings, end_positions, generation) for the oldest pending records."""
+        with self._lock:
+            if not self._pending:
+                return [], [], self._generation
+            readings, ends = [], []
+            with open(self.path, 'rb') as fh:
+                for end, payload in self._scan(fh, self._offset, min(max_records, self._pending)):
+                    try:
+                        readings.append(json.loads(payload.decode('utf-8')))
+                    except ValueError:
+                        # Corrupt record: skip it but keep the cursor moving
+                        readings.append(None)
+                    ends.append(self._base + end)
+            return readings, ends, self._generation
+
+    def commit(self, end_position, count, generation):
+        """Mark ``count`` records up to ``end_position`` (from ``read_batch``) as delivered."""
+        with self._lock:
+            end_offset = end_position - self._base
+            if generation != self._generation:
+                # Trimmed or compacted since read_batch: some of these records
+                # may be gone already, so count the ones still pending.
+                if end_offset <= self._offset:
+                    return
+                count = 0
+                with open(self.path, 'rb') as fh:
+                    for end, _ in self._scan(fh, self._offset, self._pending):
+                        if end > end_offset:
+                            break
+                        count += 1
+            self._offset = end_offset
+            self._pending = max(0, self._pending - count)
+            if self._pending == 0 or self._offset >= self._size:
+                # Fully drained: reclaim the disk space
+                with open(self.path, 'wb'):
+                    pass
+                self._base += self._size
+                self._offset = 0
+                self._size = 0
+                self._pending = 0
+                self._generation += 1
+            self._write_offset()
+
+
+# Forwarder state (see send_to_flask)
+_send_queue = queue.Queue(maxsize=SEND_QUEUE_MAXSIZE)
+_sender_thread = None
+_sender_lock = threading.Lock()
+_session = None
+_spool = None
+_batch_supported = True  # flipped off if the Flask app has no batch endpoint
+forwarder_stats = {'queued': 0, 'sent': 0, 'rejected': 0, 'spooled': 0, 'replayed': 0, 'batches': 0}
+
+
+def _get_session():
+    """Return the shared keep-alive HTTP session used for all POSTs."""
+    global _session
+    if _session is None:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=2)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        _session = session
+    return _session
+
+
+def _get_spool():
+    """Open the on-disk spool on first use."""
+    global _spool
+    if _spool is None:
+        with _sender_lock:
+            if _spool is None:
+                _spool = ReadingSpool(SPOOL_PATH, SPOOL_MAX_BYTES)
+    return _spool
+
+
+def _spool_readings(readings):
+    """Persist undeliverable readings; never raises."""
     try:
-        response = requests.post(FLASK_API_URL, json=data)
+        _get_spool().append_many(readings)
+        forwarder_stats['spooled'] += len(readings)
+    except Exception as e:
+        logger.warning("Error writing %d reading(s) to spool, they are lost: %s", len(readings), e)
+
+
+def _spool_queue_on_exit():
+    """On interpreter exit, move anything still queued to the spool."""
+    pending = []
+    while True:
+        try:
+            pending.append(_send_queue.get_nowait())
+        except queue.Empty:
+            break
+    if pending:
+        _spool_readings(pending)
+
+
+def _ensure_sender():
+    """Start the background sender thread once."""
+    global _sender_thread
+    if _sender_thread is not None and _sender_thread.is_alive():
+        return
+    with _sender_lock:
+        if _sender_thread is None or not _sender_thread.is_alive():
+            if _sender_thread is None:
+                atexit.register(_spool_queue_on_exit)
+            _sender_thread = threading.Thread(target=_sender_loop, name='xbee-flask-sender', daemon=True)
+            _sender_thread.start()
+
+
+def _is_transient(status_code):
+    return status_code >= 500 or status_code in (408, 429)
+
+
+def _post_batch(batch):
+    """POST a list of readings to Flask.
+
+    Returns the readings that should be retried later (a suffix of
+    ``batch``; empty when everything was stored or permanently rejected).
+    """
+    global _batch_supported
+    session = _get_session()
+    if _batch_supported and len(batch) > 1:
+        try:
+            response = session.post(FLASK_BATCH_API_URL, json=batch, timeout=HTTP_TIMEOUT)
+        except Exception as e:
+            logger.warning("Error communicating with Flask: %s", e)
+            return batch
+        if response.status_code in (404, 405):
+            # Older Flask app without the batch endpoint: fall back to single POSTs
+            logger.info("Batch endpoint unavailable (%s); falling back to single posts", response.status_code)
+            _batch_supported = False
+        elif response.status_code == 200:
+            logger.debug("Batch of %d readings sent to Flask", len(batch))
+            forwarder_stats['sent'] += len(batch)
+            return []
+        elif _is_transient(response.status_code):
+            logger.warning("Error sending batch to Flask: %s %s", response.status_code, response.text)
+            return batch
+        else:
+            logger.warning("Flask rejected batch of %d: %s %s", len(batch), response.status_code, response.text)
+            forwarder_stats['rejected'] += len(batch)
+            return []
+
+    for i, data in enumerate(batch):
+        try:
+            response = session.post(FLASK_API_URL, json=data, timeout=HTTP_TIMEOUT)
+        except Exception as e:
+            logger.warning("Error communicating with Flask: %s", e)
+            return batch[i:]
         if response.status_code == 200:
             logger.debug("Data successfully sent to Flask: %s", data)
-        else:
+            forwarder_stats['sent'] += 1
+        elif _is_transient(response.status_code):
             logger.warning("Error sending data to Flask: %s %s", response.status_code, response.text)
-    except Exception as e:
-        logger.warning("Error communicating with Flask: %s", e)
-    finally:
+            return batch[i:]
+        else:
+            logger.warning("Flask rejected reading: %s %s", response.status_code, response.text)
+            forwarder_stats['rejected'] += 1
+    return []
+
+
+def _replay_spool_once(spool):
+    """Replay one bulk batch of spooled readings in order."""
+    readings, ends, generation = spool.read_batch(SPOOL_REPLAY_BATCH)
+    if not readings:
+        return
+    # Corrupt records decode to None; they are skipped but still committed
+    valid_idx = [i for i, r in enumerate(readings) if isinstance(r, dict)]
+    retry = _post_batch([readings[i] for i in valid_idx]) if valid_idx else []
+    if retry:
+        # _post_batch retries a suffix; everything before it is done
+        delivered = valid_idx[len(valid_idx) - len(retry)]
+    else:
+        delivered = len(readings)
+    if delivered:
+        spool.commit(ends[delivered - 1], delivered, generation)
+        forwarder_stats['replayed'] += delivered
+        logger.info("Replayed %d spooled reading(s); %d pending", delivered, spool.pending)
+
+
+def _sender_loop():
+    """Drain the send queue into micro-batches and POST them to Flask.
+
+    Undeliverable batches go to the spool. Between live batches, spooled
+    readings are replayed at most once per SPOOL_REPLAY_INTERVAL.
+    """
+    last_replay = 0.0
+    while True:
         try:
-            logger.info("Posted data to Flask endpoint; payload keys: %s", list(data.keys()) if isinstance(data, dict) else str(type(data)))
-        except Exception:
-            logger.info("Posted data to Flask endpoint; payload type: %s", type(data))
+            try:
+                batch = [_send_queue.get(timeout=SPOOL_REPLAY_INTERVAL)]
+            except queue.Empty:
+                batch = []
+            if batch:
+                deadline = time.monotonic() + SEND_BATCH_WAIT
+                while len(batch) < SEND_BATCH_MAX:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        batch.append(_send_queue.get(timeout=remaining))
+                    except queue.Empty:
+                        break
+
+                forwarder_stats['batches'] += 1
+                retry = _post_batch(batch)
+                if retry:
+                    _spool_readings(retry)
+                    # The API is unreachable; do not hammer it with a replay too
+                    last_replay = time.monotonic()
+                else:
+                    logger.info("Posted %d reading(s) to Flask endpoint", len(batch))
+
+            spool = _get_spool()
+            if spool.pending and time.monotonic() - last_replay >= SPOOL_REPLAY_INTERVAL:
+                last_replay = time.monotonic()
+                _replay_spool_once(spool)
+        except Exception as e:
+            logger.warning("XBee sender loop error: %s", e)
+            time.sleep(1.0)
 
 
-def parse_xbee_data(raw_data):
+def send_to_flask(data):
+    """Queue a reading for delivery to the Flask API without blocking.
+
+    The background sender thread posts queued readings in micro-batches.
+    Readings get a receive timestamp here so queueing or spooling delays do
+    not shift them in time. If the queue is full (Flask slow or down) the
+    reading is written to the on-disk spool instead.
+    """
+    if isinstance(data, dict) and 'timestamp' not in data:
+        data['timestamp'] = datetime.utcnow().isoformat()
+    _ensure_sender()
+    try:
+        _send_queue.put_nowait(data)
+        forwarder_stats['queued'] += 1
+    except queue.Full:
+        logger.warning("Flask send queue full; spooling reading to disk")
+        _spool_readings([data])
+    try:
+        logger.debug("Queued data for Flask endpoint; payload keys: %s", list(data.keys()) if isinstance(data, dict) else str(type(data)))
+    except Exception:
+        logger.debug("Queued data for Flask endpoint; payload type: %s", type(data))
+
+
+def _set_device_id(reading, source_address):
+    if reading.get('device_id') in (None, ''):
+        reading['device_id'] = source_address or DEFAULT_DEVICE_ID or None
+    if reading['device_id'] is None:
+        del reading['device_id']
+    else:
+        reading['device_id'] = str(reading['device_id'])
+
+
+def parse_sensor_records(frame, source_address=None):
+    """Decode a run of binary sensor records into reading dicts for /api/data.
+
+    Field names match the normalized JSON readings; the receive time becomes
+    the timestamp (the record carries none) and ``device_id`` is set as in
+    parse_xbee_data.
+    """
+    readings = sensor_record.decode(frame)
+    for reading in readings:
+        reading.pop('seq', None)
+        _set_device_id(reading, source_address)
+    logger.debug("Decoded %d binary sensor records", len(readings))
+    return readings
+
+
+def parse_xbee_data(raw_data, source_address=None):
+    """Decode one JSON frame into the reading dict posted to /api/data.
+
+    The reading's ``device_id`` is the one the device sent, else the XBee
+    ``source_address`` the frame arrived from (API mode), else
+    DEFAULT_DEVICE_ID.
+    """
     try:
         # Assuming the XBee sends data in JSON format
         data = json.loads(raw_data)
@@ -223,7 +677,8 @@ def parse_xbee_data(raw_data):
             'lpg': 'LPG', 'co': 'CO', 'smoke': 'Smoke', 'co_mq7': 'CO_MQ7', 'ch4': 'CH4', 'co_mq9': 'CO_MQ9',
             'co2': 'CO2', 'nh3': 'NH3', 'nox': 'NOx', 'alcohol': 'Alcohol', 'benzene': 'Benzene',
             'h2': 'H2', 'air': 'Air', 'temperature': 'Temperature', 'humidity': 'Humidity',
-            'sd_aqi': 'SD_AQI', 'sd_aqi_level': 'SD_AQI_level', 'timestamp_ms': 'timestamp_ms'
+            'sd_aqi': 'SD_AQI', 'sd_aqi_level': 'SD_AQI_level', 'timestamp_ms': 'timestamp_ms',
+            'device_id': 'device_id', 'deviceid': 'device_id'
         }
 
         normalized = {}
@@ -256,6 +711,8 @@ def parse_xbee_data(raw_data):
             except Exception:
                 pass
 
+        _set_device_id(normalized, source_address)
+
         logger.debug("Normalized data to send to Flask: %s", normalized)
         return normalized
     except json.JSONDecodeError:
@@ -263,44 +720,365 @@ def parse_xbee_data(raw_data):
         return None
 
 
-def _extract_json_from_buffer(buf):
-    """Extract the first complete JSON object from buf if present.
-    Returns (json_str, remaining_buf) where json_str is None if no complete
-    JSON object was found.
+class SensorFrameExtractor:
+    """Incremental extractor of JSON objects and binary sensor records from a serial byte stream.
+
+    Brace depth and string/escape state are kept between ``feed()`` calls, so
+    each byte is scanned once no matter how a frame is split across chunks.
+    Bytes outside any object are discarded (counted in ``garbage_bytes``).
+    A frame that grows past ``max_frame_bytes`` (e.g. a lost closing brace)
+    is dropped (counted in ``dropped_bytes``/``dropped_frames``) and the
+    extractor resynchronises on the first ``{`` that started a line inside
+    it, or else on the next ``{`` in the stream.
+
+    Outside an object, a binary record (see sensor_record.py) is recognised
+    by its magic and checked against its CRC (failures are counted in
+    ``bad_records``); consecutive records of one schema are returned as a
+    single frame so they can be decoded in one go. Gaps in their sequence
+    numbers are counted in ``lost_records``. A valid record also ends an
+    object in progress (dropped as above): JSON text never contains one, but
+    the bytes of a corrupt record may contain a ``{``.
     """
-    # find first opening brace
-    start = buf.find('{')
-    if start == -1:
-        # no JSON start yet, discard any leading garbage
-        return None, buf
-
-    depth = 0
-    in_string = False
-    escape = False
-    for i in range(start, len(buf)):
-        ch = buf[i]
-        if in_string:
-            if escape:
-                escape = False
-            elif ch == '\\':
-                escape = True
-            elif ch == '"':
-                in_string = False
-            # otherwise remain in string
-            continue
+
+    _OPEN, _CLOSE, _QUOTE, _BACKSLASH = ord('{'), ord('}'), ord('"'), ord('\\')
+    _NEWLINES = (ord('\n'), ord('\r'))
+
+    def __init__(self, max_frame_bytes=4096):
+        self.max_frame_bytes = max_frame_bytes
+        self._buf = bytearray()
+        self._pos = 0
+        self._reset_frame()
+        self.frames = 0
+        self.garbage_bytes = 0
+        self.dropped_bytes = 0
+        self.dropped_frames = 0
+        self.records = 0
+        self.bad_records = 0
+        self.lost_records = 0
+        self._last_seq = None
+
+    def _reset_frame(self):
+        self._start = -1          # index of the current frame's opening brace
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._resync_at = -1      # first '{' after a newline inside the frame
+
+    def stats(self):
+        return {
+            'frames': self.frames,
+            'garbage_bytes': self.garbage_bytes,
+            'dropped_bytes': self.dropped_bytes,
+            'dropped_frames': self.dropped_frames,
+            'records': self.records,
+            'bad_records': self.bad_records,
+            'lost_records': self.lost_records,
+            'buffered_bytes': len(self._buf),
+        }
+
+    @staticmethod
+    def _next_magic(buf, i, n):
+        """Where the next record magic (or a trailing first magic byte) is at or after ``i``; ``n`` if none."""
+        k = buf.find(sensor_record.MAGIC, i)
+        if k < 0:
+            k = n - 1 if n > i and buf[n - 1] == sensor_record.MAGIC[0] else n
+        return k
+
+    def _record_run(self, buf, start, size):
+        """End of the run of valid same-schema records starting with the one at ``start``."""
+        end = start
+        schema_id = buf[start + 2]
+        while True:
+            seq = buf[end + 3]
+            if self._last_seq is not None:
+                self.lost_records += (seq - self._last_seq - 1) % 256
+            self._last_seq = seq
+            self.records += 1
+            end += size
+            if (buf[end:end + 2] != sensor_record.MAGIC or len(buf) - end < 3 or buf[end + 2] != schema_id
+                    or sensor_record.check(buf, end) != size):
+                return end
+
+    def feed(self, data):
+        """Add bytes from the serial port; return a list of complete frames (bytes).
+
+        A frame is either one JSON object or a run of binary records (it then
+        starts with sensor_record.MAGIC).
+        """
+        buf = self._buf
+        buf += data
+        frames = []
+        n = len(buf)
+        i = self._pos
+        magic_at = self._next_magic(buf, i, n) if self._start >= 0 else -1
+        while i < n:
+            if self._start < 0:
+                j = buf.find(b'{', i)
+                k = buf.find(sensor_record.MAGIC, i, n if j == -1 else j + 1)
+                if k != -1:
+                    self.garbage_bytes += k - i
+                    size = sensor_record.check(buf, k)
+                    if size < 0:
+                        # record still arriving
+                        i = k
+                        break
+                    if size == 0:
+                        self.bad_records += 1
+                        self.garbage_bytes += 1
+                        i = k + 1
+                        continue
+                    i = self._record_run(buf, k, size)
+                    frames.append(bytes(buf[k:i]))
+                    continue
+                if j == -1:
+                    # keep a trailing first magic byte, the record may start there
+                    keep = 1 if buf[n - 1:] == sensor_record.MAGIC[:1] else 0
+                    self.garbage_bytes += n - i - keep
+                    i = n - keep
+                    break
+                self.garbage_bytes += j - i
+                self._start = j
+                self._depth = 1
+                i = j + 1
+                magic_at = self._next_magic(buf, i, n)
+                continue
+
+            if i == magic_at:
+                # a '{' or '"' byte inside a corrupt record opens a bogus
+                # object; a valid record ends it instead of being swallowed
+                size = sensor_record.check(buf, i) if i + 1 < n else -1
+                if size < 0:
+                    break  # rescanned from here once more bytes arrive
+                if size > 0:
+                    self.dropped_frames += 1
+                    self.dropped_bytes += i - self._start
+                    self._reset_frame()
+                    continue
+                magic_at = self._next_magic(buf, i + 1, n)
+
+            ch = buf[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == self._BACKSLASH:
+                    self._escape = True
+                elif ch == self._QUOTE:
+                    self._in_string = False
+            elif ch == self._QUOTE:
+                self._in_string = True
+            elif ch == self._OPEN:
+                self._depth += 1
+                if self._resync_at < 0 and i > 0 and buf[i - 1] in self._NEWLINES:
+                    self._resync_at = i
+            elif ch == self._CLOSE:
+                self._depth -= 1
+                if self._depth == 0:
+                    frames.append(bytes(buf[self._start:i + 1]))
+                    self.frames += 1
+                    self._reset_frame()
+            i += 1
+
+            if self._start >= 0 and i - self._start > self.max_frame_bytes:
+                self.dropped_frames += 1
+                resync = self._resync_at
+                if resync > self._start:
+                    # Rescan from the newer frame start that was swallowed
+                    self.dropped_bytes += resync - self._start
+                    i = resync
+                    magic_at = self._next_magic(buf, i, n)
+                else:
+                    self.dropped_bytes += i - self._start
+                logger.debug("Dropping oversized serial frame (> %d bytes); resynchronising", self.max_frame_bytes)
+                self._reset_frame()
+
+        # Discard consumed bytes, keeping only a partial frame (bounded by max_frame_bytes)
+        if self._start < 0:
+            del buf[:i]
+            self._pos = 0
         else:
-            if ch == '"':
-                in_string = True
+            if self._start:
+                del buf[:self._start]
+                if self._resync_at >= 0:
+                    self._resync_at -= self._start
+                i -= self._start
+                self._start = 0
+            self._pos = i
+        return frames
+
+
+# Receive frame types -> (offset of the 64-bit source address, of the 16-bit
+# source address, of the RSSI byte, of the RF data) within the frame data;
+# None where the frame has no such field
+API_RX_FRAMES = {
+    0x90: (1, 9, None, 12),     # Zigbee Receive Packet
+    0x91: (1, 9, None, 18),     # Zigbee Explicit Rx Indicator
+    0x80: (1, None, 9, 11),     # 802.15.4 Rx Packet, 64-bit address
+    0x81: (None, 1, 3, 5),      # 802.15.4 Rx Packet, 16-bit address
+}
+# 64-bit source address reported when the sender's is not known
+_UNKNOWN_ADDRESS64 = b'\x00\x00\x00\x00\x00\x00\xff\xff'
+
+# One RF receive packet: source address (hex), RSSI in dBm (None when the
+# frame type has none) and the RF data as a memoryview
+ApiFrame = namedtuple('ApiFrame', 'frame_type source rssi data')
+
+
+def _unescape(data):
+    """Undo API mode 2 escaping; returns (bytes, complete) where ``complete``
+    is False when ``data`` ends inside an escape sequence."""
+    parts = data.split(b'\x7d')
+    out = bytearray(parts[0])
+    for part in parts[1:]:
+        if not part:
+            return bytes(out), False
+        out.append(part[0] ^ 0x20)
+        out += part[1:]
+    return bytes(out), True
+
+
+class XBeeApiFrameParser:
+    """Incremental parser of XBee API frames (AP=1, or AP=2 with escaping).
+
+    A frame is 0x7E, a 16-bit length, the frame data and a checksum byte
+    that makes the frame data sum to 0xFF. With escaping, 0x7E/0x7D/0x11/0x13
+    inside a frame are sent as 0x7D and the byte XOR 0x20, so an unescaped
+    0x7E always starts a frame and a truncated frame ends at the next one.
+    Frames are memoryview slices of the received bytes; only frames that
+    contained escapes are copied (to unescape them). Frames with a bad
+    checksum are dropped (``checksum_errors``), frames other than RF receive
+    packets (AT responses, modem status...) are skipped (``other_frames``).
+    """
+
+    START = 0x7E
+
+    def __init__(self, escaped=True, max_frame_bytes=4096):
+        self.escaped = escaped
+        self.max_frame_bytes = max_frame_bytes
+        self._tail = b''
+        self.frames = 0
+        self.other_frames = 0
+        self.checksum_errors = 0
+        self.garbage_bytes = 0
+        self.dropped_bytes = 0
+        self.dropped_frames = 0
+
+    def stats(self):
+        return {
+            'frames': self.frames,
+            'other_frames': self.other_frames,
+            'checksum_errors': self.checksum_errors,
+            'garbage_bytes': self.garbage_bytes,
+            'dropped_bytes': self.dropped_bytes,
+            'dropped_frames': self.dropped_frames,
+            'buffered_bytes': len(self._tail),
+        }
+
+    def feed(self, data):
+        """Add bytes from the serial port; return a list of complete ApiFrames."""
+        # one immutable buffer per call, so the returned views stay valid
+        buf = self._tail + bytes(data) if self._tail else bytes(data)
+        view = memoryview(buf)
+        frames = []
+        n = len(buf)
+        i = 0
+        self._tail = b''
+        while i < n:
+            start = buf.find(b'\x7e', i)
+            if start < 0:
+                self.garbage_bytes += n - i
+                break
+            self.garbage_bytes += start - i
+            # with escaping a frame ends at the next delimiter at the latest
+            end = buf.find(b'\x7e', start + 1) if self.escaped else -1
+            limit = n if end < 0 else end
+            escapes = self.escaped and buf.find(b'\x7d', start + 1, limit) >= 0
+            if escapes:
+                body, complete = _unescape(buf[start + 1:limit])
+                body = memoryview(body)
+            else:
+                body, complete = view[start + 1:limit], True
+            length = (body[0] << 8 | body[1]) if len(body) >= 2 else None
+            if length is not None and (length == 0 or length > self.max_frame_bytes):
+                # not a real frame start (noise or a lost escape)
+                self.dropped_frames += 1
+                self.dropped_bytes += 1
+                i = start + 1
                 continue
-            if ch == '{':
-                depth += 1
-            elif ch == '}':
-                depth -= 1
-                if depth == 0:
-                    # found a complete JSON object from start..i
-                    return buf[start:i+1], buf[i+1:]
-    # no complete object yet
-    return None, buf
+            need = 2 + length + 1 if length is not None else None
+            if need is None or len(body) < need or not complete:
+                if end >= 0:
+                    # cut short by the next frame
+                    self.dropped_frames += 1
+                    self.dropped_bytes += end - start
+                    i = end
+                    continue
+                # still arriving
+                self._tail = buf[start:]
+                break
+            frame = body[2:2 + length]
+            if (sum(frame) + body[2 + length]) & 0xFF != 0xFF:
+                self.checksum_errors += 1
+                logger.debug("Dropping XBee API frame with a bad checksum")
+                i = start + 1
+                continue
+            # an unescaped frame's raw end is known; an escaped one ends before
+            # the next delimiter
+            i = limit if escapes else start + 1 + need
+            decoded = self._decode(frame)
+            if decoded is not None:
+                frames.append(decoded)
+        return frames
+
+    def _decode(self, frame):
+        layout = API_RX_FRAMES.get(frame[0])
+        if layout is None or len(frame) < layout[3]:
+            self.other_frames += 1
+            return None
+        self.frames += 1
+        at64, at16, at_rssi, at_data = layout
+        if at64 is not None and frame[at64:at64 + 8] != _UNKNOWN_ADDRESS64:
+            source = frame[at64:at64 + 8].hex().upper()
+        else:
+            source = frame[at16:at16 + 2].hex().upper()
+        rssi = -frame[at_rssi] if at_rssi is not None else None
+        return ApiFrame(frame[0], source, rssi, frame[at_data:])
+
+
+class XBeeApiReceiver:
+    """API-mode receiver: parses frames and routes their RF data by source.
+
+    A remote node in transparent mode packetizes its serial output, so one
+    JSON reading can arrive split across several receive frames; each source
+    address gets its own SensorFrameExtractor so frames interleaved from
+    different nodes never mix. ``feed()`` returns ``(source, frame)``.
+    """
+
+    def __init__(self, escaped=True, max_frame_bytes=4096):
+        self.parser = XBeeApiFrameParser(escaped, max_frame_bytes)
+        self.max_frame_bytes = max_frame_bytes
+        self._streams = {}  # source address -> SensorFrameExtractor
+        self.sources = {}   # source address -> {'rx_frames', 'rssi', 'last_seen'}
+
+    def stats(self):
+        stats = self.parser.stats()
+        stats['sources'] = {source: dict(info, stream=self._streams[source].stats())
+                            for source, info in self.sources.items()}
+        return stats
+
+    def feed(self, data):
+        out = []
+        for frame in self.parser.feed(data):
+            stream = self._streams.get(frame.source)
+            if stream is None:
+                stream = self._streams[frame.source] = SensorFrameExtractor(self.max_frame_bytes)
+                self.sources[frame.source] = {'rx_frames': 0, 'rssi': None, 'last_seen': None}
+            info = self.sources[frame.source]
+            info['rx_frames'] += 1
+            info['last_seen'] = time.time()
+            if frame.rssi is not None:
+                info['rssi'] = frame.rssi
+            out.extend((frame.source, sensor_frame) for sensor_frame in stream.feed(frame.data))
+        return out
 
 
 def auto_baud_probe(port, bauds=None, timeout_per_baud=0.4):
@@ -340,8 +1118,13 @@ def auto_baud_probe(port, bauds=None, timeout_per_baud=0.4):
 
 
 def main():
-    # modify module-level `ser` and `_buffer`
-    global ser, _buffer
+    # modify module-level `ser` and `_framer`
+    global ser, _framer
+    if _framer is None:
+        if API_MODE:
+            _framer = XBeeApiReceiver(escaped=API_MODE == 2, max_frame_bytes=MAX_FRAME_BYTES)
+        else:
+            _framer = SensorFrameExtractor(MAX_FRAME_BYTES)
 
     while True:
         try:
@@ -383,8 +1166,6 @@ def main():
                         time.sleep(1.0)
                         continue
 
-                    # decode and append
-                    chunk = chunk_bytes.decode('utf-8', errors='replace')
                 except serial.SerialException as e:
                     logger.warning("SerialException reading serial chunk: %s", e)
                     try:
@@ -405,22 +1186,27 @@ def main():
                     continue
                 except Exception as e:
                     logger.warning("Error reading serial chunk: %s", e)
-                    chunk = ''
+                    chunk_bytes = b''
 
-                _buffer += chunk
                 # record raw chunk for diagnostics
                 try:
-                    recent_raw.appendleft(chunk)
+                    recent_raw.appendleft(chunk_bytes.decode('utf-8', errors='replace'))
                 except Exception:
                     pass
 
-                # Try extracting any complete JSON objects from the buffer
-                while True:
-                    json_str, _buffer = _extract_json_from_buffer(_buffer)
-                    if json_str is None:
-                        break
-                    json_str = json_str.strip()
-                    parsed_data = parse_xbee_data(json_str)
+                # Extract any complete JSON objects and binary records; partial
+                # frames stay in the framer
+                if API_MODE:
+                    frames = _framer.feed(chunk_bytes)
+                else:
+                    frames = [(None, frame) for frame in _framer.feed(chunk_bytes)]
+                for source, frame in frames:
+                    if frame[:2] == sensor_record.MAGIC:
+                        for reading in parse_sensor_records(frame, source_address=source):
+                            send_to_flask(reading)
+                        continue
+                    json_str = frame.decode('utf-8', errors='replace')
+                    parsed_data = parse_xbee_data(json_str, source_address=source)
                     if parsed_data:
                         send_to_flask(parsed_data)
             else: